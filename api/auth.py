@@ -1,17 +1,29 @@
 """
 Module d'authentification pour l'API de recommandation de films.
+
+L'utilisateur d'une session est gardé en mémoire (SessionCache, clé = hash
+du token) pendant SESSION_CACHE_TTL secondes : les requêtes authentifiées
+n'interrogent plus users/user_sessions à chaque appel. La déconnexion, le
+blocage et la suppression d'un utilisateur invalident ses entrées ; avec
+plusieurs processus, les autres processus le voient au plus tard après le TTL.
 """
+import os
 import secrets
 import hashlib
+import threading
 from datetime import datetime, timedelta
 from typing import Optional, Dict
-from fastapi import HTTPException, Request
-import psycopg2
-from config.database import get_connection_dict
+from fastapi import Depends, HTTPException, Request
+from api.cache import TTLCache
+from config.async_database import async_connection
 
 # Durée de vie des sessions (30 jours)
 SESSION_DURATION_DAYS = 30
 
+# Cache des sessions (0 = désactivé)
+SESSION_CACHE_TTL = float(os.getenv("SESSION_CACHE_TTL", "60"))
+SESSION_CACHE_SIZE = int(os.getenv("SESSION_CACHE_SIZE", "10000"))
+
 
 def hash_password(password: str) -> str:
     """Hash un mot de passe avec SHA-256 et un salt."""
@@ -45,91 +57,147 @@ def get_avatar_url(gender: Optional[str] = None) -> str:
         return "https://api.dicebear.com/7.x/avataaars/svg?seed=default&backgroundColor=b6e3f4,c0aede,d1d4f9"
 
 
+def hash_session_token(session_token: str) -> str:
+    """Clé de cache d'un token (le token lui-même n'est pas gardé en mémoire)."""
+    return hashlib.sha256(session_token.encode()).hexdigest()
+
+
+class SessionCache:
+    """
+    Utilisateurs des sessions actives, par hash de token.
+
+    `version` est incrémentée à chaque invalidation : une lecture en base
+    commencée avant une invalidation n'est pas mise en cache (sinon un
+    utilisateur bloqué pendant la requête resterait en cache jusqu'au TTL).
+    """
+
+    def __init__(self, max_size: int = SESSION_CACHE_SIZE, ttl_seconds: float = SESSION_CACHE_TTL):
+        self.enabled = ttl_seconds > 0
+        self.entries = TTLCache(max_size, ttl_seconds)
+        self.version = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+
+    def get(self, session_token: str) -> Optional[Dict]:
+        if not self.enabled:
+            return None
+        return self.entries.get(hash_session_token(session_token))
+
+    def set(self, session_token: str, user: Dict, version: int):
+        """Met en cache l'utilisateur lu en base, si rien n'a été invalidé depuis `version`."""
+        if not self.enabled:
+            return
+        key = hash_session_token(session_token)
+        with self._lock:
+            if version != self.version:
+                return
+            self.entries.set(key, user)
+
+    def invalidate(self, session_token: str):
+        """Oublie une session (déconnexion)."""
+        with self._lock:
+            self.version += 1
+            self.invalidations += 1
+            self.entries.delete(hash_session_token(session_token))
+
+    def invalidate_user(self, user_id: int):
+        """
+        Oublie toutes les sessions d'un utilisateur (blocage, suppression).
+
+        Parcourt le cache (borné à SESSION_CACHE_SIZE entrées) plutôt que de
+        tenir un index par utilisateur qui survivrait aux expirations et évictions.
+        """
+        with self._lock:
+            self.version += 1
+            self.invalidations += 1
+            self.entries.delete_where(lambda user: user["id"] == user_id)
+
+    def stats(self) -> Dict:
+        return {**self.entries.stats(), "enabled": self.enabled, "invalidations": self.invalidations}
+
+
+# Cache partagé par l'API
+session_cache = SessionCache()
+
+
 async def get_current_user(request: Request) -> Optional[Dict]:
-    """Récupère l'utilisateur actuel depuis la session."""
+    """
+    Récupère l'utilisateur actuel depuis la session (None si non connecté).
+
+    À utiliser comme dépendance FastAPI (Depends(get_current_user)) : le
+    résultat est alors partagé par toutes les dépendances de la requête.
+    """
     session_token = request.cookies.get("session_token")
     if not session_token:
         return None
     
-    conn = None
+    user = session_cache.get(session_token)
+    if user is not None:
+        return dict(user)
+    
+    version = session_cache.version
     try:
-        conn, cur = get_connection_dict()
-        
-        cur.execute("""
-            SELECT u.id, u.username, u.email, u.role, u.gender, u.avatar_url, 
-                   u.is_active, u.is_blocked, u.restrictions
-            FROM users u
-            JOIN user_sessions s ON s.user_id = u.id
-            WHERE s.session_token = %s 
-              AND s.is_active = TRUE 
-              AND s.expires_at > NOW()
-              AND u.is_active = TRUE
-              AND u.is_blocked = FALSE
-        """, (session_token,))
-        
-        user = cur.fetchone()
-        if user:
-            return dict(user)
-        return None
+        async with async_connection() as conn:
+            user = await conn.fetchrow("""
+                SELECT u.id, u.username, u.email, u.role, u.gender, u.avatar_url, 
+                       u.is_active, u.is_blocked, u.restrictions
+                FROM users u
+                JOIN user_sessions s ON s.user_id = u.id
+                WHERE s.session_token = $1 
+                  AND s.is_active = TRUE 
+                  AND s.expires_at > NOW()
+                  AND u.is_active = TRUE
+                  AND u.is_blocked = FALSE
+            """, session_token)
+            
+            if user:
+                user = dict(user)
+                session_cache.set(session_token, user, version)
+                return dict(user)
+            return None
     except Exception as e:
         return None
-    finally:
-        if conn:
-            conn.close()
 
 
-async def require_auth(request: Request) -> Dict:
-    """Exige que l'utilisateur soit authentifié."""
-    user = await get_current_user(request)
+async def require_auth(user: Optional[Dict] = Depends(get_current_user)) -> Dict:
+    """Dépendance : exige que l'utilisateur soit authentifié."""
     if not user:
         raise HTTPException(status_code=401, detail="Authentification requise")
     return user
 
 
-async def require_admin(request: Request) -> Dict:
-    """Exige que l'utilisateur soit admin."""
-    user = await require_auth(request)
+async def require_admin(user: Dict = Depends(require_auth)) -> Dict:
+    """Dépendance : exige que l'utilisateur soit admin."""
     if user.get("role") != "admin":
         raise HTTPException(status_code=403, detail="Accès admin requis")
     return user
 
 
-def create_session(user_id: int, ip_address: Optional[str] = None, user_agent: Optional[str] = None) -> str:
+async def create_session(user_id: int, ip_address: Optional[str] = None, user_agent: Optional[str] = None) -> str:
     """Crée une nouvelle session pour un utilisateur."""
-    conn = None
     try:
-        conn, cur = get_connection_dict()
-        
-        session_token = generate_session_token()
-        expires_at = datetime.utcnow() + timedelta(days=SESSION_DURATION_DAYS)
-        
-        cur.execute("""
-            INSERT INTO user_sessions (user_id, session_token, ip_address, user_agent, expires_at)
-            VALUES (%s, %s, %s, %s, %s)
-        """, (user_id, session_token, ip_address, user_agent, expires_at))
-        
-        conn.commit()
-        return session_token
+        async with async_connection() as conn:
+            session_token = generate_session_token()
+            expires_at = datetime.utcnow() + timedelta(days=SESSION_DURATION_DAYS)
+            
+            await conn.execute("""
+                INSERT INTO user_sessions (user_id, session_token, ip_address, user_agent, expires_at)
+                VALUES ($1, $2, $3, $4, $5)
+            """, user_id, session_token, ip_address, user_agent, expires_at)
+            
+            return session_token
     except Exception as e:
-        if conn:
-            conn.rollback()
         raise HTTPException(status_code=500, detail=f"Erreur lors de la création de la session: {str(e)}")
-    finally:
-        if conn:
-            conn.close()
 
 
-def delete_session(session_token: str):
+async def delete_session(session_token: str):
     """Supprime une session."""
-    conn = None
     try:
-        conn, cur = get_connection_dict()
-        cur.execute("UPDATE user_sessions SET is_active = FALSE WHERE session_token = %s", (session_token,))
-        conn.commit()
+        async with async_connection() as conn:
+            await conn.execute("UPDATE user_sessions SET is_active = FALSE WHERE session_token = $1", session_token)
     except Exception as e:
-        if conn:
-            conn.rollback()
+        pass
     finally:
-        if conn:
-            conn.close()
+        # Après la mise à jour : une lecture concurrente ne peut pas remettre la session en cache
+        session_cache.invalidate(session_token)
 
@@ -0,0 +1,197 @@
+"""
+Autocomplétion des titres de films (/films/autocomplete).
+
+Les titres sont chargés en mémoire dans un trie de préfixes : chaque nœud
+garde ses meilleures suggestions déjà triées, une frappe coûte donc un
+parcours de len(préfixe) nœuds, sans requête SQL. Chaque titre est indexé
+par son début et par le début de chacun de ses mots ("knight" trouve
+"The Dark Knight"), sans accents ni majuscules.
+
+Le trie est reconstruit quand la table films change : une empreinte
+(nombre de films, somme des hashtext des titres) est relue au plus toutes
+les AUTOCOMPLETE_REFRESH_SECONDS, en tâche de fond.
+"""
+import asyncio
+import os
+import re
+import time
+import unicodedata
+from typing import Dict, List
+
+from config.async_database import async_connection
+
+AUTOCOMPLETE_REFRESH_SECONDS = int(os.getenv("AUTOCOMPLETE_REFRESH_SECONDS", "300"))
+# Suggestions gardées par nœud (limite haute du paramètre `limit`)
+AUTOCOMPLETE_MAX_RESULTS = int(os.getenv("AUTOCOMPLETE_MAX_RESULTS", "20"))
+# Profondeur maximale du trie : au-delà, les candidats du nœud le plus profond sont filtrés
+AUTOCOMPLETE_MAX_DEPTH = int(os.getenv("AUTOCOMPLETE_MAX_DEPTH", "24"))
+
+FILMS_FINGERPRINT_SQL = """
+SELECT COUNT(*) AS films,
+       COALESCE(SUM(hashtext(title || '|' || COALESCE(year::text, ''))::bigint), 0) AS checksum
+FROM films
+"""
+
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def normalize_title(text: str) -> str:
+    """Minuscules, sans accents, ponctuation réduite à des espaces."""
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(c for c in text if not unicodedata.combining(c)).lower()
+    return " ".join(WORD_PATTERN.findall(text))
+
+
+class _TrieNode:
+    __slots__ = ("children", "top", "keys")
+
+    def __init__(self):
+        self.children = {}
+        # Positions des films, dans l'ordre de classement
+        self.top = []
+        # Clés complètes sous ce nœud, seulement à la profondeur maximale
+        self.keys = None
+
+
+class TitleTrie:
+    """
+    Trie des titres normalisés.
+
+    Classement : titres qui commencent par le préfixe, puis correspondances
+    sur un mot ; à égalité, titres courts puis récents.
+    """
+
+    def __init__(self, films: List[Dict], max_results: int = AUTOCOMPLETE_MAX_RESULTS,
+                 max_depth: int = AUTOCOMPLETE_MAX_DEPTH):
+        self.films = films
+        self.max_results = max_results
+        self.max_depth = max_depth
+        self.root = _TrieNode()
+        self.nodes = 1
+
+        entries = []
+        for position, film in enumerate(films):
+            title = normalize_title(film["title"])
+            words = title.split(" ")
+            year = film["year"] or 0
+            for index in range(len(words)):
+                key = " ".join(words[index:])
+                if key:
+                    entries.append(((index > 0, len(title), -year, title), key, position))
+        # Insertion dans l'ordre de classement : chaque nœud garde ses premiers films
+        entries.sort()
+        for rank, key, position in entries:
+            self._insert(key, position)
+
+    def _insert(self, key: str, position: int):
+        node = self.root
+        for depth, char in enumerate(key):
+            if depth == self.max_depth:
+                if node.keys is None:
+                    node.keys = []
+                node.keys.append((key, position))
+                return
+            child = node.children.get(char)
+            if child is None:
+                child = node.children[char] = _TrieNode()
+                self.nodes += 1
+            node = child
+            if len(node.top) < self.max_results and position not in node.top:
+                node.top.append(position)
+
+    def lookup(self, prefix: str, limit: int = 10) -> List[Dict]:
+        """Les `limit` meilleurs films dont le titre (ou un mot du titre) commence par `prefix`."""
+        key = normalize_title(prefix)
+        if not key:
+            return []
+        node = self.root
+        for char in key[:self.max_depth]:
+            node = node.children.get(char)
+            if node is None:
+                return []
+
+        if len(key) <= self.max_depth:
+            positions = node.top[:limit]
+        else:
+            # Préfixe plus long que le trie : filtre des clés du nœud le plus profond
+            positions = []
+            for full_key, position in node.keys or []:
+                if full_key.startswith(key) and position not in positions:
+                    positions.append(position)
+                    if len(positions) == limit:
+                        break
+        return [self.films[position] for position in positions]
+
+
+class TitleAutocomplete:
+    """Trie des titres partagé par l'API, reconstruit quand les films changent."""
+
+    def __init__(self, refresh_seconds: int = AUTOCOMPLETE_REFRESH_SECONDS):
+        self.refresh_seconds = refresh_seconds
+        self.trie = None
+        self.fingerprint = None
+        self.checked_at = None
+        self.build_seconds = None
+        self.lookups = 0
+        self._lock = asyncio.Lock()
+        self._refresh_task = None
+
+    async def refresh(self, force: bool = False):
+        """Recharge les titres si l'empreinte de la table films a changé (ou si `force`)."""
+        async with self._lock:
+            async with async_connection() as conn:
+                row = await conn.fetchrow(FILMS_FINGERPRINT_SQL)
+                fingerprint = (row["films"], row["checksum"])
+                self.checked_at = time.monotonic()
+                if not force and self.trie is not None and fingerprint == self.fingerprint:
+                    return
+                rows = await conn.fetch("SELECT id, title, year FROM films WHERE title IS NOT NULL")
+            started = time.perf_counter()
+            films = [dict(row) for row in rows]
+            self.trie = await asyncio.to_thread(TitleTrie, films)
+            self.fingerprint = fingerprint
+            self.build_seconds = round(time.perf_counter() - started, 3)
+
+    def _schedule_refresh(self):
+        """Vérifie l'empreinte en tâche de fond si la dernière vérification est trop ancienne."""
+        if self.checked_at is not None and time.monotonic() - self.checked_at < self.refresh_seconds:
+            return
+        if self._refresh_task is not None and not self._refresh_task.done():
+            return
+        self.checked_at = time.monotonic()
+        self._refresh_task = asyncio.create_task(self._refresh_quietly())
+
+    async def _refresh_quietly(self):
+        try:
+            await self.refresh()
+        except Exception as e:
+            print(f"Autocomplétion non rechargée: {e}")
+
+    async def suggest(self, prefix: str, limit: int = 10) -> List[Dict]:
+        """Suggestions pour un préfixe (le trie est construit au premier appel si besoin)."""
+        if self.trie is None:
+            await self.refresh()
+        else:
+            self._schedule_refresh()
+        self.lookups += 1
+        return self.trie.lookup(prefix, min(limit, self.trie.max_results))
+
+    def stats(self) -> Dict:
+        return {
+            "films": len(self.trie.films) if self.trie else 0,
+            "nodes": self.trie.nodes if self.trie else 0,
+            "build_seconds": self.build_seconds,
+            "lookups": self.lookups,
+        }
+
+
+async def fuzzy_title_search(conn, text: str, limit: int = 10) -> List[Dict]:
+    """Titres proches d'un texte mal orthographié (pg_trgm, index films_title_trgm_idx)."""
+    rows = await conn.fetch("""
+        SELECT id, title, year
+        FROM films
+        WHERE lower(title) % lower($1)
+        ORDER BY similarity(lower(title), lower($1)) DESC
+        LIMIT $2
+    """, text, limit)
+    return [dict(row) for row in rows]
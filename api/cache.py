@@ -0,0 +1,222 @@
+"""
+Caches en mémoire du processus de l'API.
+
+- TTLCache : cache LRU borné avec expiration, thread-safe, avec compteurs hit/miss.
+- EmbeddingCache : embeddings des requêtes textuelles, clé = (modèle, texte normalisé),
+  avec un niveau disque SQLite optionnel pour survivre aux redémarrages.
+"""
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+import numpy as np
+
+# Cache des embeddings de requêtes (QUERY_CACHE_DISK_PATH vide = pas de niveau disque)
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "1024"))
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", "3600"))
+QUERY_CACHE_DISK_PATH = os.getenv("QUERY_CACHE_DISK_PATH", "")
+
+
+class TTLCache:
+    """
+    Cache LRU borné dont les entrées expirent après `ttl_seconds`.
+
+    Args:
+        max_size: nombre maximal d'entrées (les moins récemment utilisées sont évincées)
+        ttl_seconds: durée de vie d'une entrée (0 ou moins = pas d'expiration)
+    """
+
+    def __init__(self, max_size: int = 1024, ttl_seconds: float = 3600):
+        self.max_size = max(1, max_size)
+        self.ttl_seconds = ttl_seconds
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Retourne la valeur associée à `key` ou `default` (absente ou expirée)."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl_seconds: Optional[float] = None):
+        """Ajoute ou remplace une entrée (TTL spécifique optionnel)."""
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        expires_at = time.monotonic() + ttl if ttl and ttl > 0 else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: Hashable):
+        """Supprime une entrée si elle existe."""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def delete_where(self, predicate) -> int:
+        """Supprime les entrées dont la valeur vérifie `predicate` (parcours complet) ; retourne leur nombre."""
+        with self._lock:
+            keys = [key for key, (value, _) in self._data.items() if predicate(value)]
+            for key in keys:
+                del self._data[key]
+            return len(keys)
+
+    def clear(self):
+        """Vide le cache (les compteurs sont conservés)."""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> Dict:
+        """Taille et compteurs du cache."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+def normalize_query(text: str) -> str:
+    """Normalise une requête (Unicode NFC, casse, espaces) pour en faire une clé de cache."""
+    text = unicodedata.normalize("NFC", text or "")
+    return " ".join(text.casefold().split())
+
+
+class EmbeddingCache:
+    """
+    Cache des embeddings de requêtes textuelles.
+
+    Le niveau mémoire est un TTLCache, consulté directement ; le niveau disque
+    (SQLite) est optionnel, consulté seulement en cas d'absence en mémoire, et
+    lu ou écrit dans un thread (get et set sont des coroutines).
+
+    Args:
+        model_name: nom du modèle (fait partie de la clé)
+        max_size: nombre maximal d'embeddings en mémoire
+        ttl_seconds: durée de vie d'une entrée (mémoire et disque)
+        disk_path: chemin du fichier SQLite, ou None pour désactiver le niveau disque
+    """
+
+    def __init__(self, model_name: str, max_size: int = QUERY_CACHE_SIZE,
+                 ttl_seconds: float = QUERY_CACHE_TTL, disk_path: Optional[str] = None):
+        self.model_name = model_name
+        self.memory = TTLCache(max_size, ttl_seconds)
+        self.disk_path = disk_path or None
+        self.disk_hits = 0
+        self._disk = None
+        self._disk_lock = threading.Lock()
+        if self.disk_path:
+            self._open_disk()
+
+    def _open_disk(self):
+        """Ouvre (et crée si besoin) la base SQLite du niveau disque."""
+        directory = os.path.dirname(os.path.abspath(self.disk_path))
+        os.makedirs(directory, exist_ok=True)
+        self._disk = sqlite3.connect(self.disk_path, check_same_thread=False)
+        self._disk.execute("PRAGMA journal_mode=WAL")
+        self._disk.execute("PRAGMA synchronous=NORMAL")
+        self._disk.execute("""
+            CREATE TABLE IF NOT EXISTS query_embeddings (
+                model TEXT NOT NULL,
+                query TEXT NOT NULL,
+                embedding BLOB NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (model, query)
+            )
+        """)
+        self._disk.commit()
+
+    async def get(self, text: str) -> Optional[np.ndarray]:
+        """Retourne l'embedding en cache pour `text`, ou None."""
+        query = normalize_query(text)
+        embedding = self.memory.get((self.model_name, query))
+        if embedding is not None or self._disk is None:
+            return embedding
+        # SQLite est bloquant : le niveau disque est lu hors de la boucle d'événements
+        return await asyncio.to_thread(self._disk_get, query)
+
+    def _disk_get(self, query: str) -> Optional[np.ndarray]:
+        with self._disk_lock:
+            if self._disk is None:
+                return None
+            row = self._disk.execute(
+                "SELECT embedding, created_at FROM query_embeddings WHERE model = ? AND query = ?",
+                (self.model_name, query)
+            ).fetchone()
+        if row is None:
+            return None
+        blob, created_at = row
+        ttl = self.memory.ttl_seconds
+        if ttl and ttl > 0 and created_at + ttl <= time.time():
+            return None
+        embedding = np.frombuffer(blob, dtype=np.float32).copy()
+        self.disk_hits += 1
+        remaining = created_at + ttl - time.time() if ttl and ttl > 0 else None
+        self.memory.set((self.model_name, query), embedding, remaining)
+        return embedding
+
+    async def set(self, text: str, embedding: np.ndarray):
+        """Enregistre l'embedding de `text` en mémoire (et sur disque si activé)."""
+        query = normalize_query(text)
+        embedding = np.asarray(embedding, dtype=np.float32)
+        self.memory.set((self.model_name, query), embedding)
+        if self._disk is not None:
+            await asyncio.to_thread(self._disk_set, query, embedding)
+
+    def _disk_set(self, query: str, embedding: np.ndarray):
+        with self._disk_lock:
+            if self._disk is None:
+                return
+            self._disk.execute(
+                "INSERT OR REPLACE INTO query_embeddings (model, query, embedding, created_at) "
+                "VALUES (?, ?, ?, ?)",
+                (self.model_name, query, embedding.tobytes(), time.time())
+            )
+            self._disk.commit()
+
+    def close(self):
+        """Ferme le niveau disque."""
+        with self._disk_lock:
+            if self._disk is not None:
+                self._disk.close()
+                self._disk = None
+
+    def stats(self) -> Dict:
+        """Compteurs du niveau mémoire et du niveau disque."""
+        stats = self.memory.stats()
+        stats.update({
+            "model": self.model_name,
+            "disk_path": self.disk_path,
+            "disk_hits": self.disk_hits,
+        })
+        return stats
@@ -0,0 +1,162 @@
+"""
+Service d'encodage des requêtes par micro-lots dynamiques.
+
+Les appels à SentenceTransformer.encode sont bloquants : exécutés directement
+dans un endpoint async, ils figent la boucle d'événements et les requêtes
+concurrentes sont encodées une par une. Ici, chaque requête est déposée dans
+une file ; un thread dédié regroupe les textes en lots (taille maximale et
+délai d'attente maximal configurables) et chaque appelant attend son propre
+futur.
+"""
+import asyncio
+import os
+import queue
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+import numpy as np
+
+# Taille maximale d'un lot et temps d'attente maximal pour le compléter
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+EMBEDDING_BATCH_WAIT_MS = float(os.getenv("EMBEDDING_BATCH_WAIT_MS", "5"))
+
+_STOP = object()
+
+
+def _resolve(future: asyncio.Future, result=None, error: Optional[BaseException] = None):
+    """Complète un futur asyncio depuis la boucle d'événements (s'il n'a pas été annulé)."""
+    if future.done():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+
+class EmbeddingBatcher:
+    """
+    Regroupe les demandes d'encodage concurrentes en lots traités par un thread dédié.
+
+    Args:
+        model_getter: fonction retournant le modèle (ex: get_model), appelée dans le thread
+        max_batch_size: nombre maximal de textes par appel à encode()
+        max_wait_ms: délai maximal d'attente d'autres requêtes avant d'encoder un lot
+        normalize: normaliser les embeddings (distance cosinus)
+    """
+
+    def __init__(self, model_getter: Callable, max_batch_size: int = EMBEDDING_BATCH_SIZE,
+                 max_wait_ms: float = EMBEDDING_BATCH_WAIT_MS, normalize: bool = True):
+        self.model_getter = model_getter
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait_ms = max(0.0, max_wait_ms)
+        self.normalize = normalize
+        self._queue = queue.Queue()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "requests": 0,
+            "batches": 0,
+            "errors": 0,
+            "max_batch_seen": 0,
+            "total_encode_ms": 0.0,
+            "total_queue_wait_ms": 0.0,
+        }
+
+    def start(self):
+        """Démarre le thread d'encodage (sans effet s'il tourne déjà)."""
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="embedding-batcher", daemon=True
+                )
+                self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """Arrête le thread après avoir traité les requêtes déjà en file."""
+        with self._thread_lock:
+            thread, self._thread = self._thread, None
+        if thread is not None and thread.is_alive():
+            self._queue.put(_STOP)
+            thread.join(timeout)
+
+    async def encode(self, text: str) -> np.ndarray:
+        """Encode un texte ; la coroutine est suspendue jusqu'au traitement de son lot."""
+        self.start()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._queue.put((text, loop, future, time.monotonic()))
+        return await future
+
+    def _run(self):
+        """Boucle du thread : vide la file en lots bornés par taille et par délai."""
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.max_wait_ms / 1000
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    # Les requêtes déjà en file sont prises sans attendre
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._process(batch)
+
+    def _process(self, batch):
+        """Encode un lot et transmet chaque résultat (ou l'erreur) à son appelant."""
+        started = time.monotonic()
+        texts = [text for text, _, _, _ in batch]
+        try:
+            model = self.model_getter()
+            embeddings = model.encode(
+                texts,
+                batch_size=len(texts),
+                normalize_embeddings=self.normalize,
+                show_progress_bar=False,
+            )
+        except Exception as e:
+            with self._stats_lock:
+                self._stats["errors"] += 1
+            for _, loop, future, _ in batch:
+                loop.call_soon_threadsafe(_resolve, future, None, e)
+            return
+
+        finished = time.monotonic()
+        for (_, loop, future, _), embedding in zip(batch, embeddings):
+            loop.call_soon_threadsafe(_resolve, future, np.asarray(embedding, dtype=np.float32))
+
+        with self._stats_lock:
+            self._stats["requests"] += len(batch)
+            self._stats["batches"] += 1
+            self._stats["max_batch_seen"] = max(self._stats["max_batch_seen"], len(batch))
+            self._stats["total_encode_ms"] += (finished - started) * 1000
+            self._stats["total_queue_wait_ms"] += sum(
+                (started - enqueued) * 1000 for _, _, _, enqueued in batch
+            )
+
+    def stats(self) -> Dict:
+        """Configuration et compteurs du micro-batcher."""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        batches = stats["batches"]
+        requests = stats["requests"]
+        total_encode_ms = stats.pop("total_encode_ms")
+        total_queue_wait_ms = stats.pop("total_queue_wait_ms")
+        stats.update({
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait_ms,
+            "queue_size": self._queue.qsize(),
+            "avg_batch_size": round(requests / batches, 2) if batches else 0.0,
+            "avg_encode_ms": round(total_encode_ms / batches, 3) if batches else 0.0,
+            "avg_queue_wait_ms": round(total_queue_wait_ms / requests, 3) if requests else 0.0,
+        })
+        return stats
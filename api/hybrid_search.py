@@ -0,0 +1,81 @@
+"""
+Recherche lexicale (plein texte PostgreSQL) et fusion avec la recherche sémantique.
+
+- lexical_search : requête sur films.search_document (tsvector pondéré : titre
+  et cast en configuration "simple", synopsis en "french"), index GIN
+  films_search_document_idx créé par scripts/setup_database.py.
+- reciprocal_rank_fusion : fusion RRF de listes classées ; un film gagne
+  1 / (RRF_K + rang) par liste où il apparaît.
+
+/search?mode=hybrid lance les deux recherches en parallèle puis fusionne.
+"""
+import os
+from typing import Dict, List, Optional
+
+from api.search_engine import FILM_COLUMNS, build_film_filters
+
+# Constante de lissage de RRF (60 dans l'article d'origine)
+RRF_K = int(os.getenv("RRF_K", "60"))
+# Profondeur des listes fusionnées : k x HYBRID_DEPTH_FACTOR résultats par recherche
+HYBRID_DEPTH_FACTOR = int(os.getenv("HYBRID_DEPTH_FACTOR", "3"))
+
+SEARCH_MODES = ("semantic", "lexical", "hybrid")
+
+
+async def lexical_search(conn, q: str, k: int, genres: Optional[str] = None,
+                         min_year: Optional[int] = None, max_year: Optional[int] = None) -> List[Dict]:
+    """
+    Les k films les mieux classés par ts_rank_cd pour une requête en texte libre.
+
+    La requête est interprétée par websearch_to_tsquery dans les deux
+    configurations du document (noms propres en "simple", synopsis en "french").
+    """
+    # $1 : texte de la requête, filtres à partir de $2, k en dernier
+    params = [q]
+    filter_clause = build_film_filters(params, genres=genres, min_year=min_year, max_year=max_year)
+    params.append(k)
+
+    rows = await conn.fetch(f"""
+        WITH query AS (
+            SELECT websearch_to_tsquery('simple', $1) || websearch_to_tsquery('french', $1) AS tsq
+        )
+        SELECT
+            {FILM_COLUMNS},
+            ts_rank_cd(f.search_document, query.tsq) AS score
+        FROM films f, query
+        WHERE f.search_document @@ query.tsq
+        {filter_clause}
+        ORDER BY score DESC, f.id
+        LIMIT ${len(params)}
+    """, *params)
+    return [dict(row) for row in rows]
+
+
+def reciprocal_rank_fusion(ranked_lists: List[List[Dict]], k: int, rrf_k: int = RRF_K) -> List[Dict]:
+    """
+    Fusionne des listes de films classées (meilleur en premier) par RRF.
+
+    Chaque ligne fusionnée garde les colonnes du film et `score` (somme RRF).
+    """
+    fused = {}
+    for rows in ranked_lists:
+        for rank, row in enumerate(rows, 1):
+            entry = fused.get(row["id"])
+            if entry is None:
+                entry = fused[row["id"]] = {**row, "score": 0.0}
+            entry["score"] += 1.0 / (rrf_k + rank)
+    return sorted(fused.values(), key=lambda row: (-row["score"], row["id"]))[:k]
+
+
+def score_as_distance(rows: List[Dict]) -> List[Dict]:
+    """
+    Distance dans [0, 1] dérivée du score (1 - score / meilleur score).
+
+    Les réponses des modes lexical et hybride gardent ainsi la convention
+    "plus petit = plus similaire" de la distance cosinus.
+    """
+    best = max((row["score"] for row in rows), default=0.0)
+    return [
+        {**row, "distance": 1.0 - row["score"] / best if best > 0 else 1.0}
+        for row in rows
+    ]
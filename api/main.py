@@ -6,24 +6,41 @@ from fastapi import FastAPI, HTTPException, Query, Request, Response, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse, JSONResponse
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel, Field, EmailStr
 from typing import List, Optional, Dict
+import asyncio
 import os
 import sys
+import time
 from pathlib import Path
 from datetime import datetime
 
 # Ajouter le répertoire parent au path
 sys.path.append(str(Path(__file__).parent.parent))
 
-from config.database import get_connection, get_connection_dict, close_connection_pool
+from config.database import pooled_connection_dict, close_connection_pool, get_pool_stats
+from config.async_database import async_connection, close_async_pool, get_async_pool, get_async_pool_stats
+from config.precision import EMBEDDING_PRECISION, index_name
 from dotenv import load_dotenv
 import psycopg2
+import asyncpg
 from api.auth import (
     hash_password, verify_password, create_session, delete_session,
-    get_current_user, require_auth, require_admin, get_avatar_url
+    get_current_user, require_auth, require_admin, get_avatar_url, session_cache
+)
+from api.embedding_service import EmbeddingBatcher
+from api.autocomplete import TitleAutocomplete, fuzzy_title_search
+from api.hybrid_search import HYBRID_DEPTH_FACTOR, lexical_search, reciprocal_rank_fusion, score_as_distance
+from api.query_encoder import QUERY_ENCODER_BACKEND, load_onnx_encoder
+from api.result_cache import ResultCache, GenerationTracker, make_result_backend
+from api.search_engine import PgvectorSearchEngine, build_film_filters, make_search_engine
+from api.cache import EmbeddingCache, QUERY_CACHE_SIZE, QUERY_CACHE_TTL, QUERY_CACHE_DISK_PATH, normalize_query
+from api.tmdb_cache import TMDBMetadataCache
+from api.tmdb_prefetch import TMDB_PREFETCH_ON_STARTUP, TMDBPrefetcher
+from api.tmdb_service import (
+    get_film_metadata, get_movie_poster_url, get_movie_trailer, get_streaming_platforms, tmdb_client
 )
-from api.tmdb_service import get_film_metadata, get_movie_poster_url, get_movie_trailer, get_streaming_platforms
 
 # Import lazy de SentenceTransformer pour éviter les problèmes au démarrage
 SentenceTransformer = None
@@ -46,6 +63,7 @@ app.add_middleware(
 )
 
 # Chargement du modèle d'embeddings (une seule fois au démarrage)
+EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-mpnet-base-v2")
 _model = None
 _model_loading_error = None
 
@@ -56,6 +74,20 @@ def get_model():
     if _model_loading_error:
         raise _model_loading_error
     
+    # Backends ONNX Runtime (fp32 ou int8) : ni torch ni sentence_transformers à charger
+    if QUERY_ENCODER_BACKEND != "torch":
+        if _model is None:
+            try:
+                print(f"Chargement de l'encodeur {QUERY_ENCODER_BACKEND}: {EMBEDDING_MODEL_NAME}")
+                _model = load_onnx_encoder(EMBEDDING_MODEL_NAME, QUERY_ENCODER_BACKEND)
+            except Exception as e:
+                _model_loading_error = HTTPException(
+                    status_code=500,
+                    detail=f"Erreur lors du chargement de l'encodeur {QUERY_ENCODER_BACKEND}: {str(e)}"
+                )
+                raise _model_loading_error
+        return _model
+    
     # Import lazy de SentenceTransformer
     if SentenceTransformer is None:
         try:
@@ -74,7 +106,7 @@ def get_model():
     
     if _model is None:
         try:
-            model_name = os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-mpnet-base-v2")
+            model_name = EMBEDDING_MODEL_NAME
             print(f"Chargement du modèle: {model_name}")
             
             # Options pour réduire l'utilisation mémoire
@@ -130,6 +162,61 @@ def get_model():
     return _model
 
 
+# Encodage des requêtes par micro-lots, hors de la boucle d'événements
+embedding_batcher = EmbeddingBatcher(get_model)
+
+# Cache des embeddings de requêtes (les mêmes recherches reviennent très souvent).
+# Le backend (torch, onnx, onnx-int8) fait partie de la clé : changer de backend
+# ne ressert pas les embeddings de l'ancien, y compris depuis le niveau disque.
+query_embedding_cache = EmbeddingCache(
+    f"{EMBEDDING_MODEL_NAME}@{QUERY_ENCODER_BACKEND}",
+    max_size=QUERY_CACHE_SIZE,
+    ttl_seconds=QUERY_CACHE_TTL,
+    disk_path=QUERY_CACHE_DISK_PATH or None,
+)
+
+# Génération courante des embeddings (incrémentée par scripts/generate_embeddings.py)
+embeddings_generation = GenerationTracker()
+
+# Cache des réponses de /search et /recommend/by-film, invalidé à chaque régénération des embeddings
+result_cache = ResultCache(make_result_backend(), embeddings_generation)
+
+# Moteur de recherche vectorielle (SEARCH_BACKEND=pgvector ou memory)
+search_engine = make_search_engine(embeddings_generation)
+# Requêtes SQL pgvector, utilisées en repli par /recommend/by-film
+pgvector_engine = search_engine if isinstance(search_engine, PgvectorSearchEngine) else PgvectorSearchEngine()
+
+# Trie des titres pour /films/autocomplete (rechargé quand la table films change)
+title_autocomplete = TitleAutocomplete()
+
+# Métadonnées TMDB persistées dans film_metadata (TTL, entrées négatives, rafraîchissement en arrière-plan)
+tmdb_metadata_cache = TMDBMetadataCache()
+# Préchargement des métadonnées TMDB en tâche de fond (TMDB_PREFETCH_ON_STARTUP=true)
+tmdb_prefetcher = TMDBPrefetcher()
+tmdb_prefetch_task = None
+
+
+async def prefetch_tmdb_metadata():
+    """Tâche de démarrage : précharge les métadonnées des films qui n'en ont pas."""
+    try:
+        stats = await tmdb_prefetcher.run()
+        print(f"Métadonnées TMDB préchargées: {stats['found']} trouvées, "
+              f"{stats['not_found']} absentes, {stats['failed']} en échec")
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        print(f"Préchargement TMDB interrompu: {e}")
+
+
+async def encode_query(q: str):
+    """Retourne l'embedding normalisé d'une requête, depuis le cache ou via le micro-batcher."""
+    embedding = await query_embedding_cache.get(q)
+    if embedding is None:
+        embedding = await embedding_batcher.encode(normalize_query(q))
+        await query_embedding_cache.set(q, embedding)
+    return embedding
+
+
 # Modèles Pydantic pour les réponses
 class Film(BaseModel):
     id: int
@@ -144,6 +231,8 @@ class Film(BaseModel):
 class Recommendation(BaseModel):
     film: Film
     distance: float = Field(..., description="Distance de similarité (plus petit = plus similaire)")
+    score: Optional[float] = Field(None, description="Score plein texte (lexical) ou RRF (hybride)")
+    metadata: Optional[Dict] = Field(None, description="Affiche, trailer et plateformes (include=metadata)")
 
 
 class RecommendationResponse(BaseModel):
@@ -151,6 +240,8 @@ class RecommendationResponse(BaseModel):
     query_text: Optional[str] = None
     recommendations: List[Recommendation]
     count: int
+    mode: Optional[str] = None
+    timings: Optional[Dict[str, float]] = Field(None, description="Durée de chaque étape (ms)")
 
 
 # Modèles pour l'authentification
@@ -180,10 +271,41 @@ static_path = Path(__file__).parent.parent / "static"
 if static_path.exists():
     app.mount("/static", StaticFiles(directory=str(static_path)), name="static")
 
+@app.on_event("startup")
+async def startup_event():
+    """Démarre l'encodeur de requêtes et ouvre le pool asyncpg (l'API reste utilisable si PostgreSQL est absent)."""
+    global tmdb_prefetch_task
+    embedding_batcher.start()
+    try:
+        await get_async_pool()
+    except psycopg2.OperationalError as e:
+        print(f"Pool PostgreSQL asynchrone non initialisé: {e}")
+        return
+    try:
+        await search_engine.refresh()
+    except Exception as e:
+        print(f"Moteur de recherche {search_engine.name} non chargé: {e}")
+    try:
+        await title_autocomplete.refresh()
+    except Exception as e:
+        print(f"Autocomplétion des titres non chargée: {e}")
+    if TMDB_PREFETCH_ON_STARTUP and tmdb_client.api_key:
+        tmdb_prefetch_task = asyncio.create_task(prefetch_tmdb_metadata())
+
+
 @app.on_event("shutdown")
 async def shutdown_event():
     """Ferme les connexions à la base de données lors de l'arrêt."""
     close_connection_pool()
+    await close_async_pool()
+    embedding_batcher.stop()
+    query_embedding_cache.close()
+    result_cache.close()
+    if tmdb_prefetch_task is not None and not tmdb_prefetch_task.done():
+        tmdb_prefetch_task.cancel()
+        await asyncio.gather(tmdb_prefetch_task, return_exceptions=True)
+    await tmdb_metadata_cache.close()
+    tmdb_client.close()
 
 
 @app.get("/app", tags=["Web Interface"])
@@ -305,93 +427,170 @@ def api_info():
     }
 
 
+def rows_to_recommendations(rows) -> List[Recommendation]:
+    """Convertit des lignes (films + distance) en objets Recommendation."""
+    return [
+        Recommendation(
+            film=Film(
+                id=row["id"],
+                title=row["title"],
+                year=row["year"],
+                genres=row["genres"],
+                cast=row["cast"],
+                synopsis=row["synopsis"],
+                meta=row["meta"]
+            ),
+            distance=float(row["distance"]),
+            score=row.get("score")
+        )
+        for row in rows
+    ]
+
+
+async def respond_with_include(response, include: Optional[str]):
+    """
+    Réponse finale de /search et /recommend/by-film.
+
+    `response` est un RecommendationResponse ou le dictionnaire d'un résultat en
+    cache. Avec include=metadata, les métadonnées TMDB de tous les films sont
+    ajoutées en une seule lecture de film_metadata (appels TMDB en parallèle
+    pour les films absents du cache).
+    """
+    if include != "metadata":
+        return JSONResponse(response) if isinstance(response, dict) else response
+    payload = response if isinstance(response, dict) else response.model_dump(mode="json")
+    metadata = await tmdb_metadata_cache.get_many(rec["film"]["id"] for rec in payload["recommendations"])
+    payload["recommendations"] = [
+        {**rec, "metadata": metadata.get(rec["film"]["id"], {})}
+        for rec in payload["recommendations"]
+    ]
+    return JSONResponse(payload)
+
+
+def elapsed_ms(started: float) -> float:
+    return round((time.perf_counter() - started) * 1000, 2)
+
+
+async def semantic_stage(q: str, k: int, timings: Dict[str, float], genres: Optional[str] = None,
+                         min_year: Optional[int] = None, max_year: Optional[int] = None,
+                         quality: Optional[str] = None):
+    """Encodage de la requête puis recherche vectorielle (durées dans `timings`)."""
+    started = time.perf_counter()
+    # Embedding depuis le cache, sinon regroupé avec les requêtes concurrentes
+    query_embedding = await encode_query(q)
+    timings["encode_ms"] = elapsed_ms(started)
+    started = time.perf_counter()
+    results = await search_engine.search(query_embedding, k, genres=genres,
+                                         min_year=min_year, max_year=max_year, quality=quality)
+    timings["vector_ms"] = elapsed_ms(started)
+    return results
+
+
+async def lexical_stage(q: str, k: int, timings: Dict[str, float], genres: Optional[str] = None,
+                        min_year: Optional[int] = None, max_year: Optional[int] = None):
+    """Recherche plein texte (durée dans `timings`)."""
+    started = time.perf_counter()
+    try:
+        async with async_connection() as conn:
+            results = await lexical_search(conn, q, k, genres=genres, min_year=min_year, max_year=max_year)
+    except (asyncpg.UndefinedColumnError, asyncpg.UndefinedFunctionError):
+        raise HTTPException(
+            status_code=503,
+            detail="Recherche plein texte non configurée: exécutez python scripts/setup_database.py"
+        )
+    timings["lexical_ms"] = elapsed_ms(started)
+    return results
+
+
+async def fetch_precomputed_neighbors(conn, film_id: int, k: int, exclude_genres: Optional[str],
+                                      min_year: Optional[int], max_year: Optional[int]):
+    """
+    Lit les voisins précalculés (scripts/compute_neighbors.py) en appliquant les filtres.
+    
+    Retourne None si la table est absente ou calculée pour une autre génération
+    d'embeddings.
+    """
+    generation = await embeddings_generation.current()
+    params = [film_id, generation]
+    filter_clause = build_film_filters(params, exclude_genres=exclude_genres,
+                                       min_year=min_year, max_year=max_year)
+    params.append(k)
+    try:
+        return await conn.fetch(f"""
+            SELECT 
+                f.id, f.title, f.year, f.genres, f."cast", f.synopsis, f.meta,
+                n.distance
+            FROM film_neighbors n
+            JOIN film_neighbors_state s ON s.generation = $2
+            JOIN films f ON f.id = n.neighbor_id
+            WHERE n.film_id = $1
+            {filter_clause}
+            ORDER BY n.rank
+            LIMIT ${len(params)}
+        """, *params)
+    except asyncpg.UndefinedTableError:
+        return None
+
+
 @app.get("/recommend/by-film/{film_id}", response_model=RecommendationResponse, tags=["Recommandation"])
-def recommend_by_film(
+async def recommend_by_film(
     film_id: int,
     k: int = Query(10, ge=1, le=100, description="Nombre de recommandations"),
     exclude_genres: Optional[str] = Query(None, description="Genres à exclure, séparés par des virgules"),
     min_year: Optional[int] = Query(None, description="Année minimum"),
-    max_year: Optional[int] = Query(None, description="Année maximum")
+    max_year: Optional[int] = Query(None, description="Année maximum"),
+    quality: Optional[str] = Query(None, pattern="^(fast|balanced|high)$",
+                                   description="Compromis latence/rappel de la recherche ANN"),
+    include: Optional[str] = Query(None, pattern="^metadata$",
+                                   description="metadata : ajoute affiche, trailer et plateformes à chaque film")
 ):
     """
     Recommande des films similaires à un film donné.
     
     Utilise la similarité cosinus sur les embeddings pour trouver les films les plus proches.
+    Avec le moteur en mémoire (SEARCH_BACKEND=memory), les voisins sont calculés
+    directement sur la matrice d'embeddings. Sinon, les voisins précalculés (table
+    film_neighbors) sont utilisés en priorité ; la recherche ANN n'est lancée que si
+    les filtres épuisent la liste précalculée.
     """
-    conn = None
     try:
-        conn, cur = get_connection_dict()
-        
-        # Vérifier que le film existe
-        cur.execute("SELECT id, title FROM films WHERE id = %s", (film_id,))
-        film_check = cur.fetchone()
-        if not film_check:
-            raise HTTPException(status_code=404, detail=f"Film avec l'id {film_id} non trouvé")
-        
-        # Construire la requête avec filtres optionnels
-        filters = []
-        filter_params = []
-        
-        if exclude_genres:
-            genres_to_exclude = [g.strip() for g in exclude_genres.split(",")]
-            for genre in genres_to_exclude:
-                filters.append("NOT (%s = ANY(f.genres))")
-                filter_params.append(genre)
-        
-        if min_year:
-            filters.append("f.year >= %s")
-            filter_params.append(min_year)
-        
-        if max_year:
-            filters.append("f.year <= %s")
-            filter_params.append(max_year)
-        
-        filter_clause = " AND " + " AND ".join(filters) if filters else ""
-        
-        # Ordre des paramètres : film_id (WITH), film_id (WHERE), filtres, k (LIMIT)
-        params = [film_id, film_id] + filter_params + [k]
-        
-        query = f"""
-        WITH q AS (
-            SELECT embedding FROM film_embeddings WHERE film_id = %s
-        )
-        SELECT 
-            f.id, f.title, f.year, f.genres, f."cast", f.synopsis, f.meta,
-            (fe.embedding <=> (SELECT embedding FROM q)) AS distance
-        FROM film_embeddings fe
-        JOIN films f ON f.id = fe.film_id
-        JOIN q ON TRUE
-        WHERE f.id <> %s
-        {filter_clause}
-        ORDER BY fe.embedding <=> (SELECT embedding FROM q)
-        LIMIT %s
-        """
+        cache_params = dict(film_id=film_id, k=k, exclude_genres=exclude_genres,
+                            min_year=min_year, max_year=max_year, quality=quality)
+        cached = await result_cache.get("recommend_by_film", **cache_params)
+        if cached is not None:
+            return await respond_with_include(cached, include)
+        
+        results = None
+        if search_engine is not pgvector_engine:
+            # None si le film n'a pas d'embedding dans le moteur : on passe par la base
+            results = await search_engine.similar(film_id, k, exclude_genres=exclude_genres,
+                                                  min_year=min_year, max_year=max_year,
+                                                  quality=quality)
+        
+        if results is None:
+            async with async_connection() as conn:
+                # Vérifier que le film existe
+                film_check = await conn.fetchrow("SELECT id, title FROM films WHERE id = $1", film_id)
+                if not film_check:
+                    raise HTTPException(status_code=404, detail=f"Film avec l'id {film_id} non trouvé")
+                
+                results = await fetch_precomputed_neighbors(conn, film_id, k, exclude_genres, min_year, max_year)
+                
+                if results is None or len(results) < k:
+                    # Recherche ANN en direct
+                    results = await pgvector_engine.similar(film_id, k, exclude_genres=exclude_genres,
+                                                            min_year=min_year, max_year=max_year,
+                                                            conn=conn, quality=quality)
         
-        cur.execute(query, params)
-        results = cur.fetchall()
+        recommendations = rows_to_recommendations(results)
         
-        recommendations = []
-        for row in results:
-            recommendations.append(
-                Recommendation(
-                    film=Film(
-                        id=row["id"],
-                        title=row["title"],
-                        year=row["year"],
-                        genres=row["genres"],
-                        cast=row["cast"],
-                        synopsis=row["synopsis"],
-                        meta=row["meta"]
-                    ),
-                    distance=float(row["distance"])
-                )
-            )
-        
-        return RecommendationResponse(
+        response = RecommendationResponse(
             query_film_id=film_id,
             recommendations=recommendations,
             count=len(recommendations)
         )
+        await result_cache.set("recommend_by_film", response.model_dump(mode="json"), **cache_params)
+        return await respond_with_include(response, include)
         
     except HTTPException:
         raise
@@ -407,9 +606,6 @@ def recommend_by_film(
             status_code=500,
             detail=f"Erreur lors de la recommandation: {error_msg}"
         )
-    finally:
-        if conn:
-            conn.close()
 
 
 @app.get("/search", response_model=RecommendationResponse, tags=["Recherche"])
@@ -419,82 +615,83 @@ async def search(
     genres: Optional[str] = Query(None, description="Genres requis, séparés par des virgules"),
     min_year: Optional[int] = Query(None, description="Année minimum"),
     max_year: Optional[int] = Query(None, description="Année maximum"),
-    request: Request = None
+    quality: Optional[str] = Query(None, pattern="^(fast|balanced|high)$",
+                                   description="Compromis latence/rappel de la recherche ANN"),
+    mode: str = Query("semantic", pattern="^(semantic|lexical|hybrid)$",
+                      description="semantic (embeddings), lexical (plein texte) ou hybrid (fusion RRF)"),
+    include: Optional[str] = Query(None, pattern="^metadata$",
+                                   description="metadata : ajoute affiche, trailer et plateformes à chaque film"),
+    user: Optional[Dict] = Depends(get_current_user)
 ):
     """
-    Recherche sémantique de films à partir d'une requête textuelle.
+    Recherche de films à partir d'une requête textuelle.
+    
+    - semantic : la requête est convertie en embedding et comparée avec les embeddings des films ;
+    - lexical : recherche plein texte PostgreSQL sur le titre, le cast et le synopsis ;
+    - hybrid : les deux recherches en parallèle, listes fusionnées par RRF (utile pour
+      les titres exacts et les noms d'acteurs).
     
-    La requête est convertie en embedding et comparée avec les embeddings des films.
+    La réponse indique la durée de chaque étape. La recherche est enregistrée dans
+    l'historique si l'utilisateur est connecté.
     """
-    conn = None
     try:
-        # Générer l'embedding de la requête
-        model = get_model()
-        query_embedding = model.encode([q], normalize_embeddings=True)[0]
-        vec_str = "[" + ",".join(f"{x:.8f}" for x in query_embedding.tolist()) + "]"
-        
-        conn, cur = get_connection_dict()
-        
-        # Construire la requête avec filtres
-        filters = []
-        filter_params = []
-        
-        if genres:
-            genres_list = [g.strip() for g in genres.split(",")]
-            for genre in genres_list:
-                filters.append("%s = ANY(f.genres)")
-                filter_params.append(genre)
-        
-        if min_year:
-            filters.append("f.year >= %s")
-            filter_params.append(min_year)
-        
-        if max_year:
-            filters.append("f.year <= %s")
-            filter_params.append(max_year)
-        
-        filter_clause = " AND " + " AND ".join(filters) if filters else ""
-        
-        # Ordre des paramètres : vec_str (SELECT), filtres, vec_str (ORDER BY), k (LIMIT)
-        params = [vec_str] + filter_params + [vec_str, k]
-        
-        query = f"""
-        SELECT 
-            f.id, f.title, f.year, f.genres, f."cast", f.synopsis, f.meta,
-            (fe.embedding <=> %s::vector) AS distance
-        FROM film_embeddings fe
-        JOIN films f ON f.id = fe.film_id
-        WHERE 1=1
-        {filter_clause}
-        ORDER BY fe.embedding <=> %s::vector
-        LIMIT %s
-        """
-        
-        cur.execute(query, params)
-        results = cur.fetchall()
-        
-        recommendations = []
-        for row in results:
-            recommendations.append(
-                Recommendation(
-                    film=Film(
-                        id=row["id"],
-                        title=row["title"],
-                        year=row["year"],
-                        genres=row["genres"],
-                        cast=row["cast"],
-                        synopsis=row["synopsis"],
-                        meta=row["meta"]
-                    ),
-                    distance=float(row["distance"])
+        started = time.perf_counter()
+        cache_params = dict(q=q, k=k, genres=genres, min_year=min_year, max_year=max_year,
+                            quality=quality, mode=mode, encoder=QUERY_ENCODER_BACKEND)
+        cached = await result_cache.get("search", **cache_params)
+        if cached is not None:
+            response = {**cached, "query_text": q, "timings": {"cache_ms": elapsed_ms(started)}}
+            results_count = cached["count"]
+        else:
+            timings = {}
+            filters = dict(genres=genres, min_year=min_year, max_year=max_year)
+            if mode == "semantic":
+                results = await semantic_stage(q, k, timings, quality=quality, **filters)
+            elif mode == "lexical":
+                results = score_as_distance(await lexical_stage(q, k, timings, **filters))
+            else:
+                depth = k * HYBRID_DEPTH_FACTOR
+                semantic_results, lexical_results = await asyncio.gather(
+                    semantic_stage(q, depth, timings, quality=quality, **filters),
+                    lexical_stage(q, depth, timings, **filters),
                 )
+                fusion_started = time.perf_counter()
+                results = score_as_distance(reciprocal_rank_fusion([semantic_results, lexical_results], k))
+                timings["fusion_ms"] = elapsed_ms(fusion_started)
+        
+            recommendations = rows_to_recommendations(results)
+            timings["total_ms"] = elapsed_ms(started)
+            
+            response = RecommendationResponse(
+                query_text=q,
+                recommendations=recommendations,
+                count=len(recommendations),
+                mode=mode,
+                timings=timings
             )
+            await result_cache.set("search", response.model_dump(mode="json"), **cache_params)
+            results_count = response.count
         
-        return RecommendationResponse(
-            query_text=q,
-            recommendations=recommendations,
-            count=len(recommendations)
-        )
+        # Enregistrer dans l'historique si l'utilisateur est connecté
+        try:
+            if user:
+                filters_dict = {}
+                if genres:
+                    filters_dict["genres"] = genres.split(",")
+                if min_year:
+                    filters_dict["min_year"] = min_year
+                if max_year:
+                    filters_dict["max_year"] = max_year
+                
+                async with async_connection() as conn:
+                    await conn.execute("""
+                        INSERT INTO search_history (user_id, query_text, filters, results_count)
+                        VALUES ($1, $2, $3, $4)
+                    """, user["id"], q, filters_dict, results_count)
+        except Exception:
+            pass  # Ignorer les erreurs d'historique
+        
+        return await respond_with_include(response, include)
         
     except HTTPException:
         raise
@@ -524,37 +721,81 @@ async def search(
             status_code=500,
             detail=f"Erreur lors de la recherche: {error_msg}"
         )
-    finally:
-        if conn:
-            conn.close()
+
+
+class TitleSuggestion(BaseModel):
+    id: int
+    title: str
+    year: Optional[int] = None
+
+
+class AutocompleteResponse(BaseModel):
+    prefix: str
+    suggestions: List[TitleSuggestion]
+    count: int
+
+
+# Déclarée avant /films/{film_id}, sinon "autocomplete" serait lu comme un id
+@app.get("/films/autocomplete", response_model=AutocompleteResponse, tags=["Films"])
+async def autocomplete_titles(
+    prefix: str = Query(..., min_length=1, max_length=100, description="Début du titre (ou d'un mot du titre)"),
+    limit: int = Query(10, ge=1, le=20, description="Nombre de suggestions"),
+    fuzzy: bool = Query(False, description="Titres approchants (pg_trgm) si aucun titre ne commence par le préfixe")
+):
+    """
+    Suggestions de titres pendant la frappe.
+    
+    Servies par un trie en mémoire (aucune requête SQL, aucun index vectoriel).
+    Avec `fuzzy`, un préfixe sans résultat est recherché par similarité trigramme.
+    """
+    try:
+        suggestions = await title_autocomplete.suggest(prefix, limit)
+        if not suggestions and fuzzy:
+            async with async_connection() as conn:
+                suggestions = await fuzzy_title_search(conn, prefix, limit)
+        return AutocompleteResponse(
+            prefix=prefix,
+            suggestions=[TitleSuggestion(**film) for film in suggestions],
+            count=len(suggestions)
+        )
+    except psycopg2.OperationalError as e:
+        error_msg = str(e).replace('\n', ' ')
+        raise HTTPException(
+            status_code=503,
+            detail=f"Erreur de connexion à PostgreSQL: {error_msg}"
+        )
+    except Exception as e:
+        error_msg = str(e)
+        raise HTTPException(
+            status_code=500,
+            detail=f"Erreur lors de l'autocomplétion: {error_msg}"
+        )
 
 
 @app.get("/films/{film_id}", response_model=Film, tags=["Films"])
 def get_film(film_id: int):
     """Récupère les détails d'un film par son ID."""
-    conn = None
     try:
-        conn, cur = get_connection_dict()
-        
-        cur.execute("""
-            SELECT id, title, year, genres, "cast", synopsis, meta
-            FROM films
-            WHERE id = %s
-        """, (film_id,))
-        
-        row = cur.fetchone()
-        if not row:
-            raise HTTPException(status_code=404, detail=f"Film avec l'id {film_id} non trouvé")
-        
-        return Film(
-            id=row["id"],
-            title=row["title"],
-            year=row["year"],
-            genres=row["genres"],
-            cast=row["cast"],
-            synopsis=row["synopsis"],
-            meta=row["meta"]
-        )
+        with pooled_connection_dict() as (conn, cur):
+            cur.execute("""
+                SELECT id, title, year, genres, "cast", synopsis, meta
+                FROM films
+                WHERE id = %s
+            """, (film_id,))
+        
+            row = cur.fetchone()
+            if not row:
+                raise HTTPException(status_code=404, detail=f"Film avec l'id {film_id} non trouvé")
+        
+            return Film(
+                id=row["id"],
+                title=row["title"],
+                year=row["year"],
+                genres=row["genres"],
+                cast=row["cast"],
+                synopsis=row["synopsis"],
+                meta=row["meta"]
+            )
         
     except HTTPException:
         raise
@@ -570,49 +811,38 @@ def get_film(film_id: int):
             status_code=500,
             detail=f"Erreur: {error_msg}"
         )
-    finally:
-        if conn:
-            conn.close()
 
 
 @app.get("/api/poster/{title}", tags=["Images"])
-def get_film_poster(title: str, year: Optional[int] = Query(None, description="Année du film")):
+async def get_film_poster(title: str, year: Optional[int] = Query(None, description="Année du film")):
     """
-    Récupère l'URL de l'affiche d'un film depuis TMDB ou la base de données.
+    Récupère l'URL de l'affiche d'un film depuis le cache TMDB (film_metadata) ou TMDB.
     """
     import urllib.parse
     
-    conn = None
     try:
-        conn, cur = get_connection_dict()
-        
-        # Vérifier si on a déjà les métadonnées en base
-        cur.execute("""
-            SELECT fm.poster_url 
-            FROM film_metadata fm
-            JOIN films f ON f.id = fm.film_id
-            WHERE LOWER(f.title) = LOWER(%s)
-        """, (title,))
-        
-        result = cur.fetchone()
-        if result and result.get("poster_url"):
-            return {"poster_url": result["poster_url"]}
-        
-        # Chercher le film pour obtenir l'année
-        cur.execute("SELECT year FROM films WHERE LOWER(title) = LOWER(%s) LIMIT 1", (title,))
-        film = cur.fetchone()
-        film_year = year or (film["year"] if film else None)
-        
-        # Essayer TMDB
-        poster_url = get_movie_poster_url(title, film_year)
+        # Film du catalogue : la même année en priorité
+        async with async_connection() as conn:
+            film = await conn.fetchrow("""
+                SELECT id, title, year
+                FROM films
+                WHERE LOWER(title) = LOWER($1)
+                ORDER BY (year = $2) DESC NULLS LAST, id
+                LIMIT 1
+            """, title, year)
+        
+        if film:
+            # Résultat enregistré dans film_metadata (y compris l'absence d'affiche)
+            metadata = await tmdb_metadata_cache.get(film["id"]) or {}
+            poster_url = metadata.get("poster_url")
+        else:
+            # Titre hors catalogue : rien à mettre en cache
+            poster_url = await run_in_threadpool(get_movie_poster_url, title, year)
         if poster_url:
             return {"poster_url": poster_url}
         
     except Exception as e:
         pass
-    finally:
-        if conn:
-            conn.close()
     
     # Fallback: placeholder
     encoded_title = urllib.parse.quote(title)
@@ -623,113 +853,84 @@ def get_film_poster(title: str, year: Optional[int] = Query(None, description="A
 @app.get("/api/film/{film_id}/metadata", tags=["Films"])
 async def get_film_metadata_endpoint(film_id: int):
     """Récupère les métadonnées complètes d'un film (affiche, trailer, streaming)."""
-    conn = None
     try:
-        conn, cur = get_connection_dict()
-        
-        # Récupérer le film
-        cur.execute("SELECT id, title, year FROM films WHERE id = %s", (film_id,))
-        film = cur.fetchone()
-        if not film:
+        # Cache film_metadata : TMDB n'est appelé que pour une entrée absente ou périmée
+        metadata = await tmdb_metadata_cache.get(film_id)
+        if metadata is None:
             raise HTTPException(status_code=404, detail="Film non trouvé")
-        
-        # Vérifier si on a déjà les métadonnées en cache
-        cur.execute("""
-            SELECT poster_url, backdrop_url, trailer_url, trailer_youtube_id, 
-                   streaming_platforms, tmdb_id
-            FROM film_metadata
-            WHERE film_id = %s
-        """, (film_id,))
-        
-        cached = cur.fetchone()
-        if cached and cached.get("poster_url"):
-            return {
-                "poster_url": cached["poster_url"],
-                "backdrop_url": cached["backdrop_url"],
-                "trailer_url": cached["trailer_url"],
-                "trailer_youtube_id": cached["trailer_youtube_id"],
-                "streaming_platforms": cached["streaming_platforms"] or []
-            }
-        
-        # Récupérer depuis TMDB
-        metadata = get_film_metadata(film["title"], film["year"])
-        
-        # Sauvegarder en base
-        if metadata.get("poster_url"):
-            cur.execute("""
-                INSERT INTO film_metadata 
-                (film_id, poster_url, backdrop_url, trailer_url, trailer_youtube_id, 
-                 streaming_platforms, tmdb_id)
-                VALUES (%s, %s, %s, %s, %s, %s, %s)
-                ON CONFLICT (film_id) DO UPDATE SET
-                    poster_url = EXCLUDED.poster_url,
-                    backdrop_url = EXCLUDED.backdrop_url,
-                    trailer_url = EXCLUDED.trailer_url,
-                    trailer_youtube_id = EXCLUDED.trailer_youtube_id,
-                    streaming_platforms = EXCLUDED.streaming_platforms,
-                    tmdb_id = EXCLUDED.tmdb_id,
-                    updated_at = CURRENT_TIMESTAMP
-            """, (
-                film_id,
-                metadata.get("poster_url"),
-                metadata.get("backdrop_url"),
-                metadata.get("trailer_url"),
-                metadata.get("trailer_youtube_id"),
-                metadata.get("streaming_platforms", []),
-                metadata.get("tmdb_id")
-            ))
-            conn.commit()
-        
         return metadata
         
     except HTTPException:
         raise
     except Exception as e:
-        if conn:
-            conn.rollback()
         raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
-    finally:
-        if conn:
-            conn.close()
+
+
+class FilmMetadataBatchRequest(BaseModel):
+    film_ids: List[int] = Field(..., min_length=1, max_length=100, description="Ids des films")
+
+
+@app.post("/api/films/metadata:batch", tags=["Films"])
+async def get_films_metadata_batch(request: FilmMetadataBatchRequest):
+    """
+    Métadonnées (affiche, trailer, streaming) de plusieurs films en un appel.
+
+    Une seule requête sur film_metadata pour tout le lot ; les films absents du
+    cache sont interrogés sur TMDB en parallèle. Remplace les appels
+    /api/film/{id}/metadata faits carte par carte par l'interface web.
+    """
+    try:
+        metadata = await tmdb_metadata_cache.get_many(request.film_ids)
+        return {
+            "metadata": {str(film_id): film_metadata for film_id, film_metadata in metadata.items()},
+            "missing": [film_id for film_id in dict.fromkeys(request.film_ids) if film_id not in metadata]
+        }
+        
+    except psycopg2.OperationalError as e:
+        error_msg = str(e).replace('\n', ' ')
+        raise HTTPException(
+            status_code=503,
+            detail=f"Erreur de connexion à PostgreSQL: {error_msg}"
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
 
 
 @app.get("/stats", tags=["Statistiques"])
 def get_stats():
     """Retourne des statistiques sur la base de données."""
-    conn = None
     try:
-        conn, cur = get_connection_dict()
-        
-        # Nombre total de films
-        cur.execute("SELECT COUNT(*) FROM films")
-        total_films = cur.fetchone()["count"]
+        with pooled_connection_dict() as (conn, cur):
+            # Nombre total de films
+            cur.execute("SELECT COUNT(*) FROM films")
+            total_films = cur.fetchone()["count"]
         
-        # Nombre d'embeddings
-        cur.execute("SELECT COUNT(*) FROM film_embeddings")
-        total_embeddings = cur.fetchone()["count"]
+            # Nombre d'embeddings
+            cur.execute("SELECT COUNT(*) FROM film_embeddings")
+            total_embeddings = cur.fetchone()["count"]
         
-        # Année min/max
-        cur.execute("SELECT MIN(year) as min_year, MAX(year) as max_year FROM films WHERE year IS NOT NULL")
-        year_stats = cur.fetchone()
+            # Année min/max
+            cur.execute("SELECT MIN(year) as min_year, MAX(year) as max_year FROM films WHERE year IS NOT NULL")
+            year_stats = cur.fetchone()
         
-        # Nombre de genres uniques
-        cur.execute("SELECT COUNT(DISTINCT unnest(genres)) FROM films WHERE genres IS NOT NULL")
-        unique_genres = cur.fetchone()["count"]
+            # Nombre de genres uniques
+            cur.execute("SELECT COUNT(DISTINCT unnest(genres)) FROM films WHERE genres IS NOT NULL")
+            unique_genres = cur.fetchone()["count"]
         
-        # Taille de l'index
-        cur.execute("""
-            SELECT pg_size_pretty(pg_relation_size('film_embeddings_hnsw_cosine')) as index_size
-        """)
-        index_size = cur.fetchone()["index_size"] if cur.rowcount > 0 else "N/A"
+            # Taille de l'index de la précision active (NULL s'il n'est pas construit)
+            cur.execute("""
+                SELECT pg_size_pretty(pg_relation_size(to_regclass(%s))) as index_size
+            """, (index_name(EMBEDDING_PRECISION),))
+            index_size = cur.fetchone()["index_size"] or "N/A"
         
-        return {
-            "total_films": total_films,
-            "total_embeddings": total_embeddings,
-            "min_year": year_stats["min_year"],
-            "max_year": year_stats["max_year"],
-            "unique_genres": unique_genres,
-            "index_size": index_size
-        }
+            return {
+                "total_films": total_films,
+                "total_embeddings": total_embeddings,
+                "min_year": year_stats["min_year"],
+                "max_year": year_stats["max_year"],
+                "unique_genres": unique_genres,
+                "index_size": index_size
+            }
         
     except psycopg2.OperationalError as e:
         error_msg = str(e).replace('\n', ' ')
@@ -743,9 +944,24 @@ def get_stats():
             status_code=500,
             detail=f"Erreur lors de la récupération des statistiques: {error_msg}"
         )
-    finally:
-        if conn:
-            conn.close()
+
+
+@app.get("/api/metrics", tags=["Statistiques"])
+def get_metrics():
+    """Métriques internes de l'API (pools de connexions, encodeur et caches)."""
+    return {
+        "db_pool": get_pool_stats(),
+        "async_db_pool": get_async_pool_stats(),
+        "embedding_batcher": embedding_batcher.stats(),
+        "query_encoder_backend": QUERY_ENCODER_BACKEND,
+        "query_embedding_cache": query_embedding_cache.stats(),
+        "result_cache": result_cache.stats(),
+        "search_engine": search_engine.stats(),
+        "title_autocomplete": title_autocomplete.stats(),
+        "tmdb_metadata_cache": tmdb_metadata_cache.stats(),
+        "tmdb_prefetch": tmdb_prefetcher.stats(),
+        "session_cache": session_cache.stats()
+    }
 
 
 # ==================== ENDPOINTS D'AUTHENTIFICATION ====================
@@ -753,33 +969,30 @@ def get_stats():
 @app.post("/api/auth/register", tags=["Authentification"])
 async def register(request: RegisterRequest, http_request: Request):
     """Inscription d'un nouvel utilisateur."""
-    conn = None
     try:
-        conn, cur = get_connection_dict()
-        
-        # Vérifier si l'utilisateur existe déjà
-        cur.execute("SELECT id FROM users WHERE username = %s OR email = %s", 
-                   (request.username, request.email))
-        if cur.fetchone():
-            raise HTTPException(status_code=400, detail="Username ou email déjà utilisé")
-        
-        # Créer l'utilisateur
-        password_hash = hash_password(request.password)
-        avatar_url = get_avatar_url(request.gender)
-        
-        cur.execute("""
-            INSERT INTO users (username, email, password_hash, gender, avatar_url, role)
-            VALUES (%s, %s, %s, %s, %s, 'user')
-            RETURNING id, username, email, role, gender, avatar_url
-        """, (request.username, request.email, password_hash, request.gender, avatar_url))
-        
-        user = cur.fetchone()
-        conn.commit()
+        async with async_connection() as conn:
+            # Vérifier si l'utilisateur existe déjà
+            existing = await conn.fetchrow(
+                "SELECT id FROM users WHERE username = $1 OR email = $2",
+                request.username, request.email
+            )
+            if existing:
+                raise HTTPException(status_code=400, detail="Username ou email déjà utilisé")
+            
+            # Créer l'utilisateur
+            password_hash = hash_password(request.password)
+            avatar_url = get_avatar_url(request.gender)
+            
+            user = await conn.fetchrow("""
+                INSERT INTO users (username, email, password_hash, gender, avatar_url, role)
+                VALUES ($1, $2, $3, $4, $5, 'user')
+                RETURNING id, username, email, role, gender, avatar_url
+            """, request.username, request.email, password_hash, request.gender, avatar_url)
         
-        # Créer la session
+        # Créer la session (après avoir rendu la connexion au pool)
         ip_address = http_request.client.host if http_request.client else None
         user_agent = http_request.headers.get("user-agent")
-        session_token = create_session(user["id"], ip_address, user_agent)
+        session_token = await create_session(user["id"], ip_address, user_agent)
         
         response = JSONResponse({
             "user": dict(user),
@@ -797,44 +1010,34 @@ async def register(request: RegisterRequest, http_request: Request):
     except HTTPException:
         raise
     except Exception as e:
-        if conn:
-            conn.rollback()
         raise HTTPException(status_code=500, detail=f"Erreur lors de l'inscription: {str(e)}")
-    finally:
-        if conn:
-            conn.close()
 
 
 @app.post("/api/auth/login", tags=["Authentification"])
 async def login(request: LoginRequest, http_request: Request):
     """Connexion d'un utilisateur."""
-    conn = None
     try:
-        conn, cur = get_connection_dict()
-        
-        cur.execute("""
-            SELECT id, username, email, password_hash, role, gender, avatar_url, 
-                   is_active, is_blocked
-            FROM users
-            WHERE username = %s OR email = %s
-        """, (request.username, request.username))
-        
-        user = cur.fetchone()
-        if not user or not verify_password(request.password, user["password_hash"]):
-            raise HTTPException(status_code=401, detail="Identifiants incorrects")
-        
-        if not user["is_active"] or user["is_blocked"]:
-            raise HTTPException(status_code=403, detail="Compte désactivé ou bloqué")
-        
-        # Mettre à jour last_login
-        cur.execute("UPDATE users SET last_login = CURRENT_TIMESTAMP WHERE id = %s", 
-                   (user["id"],))
-        conn.commit()
+        async with async_connection() as conn:
+            user = await conn.fetchrow("""
+                SELECT id, username, email, password_hash, role, gender, avatar_url, 
+                       is_active, is_blocked
+                FROM users
+                WHERE username = $1 OR email = $1
+            """, request.username)
+            
+            if not user or not verify_password(request.password, user["password_hash"]):
+                raise HTTPException(status_code=401, detail="Identifiants incorrects")
+            
+            if not user["is_active"] or user["is_blocked"]:
+                raise HTTPException(status_code=403, detail="Compte désactivé ou bloqué")
+            
+            # Mettre à jour last_login
+            await conn.execute("UPDATE users SET last_login = CURRENT_TIMESTAMP WHERE id = $1", user["id"])
         
-        # Créer la session
+        # Créer la session (après avoir rendu la connexion au pool)
         ip_address = http_request.client.host if http_request.client else None
         user_agent = http_request.headers.get("user-agent")
-        session_token = create_session(user["id"], ip_address, user_agent)
+        session_token = await create_session(user["id"], ip_address, user_agent)
         
         response = JSONResponse({
             "user": {
@@ -860,9 +1063,6 @@ async def login(request: LoginRequest, http_request: Request):
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur lors de la connexion: {str(e)}")
-    finally:
-        if conn:
-            conn.close()
 
 
 @app.post("/api/auth/logout", tags=["Authentification"])
@@ -870,7 +1070,7 @@ async def logout(request: Request):
     """Déconnexion d'un utilisateur."""
     session_token = request.cookies.get("session_token")
     if session_token:
-        delete_session(session_token)
+        await delete_session(session_token)
     
     response = JSONResponse({"message": "Déconnexion réussie"})
     response.delete_cookie("session_token")
@@ -878,9 +1078,8 @@ async def logout(request: Request):
 
 
 @app.get("/api/auth/me", tags=["Authentification"])
-async def get_current_user_info(request: Request):
+async def get_current_user_info(user: Optional[Dict] = Depends(get_current_user)):
     """Récupère les informations de l'utilisateur connecté."""
-    user = await get_current_user(request)
     if not user:
         raise HTTPException(status_code=401, detail="Non authentifié")
     return user
@@ -889,162 +1088,125 @@ async def get_current_user_info(request: Request):
 # ==================== ENDPOINTS UTILISATEUR ====================
 
 @app.get("/api/search-history", tags=["Utilisateur"])
-async def get_search_history(request: Request, limit: int = Query(50, ge=1, le=100)):
+async def get_search_history(limit: int = Query(50, ge=1, le=100), user: Dict = Depends(require_auth)):
     """Récupère l'historique des recherches de l'utilisateur."""
-    user = await require_auth(request)
-    conn = None
     try:
-        conn, cur = get_connection_dict()
-        cur.execute("""
-            SELECT id, query_text, filters, results_count, created_at
-            FROM search_history
-            WHERE user_id = %s
-            ORDER BY created_at DESC
-            LIMIT %s
-        """, (user["id"], limit))
-        
-        history = [dict(row) for row in cur.fetchall()]
+        async with async_connection() as conn:
+            rows = await conn.fetch("""
+                SELECT id, query_text, filters, results_count, created_at
+                FROM search_history
+                WHERE user_id = $1
+                ORDER BY created_at DESC
+                LIMIT $2
+            """, user["id"], limit)
+        
+        history = [dict(row) for row in rows]
         return {"history": history}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
-    finally:
-        if conn:
-            conn.close()
 
 
 @app.post("/api/films/{film_id}/watch", tags=["Utilisateur"])
-async def mark_film_watched(film_id: int, request: Request, 
-                           rating: Optional[int] = Query(None, ge=1, le=5)):
+async def mark_film_watched(film_id: int, rating: Optional[int] = Query(None, ge=1, le=5),
+                           user: Dict = Depends(require_auth)):
     """Marque un film comme visionné."""
-    user = await require_auth(request)
-    conn = None
     try:
-        conn, cur = get_connection_dict()
-        
-        # Vérifier que le film existe
-        cur.execute("SELECT id FROM films WHERE id = %s", (film_id,))
-        if not cur.fetchone():
-            raise HTTPException(status_code=404, detail="Film non trouvé")
-        
-        cur.execute("""
-            INSERT INTO watched_films (user_id, film_id, rating)
-            VALUES (%s, %s, %s)
-            ON CONFLICT (user_id, film_id) DO UPDATE SET
-                watched_at = CURRENT_TIMESTAMP,
-                rating = EXCLUDED.rating
-        """, (user["id"], film_id, rating))
+        async with async_connection() as conn:
+            # Vérifier que le film existe
+            if not await conn.fetchval("SELECT id FROM films WHERE id = $1", film_id):
+                raise HTTPException(status_code=404, detail="Film non trouvé")
+            
+            await conn.execute("""
+                INSERT INTO watched_films (user_id, film_id, rating)
+                VALUES ($1, $2, $3)
+                ON CONFLICT (user_id, film_id) DO UPDATE SET
+                    watched_at = CURRENT_TIMESTAMP,
+                    rating = EXCLUDED.rating
+            """, user["id"], film_id, rating)
         
-        conn.commit()
         return {"message": "Film marqué comme visionné"}
     except HTTPException:
         raise
     except Exception as e:
-        if conn:
-            conn.rollback()
         raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
-    finally:
-        if conn:
-            conn.close()
 
 
 @app.get("/api/watched-films", tags=["Utilisateur"])
-async def get_watched_films(request: Request, limit: int = Query(50, ge=1, le=100)):
+async def get_watched_films(limit: int = Query(50, ge=1, le=100), user: Dict = Depends(require_auth)):
     """Récupère les films visionnés par l'utilisateur."""
-    user = await require_auth(request)
-    conn = None
     try:
-        conn, cur = get_connection_dict()
-        cur.execute("""
-            SELECT wf.film_id, wf.watched_at, wf.rating,
-                   f.title, f.year, f.genres
-            FROM watched_films wf
-            JOIN films f ON f.id = wf.film_id
-            WHERE wf.user_id = %s
-            ORDER BY wf.watched_at DESC
-            LIMIT %s
-        """, (user["id"], limit))
-        
-        films = [dict(row) for row in cur.fetchall()]
+        async with async_connection() as conn:
+            rows = await conn.fetch("""
+                SELECT wf.film_id, wf.watched_at, wf.rating,
+                       f.title, f.year, f.genres
+                FROM watched_films wf
+                JOIN films f ON f.id = wf.film_id
+                WHERE wf.user_id = $1
+                ORDER BY wf.watched_at DESC
+                LIMIT $2
+            """, user["id"], limit)
+        
+        films = [dict(row) for row in rows]
         return {"films": films}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
-    finally:
-        if conn:
-            conn.close()
 
 
 # ==================== ENDPOINTS ADMIN ====================
 
 @app.get("/api/admin/dashboard", tags=["Admin"])
-async def get_admin_dashboard(request: Request):
+async def get_admin_dashboard(admin: Dict = Depends(require_admin)):
     """Tableau de bord admin avec KPI et statistiques."""
-    admin = await require_admin(request)
-    conn = None
     try:
-        conn, cur = get_connection_dict()
-        
-        # KPI
-        cur.execute("SELECT COUNT(*) as total FROM users")
-        total_users = cur.fetchone()["total"]
-        
-        cur.execute("SELECT COUNT(*) as total FROM users WHERE role = 'admin'")
-        total_admins = cur.fetchone()["total"]
-        
-        cur.execute("SELECT COUNT(*) as total FROM user_sessions WHERE is_active = TRUE")
-        active_sessions = cur.fetchone()["total"]
-        
-        cur.execute("SELECT COUNT(*) as total FROM search_history")
-        total_searches = cur.fetchone()["total"]
-        
-        cur.execute("SELECT COUNT(*) as total FROM watched_films")
-        total_watched = cur.fetchone()["total"]
-        
-        # Utilisateurs actifs aujourd'hui
-        cur.execute("""
-            SELECT COUNT(DISTINCT user_id) as total
-            FROM user_sessions
-            WHERE created_at >= CURRENT_DATE AND is_active = TRUE
-        """)
-        active_today = cur.fetchone()["total"]
-        
-        # Recherches aujourd'hui
-        cur.execute("""
-            SELECT COUNT(*) as total
-            FROM search_history
-            WHERE created_at >= CURRENT_DATE
-        """)
-        searches_today = cur.fetchone()["total"]
-        
-        # Top genres recherchés
-        cur.execute("""
-            SELECT unnest(filters->'genres') as genre, COUNT(*) as count
-            FROM search_history
-            WHERE filters->'genres' IS NOT NULL
-            GROUP BY genre
-            ORDER BY count DESC
-            LIMIT 10
-        """)
-        top_genres = [dict(row) for row in cur.fetchall()]
-        
-        # Utilisateurs par jour (7 derniers jours)
-        cur.execute("""
-            SELECT DATE(created_at) as date, COUNT(*) as count
-            FROM users
-            WHERE created_at >= CURRENT_DATE - INTERVAL '7 days'
-            GROUP BY DATE(created_at)
-            ORDER BY date
-        """)
-        users_by_day = [dict(row) for row in cur.fetchall()]
-        
-        # Recherches par jour (7 derniers jours)
-        cur.execute("""
-            SELECT DATE(created_at) as date, COUNT(*) as count
-            FROM search_history
-            WHERE created_at >= CURRENT_DATE - INTERVAL '7 days'
-            GROUP BY DATE(created_at)
-            ORDER BY date
-        """)
-        searches_by_day = [dict(row) for row in cur.fetchall()]
+        async with async_connection() as conn:
+            # KPI
+            total_users = await conn.fetchval("SELECT COUNT(*) FROM users")
+            total_admins = await conn.fetchval("SELECT COUNT(*) FROM users WHERE role = 'admin'")
+            active_sessions = await conn.fetchval("SELECT COUNT(*) FROM user_sessions WHERE is_active = TRUE")
+            total_searches = await conn.fetchval("SELECT COUNT(*) FROM search_history")
+            total_watched = await conn.fetchval("SELECT COUNT(*) FROM watched_films")
+            
+            # Utilisateurs actifs aujourd'hui
+            active_today = await conn.fetchval("""
+                SELECT COUNT(DISTINCT user_id)
+                FROM user_sessions
+                WHERE created_at >= CURRENT_DATE AND is_active = TRUE
+            """)
+            
+            # Recherches aujourd'hui
+            searches_today = await conn.fetchval("""
+                SELECT COUNT(*)
+                FROM search_history
+                WHERE created_at >= CURRENT_DATE
+            """)
+            
+            # Top genres recherchés
+            top_genres = [dict(row) for row in await conn.fetch("""
+                SELECT unnest(filters->'genres') as genre, COUNT(*) as count
+                FROM search_history
+                WHERE filters->'genres' IS NOT NULL
+                GROUP BY genre
+                ORDER BY count DESC
+                LIMIT 10
+            """)]
+            
+            # Utilisateurs par jour (7 derniers jours)
+            users_by_day = [dict(row) for row in await conn.fetch("""
+                SELECT DATE(created_at) as date, COUNT(*) as count
+                FROM users
+                WHERE created_at >= CURRENT_DATE - INTERVAL '7 days'
+                GROUP BY DATE(created_at)
+                ORDER BY date
+            """)]
+            
+            # Recherches par jour (7 derniers jours)
+            searches_by_day = [dict(row) for row in await conn.fetch("""
+                SELECT DATE(created_at) as date, COUNT(*) as count
+                FROM search_history
+                WHERE created_at >= CURRENT_DATE - INTERVAL '7 days'
+                GROUP BY DATE(created_at)
+                ORDER BY date
+            """)]
         
         return {
             "kpi": {
@@ -1062,283 +1224,105 @@ async def get_admin_dashboard(request: Request):
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
-    finally:
-        if conn:
-            conn.close()
 
 
 @app.get("/api/admin/users", tags=["Admin"])
-async def get_all_users(request: Request, limit: int = Query(100, ge=1, le=500)):
+async def get_all_users(limit: int = Query(100, ge=1, le=500), admin: Dict = Depends(require_admin)):
     """Récupère tous les utilisateurs (admin seulement)."""
-    admin = await require_admin(request)
-    conn = None
     try:
-        conn, cur = get_connection_dict()
-        cur.execute("""
-            SELECT id, username, email, role, gender, avatar_url, 
-                   is_active, is_blocked, created_at, last_login
-            FROM users
-            ORDER BY created_at DESC
-            LIMIT %s
-        """, (limit,))
-        
-        users = [dict(row) for row in cur.fetchall()]
+        async with async_connection() as conn:
+            rows = await conn.fetch("""
+                SELECT id, username, email, role, gender, avatar_url, 
+                       is_active, is_blocked, created_at, last_login
+                FROM users
+                ORDER BY created_at DESC
+                LIMIT $1
+            """, limit)
+        
+        users = [dict(row) for row in rows]
         return {"users": users}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
-    finally:
-        if conn:
-            conn.close()
 
 
 @app.get("/api/admin/sessions", tags=["Admin"])
-async def get_all_sessions(request: Request, limit: int = Query(100, ge=1, le=500)):
+async def get_all_sessions(limit: int = Query(100, ge=1, le=500), admin: Dict = Depends(require_admin)):
     """Récupère toutes les sessions actives (admin seulement)."""
-    admin = await require_admin(request)
-    conn = None
     try:
-        conn, cur = get_connection_dict()
-        cur.execute("""
-            SELECT s.id, s.user_id, u.username, s.ip_address, s.user_agent,
-                   s.created_at, s.expires_at, s.is_active
-            FROM user_sessions s
-            JOIN users u ON u.id = s.user_id
-            WHERE s.is_active = TRUE
-            ORDER BY s.created_at DESC
-            LIMIT %s
-        """, (limit,))
-        
-        sessions = [dict(row) for row in cur.fetchall()]
+        async with async_connection() as conn:
+            rows = await conn.fetch("""
+                SELECT s.id, s.user_id, u.username, s.ip_address, s.user_agent,
+                       s.created_at, s.expires_at, s.is_active
+                FROM user_sessions s
+                JOIN users u ON u.id = s.user_id
+                WHERE s.is_active = TRUE
+                ORDER BY s.created_at DESC
+                LIMIT $1
+            """, limit)
+        
+        sessions = [dict(row) for row in rows]
         return {"sessions": sessions}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
-    finally:
-        if conn:
-            conn.close()
 
 
 @app.get("/api/admin/search-history", tags=["Admin"])
-async def get_all_search_history(request: Request, limit: int = Query(100, ge=1, le=500)):
+async def get_all_search_history(limit: int = Query(100, ge=1, le=500), admin: Dict = Depends(require_admin)):
     """Récupère tout l'historique de recherche (admin seulement)."""
-    admin = await require_admin(request)
-    conn = None
     try:
-        conn, cur = get_connection_dict()
-        cur.execute("""
-            SELECT sh.id, sh.user_id, u.username, sh.query_text, 
-                   sh.filters, sh.results_count, sh.created_at
-            FROM search_history sh
-            JOIN users u ON u.id = sh.user_id
-            ORDER BY sh.created_at DESC
-            LIMIT %s
-        """, (limit,))
-        
-        history = [dict(row) for row in cur.fetchall()]
+        async with async_connection() as conn:
+            rows = await conn.fetch("""
+                SELECT sh.id, sh.user_id, u.username, sh.query_text, 
+                       sh.filters, sh.results_count, sh.created_at
+                FROM search_history sh
+                JOIN users u ON u.id = sh.user_id
+                ORDER BY sh.created_at DESC
+                LIMIT $1
+            """, limit)
+        
+        history = [dict(row) for row in rows]
         return {"history": history}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
-    finally:
-        if conn:
-            conn.close()
 
 
 @app.post("/api/admin/users/{user_id}/block", tags=["Admin"])
-async def block_user(user_id: int, request: Request):
+async def block_user(user_id: int, admin: Dict = Depends(require_admin)):
     """Bloque un utilisateur (admin seulement)."""
-    admin = await require_admin(request)
-    conn = None
     try:
-        conn, cur = get_connection_dict()
-        cur.execute("UPDATE users SET is_blocked = TRUE WHERE id = %s", (user_id,))
-        conn.commit()
+        async with async_connection() as conn:
+            await conn.execute("UPDATE users SET is_blocked = TRUE WHERE id = $1", user_id)
+        # Ses sessions en cache ne doivent plus l'authentifier
+        session_cache.invalidate_user(user_id)
         return {"message": "Utilisateur bloqué"}
     except Exception as e:
-        if conn:
-            conn.rollback()
         raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
-    finally:
-        if conn:
-            conn.close()
 
 
 @app.post("/api/admin/users/{user_id}/unblock", tags=["Admin"])
-async def unblock_user(user_id: int, request: Request):
+async def unblock_user(user_id: int, admin: Dict = Depends(require_admin)):
     """Débloque un utilisateur (admin seulement)."""
-    admin = await require_admin(request)
-    conn = None
     try:
-        conn, cur = get_connection_dict()
-        cur.execute("UPDATE users SET is_blocked = FALSE WHERE id = %s", (user_id,))
-        conn.commit()
+        async with async_connection() as conn:
+            await conn.execute("UPDATE users SET is_blocked = FALSE WHERE id = $1", user_id)
         return {"message": "Utilisateur débloqué"}
     except Exception as e:
-        if conn:
-            conn.rollback()
         raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
-    finally:
-        if conn:
-            conn.close()
 
 
 @app.delete("/api/admin/users/{user_id}", tags=["Admin"])
-async def delete_user(user_id: int, request: Request):
+async def delete_user(user_id: int, admin: Dict = Depends(require_admin)):
     """Supprime un utilisateur (admin seulement)."""
-    admin = await require_admin(request)
     if user_id == admin["id"]:
         raise HTTPException(status_code=400, detail="Vous ne pouvez pas supprimer votre propre compte")
     
-    conn = None
     try:
-        conn, cur = get_connection_dict()
-        cur.execute("DELETE FROM users WHERE id = %s", (user_id,))
-        conn.commit()
+        async with async_connection() as conn:
+            await conn.execute("DELETE FROM users WHERE id = $1", user_id)
+        session_cache.invalidate_user(user_id)
         return {"message": "Utilisateur supprimé"}
     except Exception as e:
-        if conn:
-            conn.rollback()
         raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
-    finally:
-        if conn:
-            conn.close()
-
-
-# Mise à jour de l'endpoint de recherche pour enregistrer l'historique
-@app.get("/search", response_model=RecommendationResponse, tags=["Recherche"])
-async def search(
-    q: str = Query(..., description="Requête textuelle de recherche"),
-    k: int = Query(10, ge=1, le=100, description="Nombre de résultats"),
-    genres: Optional[str] = Query(None, description="Genres requis, séparés par des virgules"),
-    min_year: Optional[int] = Query(None, description="Année minimum"),
-    max_year: Optional[int] = Query(None, description="Année maximum"),
-    request: Request = None
-):
-    """
-    Recherche sémantique de films à partir d'une requête textuelle.
-    
-    La requête est convertie en embedding et comparée avec les embeddings des films.
-    """
-    conn = None
-    try:
-        # Générer l'embedding de la requête
-        model = get_model()
-        query_embedding = model.encode([q], normalize_embeddings=True)[0]
-        vec_str = "[" + ",".join(f"{x:.8f}" for x in query_embedding.tolist()) + "]"
-        
-        conn, cur = get_connection_dict()
-        
-        # Construire la requête avec filtres
-        filters = []
-        filter_params = []
-        
-        if genres:
-            genres_list = [g.strip() for g in genres.split(",")]
-            for genre in genres_list:
-                filters.append("%s = ANY(f.genres)")
-                filter_params.append(genre)
-        
-        if min_year:
-            filters.append("f.year >= %s")
-            filter_params.append(min_year)
-        
-        if max_year:
-            filters.append("f.year <= %s")
-            filter_params.append(max_year)
-        
-        filter_clause = " AND " + " AND ".join(filters) if filters else ""
-        
-        # Ordre des paramètres : vec_str (SELECT), filtres, vec_str (ORDER BY), k (LIMIT)
-        params = [vec_str] + filter_params + [vec_str, k]
-        
-        query = f"""
-        SELECT 
-            f.id, f.title, f.year, f.genres, f."cast", f.synopsis, f.meta,
-            (fe.embedding <=> %s::vector) AS distance
-        FROM film_embeddings fe
-        JOIN films f ON f.id = fe.film_id
-        WHERE 1=1
-        {filter_clause}
-        ORDER BY fe.embedding <=> %s::vector
-        LIMIT %s
-        """
-        
-        cur.execute(query, params)
-        results = cur.fetchall()
-        
-        recommendations = []
-        for row in results:
-            recommendations.append(
-                Recommendation(
-                    film=Film(
-                        id=row["id"],
-                        title=row["title"],
-                        year=row["year"],
-                        genres=row["genres"],
-                        cast=row["cast"],
-                        synopsis=row["synopsis"],
-                        meta=row["meta"]
-                    ),
-                    distance=float(row["distance"])
-                )
-            )
-        
-        # Enregistrer dans l'historique si l'utilisateur est connecté
-        try:
-            user = await get_current_user(request)
-            if user:
-                import json
-                filters_dict = {}
-                if genres:
-                    filters_dict["genres"] = genres.split(",")
-                if min_year:
-                    filters_dict["min_year"] = min_year
-                if max_year:
-                    filters_dict["max_year"] = max_year
-                
-                cur.execute("""
-                    INSERT INTO search_history (user_id, query_text, filters, results_count)
-                    VALUES (%s, %s, %s, %s)
-                """, (user["id"], q, json.dumps(filters_dict), len(recommendations)))
-                conn.commit()
-        except:
-            pass  # Ignorer les erreurs d'historique
-        
-        return RecommendationResponse(
-            query_text=q,
-            recommendations=recommendations,
-            count=len(recommendations)
-        )
-        
-    except HTTPException:
-        raise
-    except psycopg2.OperationalError as e:
-        error_msg = str(e).replace('\n', ' ')
-        raise HTTPException(
-            status_code=503,
-            detail=f"Erreur de connexion à PostgreSQL: {error_msg}"
-        )
-    except OSError as e:
-        if "1455" in str(e) or "paging file" in str(e).lower() or "fichier de pagination" in str(e).lower():
-            error_msg = (
-                "Erreur de mémoire insuffisante. "
-                "Le système manque de mémoire virtuelle. "
-                "Solutions: augmentez le fichier de pagination Windows, "
-                "fermez d'autres applications, ou redémarrez votre ordinateur."
-            )
-            raise HTTPException(status_code=503, detail=error_msg)
-        else:
-            raise HTTPException(
-                status_code=500,
-                detail=f"Erreur système: {str(e)}"
-            )
-    except Exception as e:
-        error_msg = str(e)
-        raise HTTPException(
-            status_code=500,
-            detail=f"Erreur lors de la recherche: {error_msg}"
-        )
-    finally:
-        if conn:
-            conn.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,127 @@
+"""
+Backends d'inférence de l'encodeur de requêtes.
+
+QUERY_ENCODER_BACKEND choisit le backend chargé par get_model() :
+- "torch" : SentenceTransformer fp32 (comportement historique) ;
+- "onnx" : modèle exporté et exécuté par ONNX Runtime (fp32) ;
+- "onnx-int8" : même modèle, poids quantifiés dynamiquement en int8.
+
+Les backends ONNX n'importent ni torch ni sentence_transformers : ils
+n'ont besoin que de onnxruntime et tokenizers, ce qui réduit la mémoire de
+chaque worker de l'API. Les modèles sont produits par
+scripts/export_onnx_encoder.py (qui vérifie aussi la parité avec fp32).
+"""
+import json
+import os
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+
+QUERY_ENCODER_BACKEND = os.getenv("QUERY_ENCODER_BACKEND", "torch")
+# Dossier des modèles exportés (vide = models/onnx/<nom du modèle>)
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", "")
+# Threads ONNX Runtime par inférence (0 = choix d'ONNX Runtime)
+ONNX_INTRA_OP_THREADS = int(os.getenv("ONNX_INTRA_OP_THREADS", "0"))
+
+ONNX_BACKENDS = {"onnx": "model.onnx", "onnx-int8": "model_int8.onnx"}
+ENCODER_CONFIG_FILE = "encoder_config.json"
+
+
+def default_onnx_dir(model_name: str) -> Path:
+    """Dossier d'export par défaut d'un modèle (models/onnx/<organisation>__<modèle>)."""
+    return Path(__file__).parent.parent / "models" / "onnx" / model_name.replace("/", "__")
+
+
+class OnnxQueryEncoder:
+    """
+    Encodeur ONNX Runtime compatible avec SentenceTransformer.encode.
+
+    Reproduit le pipeline sentence-transformers : tokenisation (troncature à
+    max_seq_length), transformer, pooling (moyenne ou CLS), normalisation L2.
+
+    Args:
+        model_dir: dossier produit par scripts/export_onnx_encoder.py
+        backend: "onnx" ou "onnx-int8"
+        intra_op_threads: threads ONNX Runtime (0 = défaut)
+    """
+
+    def __init__(self, model_dir: Union[str, Path], backend: str = "onnx",
+                 intra_op_threads: int = ONNX_INTRA_OP_THREADS):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        if backend not in ONNX_BACKENDS:
+            raise ValueError(f"Backend ONNX inconnu: {backend} ({', '.join(ONNX_BACKENDS)})")
+        model_dir = Path(model_dir)
+        model_path = model_dir / ONNX_BACKENDS[backend]
+        if not model_path.exists():
+            raise FileNotFoundError(
+                f"Modèle ONNX introuvable: {model_path}. "
+                f"Exportez-le avec: python scripts/export_onnx_encoder.py"
+            )
+
+        with open(model_dir / ENCODER_CONFIG_FILE, encoding="utf-8") as f:
+            self.config = json.load(f)
+        self.backend = backend
+        self.model_path = str(model_path)
+        self.max_seq_length = self.config["max_seq_length"]
+        self.pooling = self.config["pooling"]
+
+        self.tokenizer = Tokenizer.from_file(str(model_dir / "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=self.max_seq_length)
+        self.tokenizer.enable_padding(pad_id=self.config["pad_token_id"], pad_token=self.config["pad_token"])
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if intra_op_threads > 0:
+            options.intra_op_num_threads = intra_op_threads
+        self.session = ort.InferenceSession(self.model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {node.name for node in self.session.get_inputs()}
+
+    def _encode_batch(self, texts: List[str], normalize: bool) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.zeros_like(input_ids)
+
+        hidden = self.session.run(None, feeds)[0]
+        if self.pooling == "cls":
+            pooled = hidden[:, 0]
+        else:
+            mask = attention_mask[..., None].astype(hidden.dtype)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+
+        if normalize:
+            norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+            pooled = pooled / np.clip(norms, 1e-12, None)
+        return pooled.astype(np.float32)
+
+    def encode(self, sentences: Union[str, List[str]], batch_size: int = 32,
+               normalize_embeddings: bool = False, show_progress_bar: bool = False, **kwargs) -> np.ndarray:
+        """Même signature utile que SentenceTransformer.encode (tableau NumPy en sortie)."""
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        embeddings = np.vstack([
+            self._encode_batch(texts[start:start + batch_size], normalize_embeddings)
+            for start in range(0, len(texts), batch_size)
+        ])
+        return embeddings[0] if single else embeddings
+
+    def stats(self) -> Dict:
+        return {
+            "backend": self.backend,
+            "model_path": self.model_path,
+            "max_seq_length": self.max_seq_length,
+            "pooling": self.pooling,
+        }
+
+
+def load_onnx_encoder(model_name: str, backend: str = QUERY_ENCODER_BACKEND,
+                      model_dir: Optional[str] = ONNX_MODEL_DIR) -> OnnxQueryEncoder:
+    """Charge l'encodeur ONNX du modèle (dossier ONNX_MODEL_DIR ou dossier par défaut)."""
+    return OnnxQueryEncoder(model_dir or default_onnx_dir(model_name), backend=backend)
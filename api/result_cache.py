@@ -0,0 +1,267 @@
+"""
+Cache des réponses complètes de /search et /recommend/by-film.
+
+Les résultats sont déterministes tant que film_embeddings ne change pas : la
+clé de cache contient les paramètres canonicalisés et la génération courante
+des embeddings (config/generation.py). Après une reconstruction, la génération
+change et les anciennes entrées ne sont plus jamais lues.
+
+Seule film_embeddings fait changer la génération. Les modifications qui ne
+touchent que d'autres tables restent servies depuis le cache jusqu'à
+RESULT_CACHE_TTL : champs de films (titre, synopsis, genres/année recopiés
+par generate_embeddings sans réencodage, films.search_document des modes
+lexical et hybride), ou film_neighbors recalculée par compute_neighbors pour
+la même génération. Le TTL borne donc leur retard ; la génération n'est pas
+incrémentée dans ces cas, car film_neighbors et le moteur en mémoire y sont
+rattachés et seraient invalidés sans raison.
+
+Backends disponibles (RESULT_CACHE_BACKEND) : "memory", "sqlite" ou "none".
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import asyncpg
+
+from api.cache import TTLCache, normalize_query
+from config.async_database import async_connection
+from config.generation import GET_GENERATION_SQL
+
+RESULT_CACHE_BACKEND = os.getenv("RESULT_CACHE_BACKEND", "memory")
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "2048"))
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", "600"))
+RESULT_CACHE_PATH = os.getenv("RESULT_CACHE_PATH", "cache/results.sqlite")
+# Intervalle minimal entre deux lectures de la génération des embeddings
+GENERATION_POLL_SECONDS = float(os.getenv("EMBEDDINGS_GENERATION_POLL_SECONDS", "5"))
+
+
+class MemoryResultBackend:
+    """Backend en mémoire (LRU + TTL)."""
+
+    name = "memory"
+    # Appels instantanés : exécutés directement sur la boucle d'événements
+    blocking = False
+
+    def __init__(self, max_size: int = RESULT_CACHE_SIZE, ttl_seconds: float = RESULT_CACHE_TTL):
+        self._cache = TTLCache(max_size, ttl_seconds)
+
+    def get(self, key: str) -> Optional[Any]:
+        return self._cache.get(key)
+
+    def set(self, key: str, value: Any, generation: int):
+        self._cache.set(key, value)
+
+    def purge(self, current_generation: int):
+        # Les clés des anciennes générations ne sont plus lues ; le LRU les évince.
+        pass
+
+    def close(self):
+        self._cache.clear()
+
+    def stats(self) -> Dict:
+        return self._cache.stats()
+
+
+class SQLiteResultBackend:
+    """Backend fichier (SQLite) : le cache survit aux redémarrages et se partage entre workers."""
+
+    name = "sqlite"
+    # Lectures, commits et purges SQLite : exécutés dans un thread par ResultCache
+    blocking = True
+
+    def __init__(self, path: str = RESULT_CACHE_PATH, ttl_seconds: float = RESULT_CACHE_TTL):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS result_cache (
+                key TEXT PRIMARY KEY,
+                generation INTEGER NOT NULL,
+                value TEXT NOT NULL,
+                expires_at REAL
+            )
+        """)
+        self._db.commit()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value, expires_at FROM result_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or (row[1] is not None and row[1] <= time.time()):
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Any, generation: int):
+        expires_at = time.time() + self.ttl_seconds if self.ttl_seconds > 0 else None
+        payload = json.dumps(value)
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO result_cache (key, generation, value, expires_at) "
+                "VALUES (?, ?, ?, ?)",
+                (key, generation, payload, expires_at)
+            )
+            self._db.commit()
+
+    def purge(self, current_generation: int):
+        """Supprime les entrées des générations précédentes et les entrées expirées."""
+        with self._lock:
+            self._db.execute(
+                "DELETE FROM result_cache WHERE generation <> ? OR expires_at <= ?",
+                (current_generation, time.time())
+            )
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            size = self._db.execute("SELECT COUNT(*) FROM result_cache").fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                "size": size,
+                "path": self.path,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+def make_result_backend(kind: str = RESULT_CACHE_BACKEND):
+    """Construit le backend demandé (None si le cache est désactivé)."""
+    kind = (kind or "none").lower()
+    if kind == "memory":
+        return MemoryResultBackend()
+    if kind == "sqlite":
+        return SQLiteResultBackend()
+    if kind == "none":
+        return None
+    raise ValueError(f"RESULT_CACHE_BACKEND inconnu: {kind} (memory, sqlite ou none)")
+
+
+class GenerationTracker:
+    """Lit la génération des embeddings en base, au plus une fois toutes les `poll_seconds`."""
+
+    def __init__(self, poll_seconds: float = GENERATION_POLL_SECONDS):
+        self.poll_seconds = poll_seconds
+        self.generation = None
+        self._checked_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def current(self) -> int:
+        if self.generation is not None and time.monotonic() - self._checked_at < self.poll_seconds:
+            return self.generation
+        async with self._lock:
+            if self.generation is None or time.monotonic() - self._checked_at >= self.poll_seconds:
+                try:
+                    async with async_connection() as conn:
+                        generation = await conn.fetchval(GET_GENERATION_SQL)
+                except asyncpg.UndefinedTableError:
+                    generation = 0
+                self.generation = generation or 0
+                self._checked_at = time.monotonic()
+        return self.generation
+
+
+def _canonical_genres(genres: Optional[str]) -> Optional[list]:
+    """Liste de genres triée et dédoublonnée (l'ordre n'a pas d'effet sur les filtres)."""
+    if not genres:
+        return None
+    return sorted({g.strip() for g in genres.split(",") if g.strip()}) or None
+
+
+def canonical_params(**params) -> Dict:
+    """
+    Canonicalise les paramètres d'une requête pour la clé de cache.
+
+    - `q` est normalisé comme pour le cache d'embeddings ;
+    - les listes de genres (`genres`, `exclude_genres`) sont triées et dédoublonnées ;
+    - les paramètres à None sont ignorés.
+    """
+    canonical = {}
+    for name, value in params.items():
+        if name == "q" and value is not None:
+            value = normalize_query(value)
+        elif name in ("genres", "exclude_genres"):
+            value = _canonical_genres(value)
+        if value is not None:
+            canonical[name] = value
+    return canonical
+
+
+class ResultCache:
+    """Cache de réponses versionné par la génération des embeddings."""
+
+    def __init__(self, backend=None, tracker: Optional[GenerationTracker] = None):
+        self.backend = backend
+        self.tracker = tracker or GenerationTracker()
+        self._last_generation = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.backend is not None
+
+    async def _call(self, method, *args):
+        """Appelle le backend, dans un thread s'il fait des entrées-sorties bloquantes."""
+        if self.backend.blocking:
+            return await asyncio.to_thread(method, *args)
+        return method(*args)
+
+    async def _generation(self) -> int:
+        generation = await self.tracker.current()
+        if generation != self._last_generation:
+            previous, self._last_generation = self._last_generation, generation
+            if previous is not None:
+                await self._call(self.backend.purge, generation)
+        return generation
+
+    @staticmethod
+    def make_key(endpoint: str, generation: int, params: Dict) -> str:
+        return json.dumps(
+            {"endpoint": endpoint, "generation": generation, "params": params},
+            sort_keys=True, separators=(",", ":")
+        )
+
+    async def get(self, endpoint: str, **params) -> Optional[Dict]:
+        """Retourne la réponse en cache (dict JSON) ou None."""
+        if not self.enabled:
+            return None
+        generation = await self._generation()
+        return await self._call(self.backend.get, self.make_key(endpoint, generation, canonical_params(**params)))
+
+    async def set(self, endpoint: str, value: Dict, **params):
+        """Enregistre une réponse (dict JSON) pour ces paramètres."""
+        if not self.enabled:
+            return
+        generation = await self._generation()
+        await self._call(self.backend.set, self.make_key(endpoint, generation, canonical_params(**params)),
+                         value, generation)
+
+    def close(self):
+        if self.enabled:
+            self.backend.close()
+
+    def stats(self) -> Optional[Dict]:
+        if not self.enabled:
+            return None
+        stats = self.backend.stats()
+        stats.update({
+            "backend": self.backend.name,
+            "embeddings_generation": self.tracker.generation,
+        })
+        return stats
@@ -0,0 +1,716 @@
+"""
+Moteurs de recherche vectorielle utilisés par /search et /recommend/by-film.
+
+- PgvectorSearchEngine : requêtes SQL pgvector (comportement historique).
+- InMemorySearchEngine : tous les embeddings dans une matrice float32 contiguë ;
+  top-k cosinus exact par produit matriciel (BLAS) + argpartition, ou graphe
+  HNSW optionnel (hnswlib). Les filtres genre/année utilisent des masques
+  booléens précalculés. La matrice est rechargée quand la génération des
+  embeddings change.
+
+Le moteur est choisi par SEARCH_BACKEND ("pgvector" ou "memory"). Avec
+EMBEDDING_PRECISION=half ou binary, PgvectorSearchEngine interroge l'index
+réduit correspondant puis reclasse les candidats sur les vecteurs complets
+(voir config/precision.py).
+
+La largeur de recherche (hnsw.ef_search, ivfflat.probes) est fixée par requête
+avec SET LOCAL : elle augmente quand les filtres sont sélectifs (estimation à
+partir des effectifs par genre et par année, mis en cache) et selon le
+paramètre `quality` (fast, balanced, high). Les requêtes filtrées utilisent
+l'index partiel (genre, décennie) le plus petit qui convient, ou un parcours
+exact quand le sous-ensemble filtré est petit.
+"""
+import asyncio
+import math
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+import asyncpg
+import numpy as np
+
+from config.async_database import async_connection
+from config.precision import (
+    EMBEDDING_PRECISION, EXACT_SEARCH_MAX_ROWS, candidate_order_sql, check_precision, oversample,
+    partial_index_predicate,
+)
+
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "pgvector")
+# Index du moteur mémoire : "exact" (produit matriciel) ou "hnsw" (nécessite hnswlib)
+MEMORY_INDEX = os.getenv("MEMORY_INDEX", "exact")
+HNSW_M = int(os.getenv("MEMORY_HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("MEMORY_HNSW_EF_CONSTRUCTION", "200"))
+HNSW_EF_SEARCH = int(os.getenv("MEMORY_HNSW_EF_SEARCH", "100"))
+
+# Largeur de recherche pgvector sans filtre, et bornes
+PGVECTOR_EF_SEARCH = int(os.getenv("PGVECTOR_EF_SEARCH", "40"))
+PGVECTOR_EF_SEARCH_MAX = int(os.getenv("PGVECTOR_EF_SEARCH_MAX", "1000"))
+PGVECTOR_PROBES = int(os.getenv("PGVECTOR_PROBES", "10"))
+PGVECTOR_PROBES_MAX = int(os.getenv("PGVECTOR_PROBES_MAX", "200"))
+# Durée de validité des statistiques de sélectivité et de la liste des index partiels (secondes)
+SELECTIVITY_TTL = int(os.getenv("SELECTIVITY_TTL", "600"))
+
+# Multiplicateur de la largeur de recherche selon `quality`
+QUALITY_FACTORS = {"fast": 0.5, "balanced": 1.0, "high": 4.0}
+# Sélectivité minimale prise en compte (au-delà, la largeur atteint son maximum)
+MIN_SELECTIVITY = 0.001
+
+FILM_COLUMNS = 'f.id, f.title, f.year, f.genres, f."cast", f.synopsis, f.meta'
+
+
+def search_breadth(base: int, limit: int, selectivity: float = 1.0,
+                   quality: Optional[str] = None, maximum: Optional[int] = None) -> int:
+    """
+    Largeur de recherche d'un index ANN pour une requête.
+
+    max(base, limit) x facteur de qualité / sélectivité des filtres : si les
+    filtres ne gardent que 5 % des films, l'index doit parcourir 20 fois plus
+    de candidats pour en trouver `limit` qui passent. Bornée par `maximum`.
+    """
+    factor = QUALITY_FACTORS[quality or "balanced"]
+    selectivity = min(1.0, max(selectivity, MIN_SELECTIVITY))
+    breadth = max(limit, math.ceil(max(base, limit) * factor / selectivity))
+    return min(breadth, maximum) if maximum else breadth
+
+
+class FilterSelectivity:
+    """
+    Estimation de la fraction des films retenue par des filtres genre/année.
+
+    Les effectifs par genre et par année des films ayant un embedding sont lus
+    en une requête et gardés SELECTIVITY_TTL secondes. Les filtres sont
+    supposés indépendants.
+    """
+
+    def __init__(self, ttl_seconds: int = SELECTIVITY_TTL):
+        self.ttl_seconds = ttl_seconds
+        self.total = 0
+        self.genre_counts = {}
+        self.year_counts = {}
+        self.loaded_at = None
+        self._lock = asyncio.Lock()
+
+    async def ensure_loaded(self, conn):
+        if self.loaded_at is not None and time.monotonic() - self.loaded_at < self.ttl_seconds:
+            return
+        async with self._lock:
+            if self.loaded_at is not None and time.monotonic() - self.loaded_at < self.ttl_seconds:
+                return
+            total = await conn.fetchval("SELECT COUNT(*) FROM film_embeddings")
+            genre_rows = await conn.fetch("""
+                SELECT g.genre, COUNT(*) AS n
+                FROM film_embeddings fe
+                JOIN films f ON f.id = fe.film_id
+                CROSS JOIN LATERAL unnest(f.genres) AS g(genre)
+                GROUP BY g.genre
+            """)
+            year_rows = await conn.fetch("""
+                SELECT f.year, COUNT(*) AS n
+                FROM film_embeddings fe
+                JOIN films f ON f.id = fe.film_id
+                WHERE f.year IS NOT NULL
+                GROUP BY f.year
+            """)
+            self.total = total or 0
+            self.genre_counts = {row["genre"]: row["n"] for row in genre_rows}
+            self.year_counts = {row["year"]: row["n"] for row in year_rows}
+            self.loaded_at = time.monotonic()
+
+    def estimate(self, genres: Optional[str] = None, exclude_genres: Optional[str] = None,
+                 min_year: Optional[int] = None, max_year: Optional[int] = None) -> float:
+        """Fraction estimée des films qui passent les filtres (1.0 sans statistiques)."""
+        if not self.total:
+            return 1.0
+        fraction = 1.0
+        if genres:
+            for genre in [g.strip() for g in genres.split(",")]:
+                fraction *= self.genre_counts.get(genre, 0) / self.total
+        if exclude_genres:
+            for genre in [g.strip() for g in exclude_genres.split(",")]:
+                fraction *= 1.0 - self.genre_counts.get(genre, 0) / self.total
+        if min_year or max_year:
+            in_range = sum(
+                n for year, n in self.year_counts.items()
+                if (not min_year or year >= min_year) and (not max_year or year <= max_year)
+            )
+            fraction *= in_range / self.total
+        return fraction
+
+    def stats(self) -> Dict:
+        return {
+            "films": self.total,
+            "genres": len(self.genre_counts),
+            "age_seconds": round(time.monotonic() - self.loaded_at, 1) if self.loaded_at is not None else None,
+        }
+
+
+def build_film_filters(params: list, genres: Optional[str] = None,
+                       exclude_genres: Optional[str] = None,
+                       min_year: Optional[int] = None, max_year: Optional[int] = None) -> str:
+    """
+    Construit la clause de filtrage genres/années (placeholders asyncpg $n).
+
+    Les valeurs sont ajoutées à `params` ; la clause retournée commence par " AND "
+    (chaîne vide sans filtre).
+    """
+    filters = []
+
+    if genres:
+        for genre in [g.strip() for g in genres.split(",")]:
+            params.append(genre)
+            filters.append(f"${len(params)} = ANY(f.genres)")
+
+    if exclude_genres:
+        for genre in [g.strip() for g in exclude_genres.split(",")]:
+            params.append(genre)
+            filters.append(f"NOT (${len(params)} = ANY(f.genres))")
+
+    if min_year:
+        params.append(min_year)
+        filters.append(f"f.year >= ${len(params)}")
+
+    if max_year:
+        params.append(max_year)
+        filters.append(f"f.year <= ${len(params)}")
+
+    return " AND " + " AND ".join(filters) if filters else ""
+
+
+class FilteredIndexPlanner:
+    """
+    Choix de l'index d'une recherche filtrée.
+
+    Les index partiels (genre, décennie) créés par scripts/create_index.py
+    --filtered sont lus dans vector_filter_indexes. Pour une requête, le plus
+    petit index dont le prédicat est impliqué par les filtres est retenu ; si
+    le sous-ensemble filtré est estimé à EXACT_SEARCH_MAX_ROWS films ou moins
+    (config/precision.py), il est parcouru exactement (pas d'ANN).
+    """
+
+    def __init__(self, precision: str, ttl_seconds: int = SELECTIVITY_TTL):
+        self.precision = precision
+        self.ttl_seconds = ttl_seconds
+        self.indexes = {}
+        self.loaded_at = None
+        self.routes = {"global": 0, "genre": 0, "decade": 0, "exact": 0}
+        self._lock = asyncio.Lock()
+
+    async def ensure_loaded(self, conn):
+        if self.loaded_at is not None and time.monotonic() - self.loaded_at < self.ttl_seconds:
+            return
+        async with self._lock:
+            if self.loaded_at is not None and time.monotonic() - self.loaded_at < self.ttl_seconds:
+                return
+            try:
+                rows = await conn.fetch("""
+                    SELECT kind, value, row_count
+                    FROM vector_filter_indexes
+                    WHERE precision = $1
+                """, self.precision)
+            except asyncpg.UndefinedTableError:
+                rows = []
+            self.indexes = {(row["kind"], row["value"]): row["row_count"] for row in rows}
+            self.loaded_at = time.monotonic()
+
+    def plan(self, total: int, selectivity: float, genres: Optional[str] = None,
+             min_year: Optional[int] = None, max_year: Optional[int] = None, filtered: bool = True) -> Dict:
+        """
+        Route d'une requête : "global", "genre", "decade" ou "exact".
+
+        `selectivity` est rapportée à l'index retenu, pour dimensionner ef_search.
+        """
+        if not filtered:
+            return {"route": "global", "predicate": "", "selectivity": 1.0}
+
+        estimated_rows = selectivity * total
+        if total and estimated_rows <= EXACT_SEARCH_MAX_ROWS:
+            return {"route": "exact", "predicate": "", "selectivity": selectivity}
+
+        options = []
+        if genres:
+            for genre in [g.strip() for g in genres.split(",")]:
+                if ("genre", genre) in self.indexes:
+                    options.append(("genre", genre, self.indexes[("genre", genre)]))
+        if min_year and max_year and min_year // 10 == max_year // 10:
+            decade = str(min_year // 10 * 10)
+            if ("decade", decade) in self.indexes:
+                options.append(("decade", decade, self.indexes[("decade", decade)]))
+        if not options:
+            return {"route": "global", "predicate": "", "selectivity": selectivity}
+
+        kind, value, rows = min(options, key=lambda option: option[2])
+        return {
+            "route": kind,
+            "predicate": " AND " + partial_index_predicate(kind, value, alias="fe"),
+            "selectivity": min(1.0, estimated_rows / rows) if rows else selectivity,
+        }
+
+    def stats(self) -> Dict:
+        return {"partial_indexes": len(self.indexes), "routes": dict(self.routes)}
+
+
+class PgvectorSearchEngine:
+    """
+    Recherche par requêtes SQL sur film_embeddings (index HNSW pgvector).
+
+    Args:
+        precision: "full" (index sur les vecteurs complets), "half" ou "binary"
+            (index réduit, candidats reclassés par distance cosinus exacte)
+    """
+
+    name = "pgvector"
+
+    def __init__(self, precision: str = EMBEDDING_PRECISION):
+        self.precision = check_precision(precision)
+        self.oversample = oversample(self.precision)
+        self.selectivity = FilterSelectivity()
+        self.planner = FilteredIndexPlanner(self.precision)
+        self._dimension = None
+
+    def _rerank_query(self, query_vector: str, dim: int, filter_clause: str,
+                      candidates_param: int, k_param: int, exclude_clause: str = "",
+                      with_clause: str = "") -> str:
+        """
+        Requête en deux temps pour les précisions réduites.
+
+        Les candidats sont lus via l'index réduit (filtres appliqués), puis
+        reclassés par `<=>` sur les vecteurs complets.
+        """
+        return f"""
+        WITH {with_clause}candidates AS (
+            SELECT fe.film_id, fe.embedding
+            FROM film_embeddings fe
+            JOIN films f ON f.id = fe.film_id
+            WHERE 1=1
+            {exclude_clause}
+            {filter_clause}
+            ORDER BY {candidate_order_sql(self.precision, dim, query_vector)}
+            LIMIT ${candidates_param}
+        )
+        SELECT
+            {FILM_COLUMNS},
+            (c.embedding <=> {query_vector}) AS distance
+        FROM candidates c
+        JOIN films f ON f.id = c.film_id
+        ORDER BY c.embedding <=> {query_vector}
+        LIMIT ${k_param}
+        """
+
+    @staticmethod
+    def _exact_query(query_vector: str, filter_clause: str, k_param: int,
+                     exclude_clause: str = "", with_clause: str = "") -> str:
+        """
+        Parcours exact du sous-ensemble filtré.
+
+        Le CTE MATERIALIZED empêche PostgreSQL de remplacer le tri par un
+        parcours d'index ANN : toutes les distances du sous-ensemble sont
+        calculées, puis triées.
+        """
+        return f"""
+        WITH {with_clause}scored AS MATERIALIZED (
+            SELECT fe.film_id, (fe.embedding <=> {query_vector}) AS distance
+            FROM film_embeddings fe
+            JOIN films f ON f.id = fe.film_id
+            WHERE 1=1
+            {exclude_clause}
+            {filter_clause}
+        )
+        SELECT
+            {FILM_COLUMNS},
+            s.distance
+        FROM scored s
+        JOIN films f ON f.id = s.film_id
+        ORDER BY s.distance
+        LIMIT ${k_param}
+        """
+
+    async def _embedding_dimension(self, conn) -> int:
+        """Dimension des embeddings stockés (lue une fois qu'il en existe, 0 sinon)."""
+        if not self._dimension:
+            # Table encore vide : rien n'est mémorisé, on relira au prochain appel
+            self._dimension = await conn.fetchval(
+                "SELECT vector_dims(embedding) FROM film_embeddings LIMIT 1"
+            ) or 0
+        return self._dimension
+
+    async def _plan(self, conn, limit: int, quality: Optional[str] = None, **filters) -> Dict:
+        """Route de la requête (voir FilteredIndexPlanner) et largeur de recherche associée."""
+        filtered = any(filters.values())
+        selectivity = 1.0
+        if filtered:
+            await self.selectivity.ensure_loaded(conn)
+            await self.planner.ensure_loaded(conn)
+            selectivity = self.selectivity.estimate(**filters)
+        plan = self.planner.plan(
+            self.selectivity.total, selectivity, genres=filters.get("genres"),
+            min_year=filters.get("min_year"), max_year=filters.get("max_year"), filtered=filtered,
+        )
+        plan["settings"] = {
+            "hnsw.ef_search": search_breadth(PGVECTOR_EF_SEARCH, limit, plan["selectivity"], quality,
+                                             PGVECTOR_EF_SEARCH_MAX),
+            "ivfflat.probes": search_breadth(PGVECTOR_PROBES, 1, plan["selectivity"], quality,
+                                             PGVECTOR_PROBES_MAX),
+        }
+        self.planner.routes[plan["route"]] += 1
+        return plan
+
+    async def search(self, embedding, k: int, genres: Optional[str] = None,
+                     min_year: Optional[int] = None, max_year: Optional[int] = None,
+                     conn=None, quality: Optional[str] = None) -> List[Dict]:
+        """Les k films les plus proches d'un embedding de requête."""
+        if conn is None:
+            async with async_connection() as conn:
+                return await self.search(embedding, k, genres=genres, min_year=min_year,
+                                         max_year=max_year, conn=conn, quality=quality)
+
+        # $1 : embedding de la requête, filtres à partir de $2, k en dernier
+        params = [embedding]
+        filter_clause = build_film_filters(params, genres=genres, min_year=min_year, max_year=max_year)
+        limit = k * self.oversample if self.precision != "full" else k
+        plan = await self._plan(conn, limit, quality, genres=genres, min_year=min_year, max_year=max_year)
+        filter_clause += plan["predicate"]
+
+        if plan["route"] == "exact":
+            params.append(k)
+            query = self._exact_query("$1", filter_clause, len(params))
+        elif self.precision != "full":
+            params.append(limit)
+            params.append(k)
+            query = self._rerank_query("$1", len(embedding), filter_clause, len(params) - 1, len(params))
+        else:
+            params.append(k)
+            query = f"""
+            SELECT
+                {FILM_COLUMNS},
+                (fe.embedding <=> $1) AS distance
+            FROM film_embeddings fe
+            JOIN films f ON f.id = fe.film_id
+            WHERE 1=1
+            {filter_clause}
+            ORDER BY fe.embedding <=> $1
+            LIMIT ${len(params)}
+            """
+        return await self._fetch(conn, query, params, plan["settings"])
+
+    async def similar(self, film_id: int, k: int, exclude_genres: Optional[str] = None,
+                      min_year: Optional[int] = None, max_year: Optional[int] = None,
+                      conn=None, quality: Optional[str] = None) -> Optional[List[Dict]]:
+        """Les k films les plus proches d'un film du catalogue."""
+        if conn is None:
+            async with async_connection() as conn:
+                return await self.similar(film_id, k, exclude_genres=exclude_genres, min_year=min_year,
+                                          max_year=max_year, conn=conn, quality=quality)
+
+        # $1 : film_id (WITH et WHERE), filtres à partir de $2, k en dernier
+        params = [film_id]
+        filter_clause = build_film_filters(params, exclude_genres=exclude_genres,
+                                           min_year=min_year, max_year=max_year)
+        limit = k * self.oversample if self.precision != "full" else k
+        plan = await self._plan(conn, limit, quality, exclude_genres=exclude_genres,
+                                min_year=min_year, max_year=max_year)
+        filter_clause += plan["predicate"]
+        with_clause = "q AS (SELECT embedding FROM film_embeddings WHERE film_id = $1), "
+        # Film sans embedding : aucun résultat
+        exclude_clause = "AND f.id <> $1 AND EXISTS (SELECT 1 FROM q)"
+
+        if plan["route"] == "exact":
+            params.append(k)
+            query = self._exact_query("(SELECT embedding FROM q)", filter_clause, len(params),
+                                      exclude_clause=exclude_clause, with_clause=with_clause)
+        elif self.precision != "full":
+            params.append(limit)
+            params.append(k)
+            query = self._rerank_query(
+                "(SELECT embedding FROM q)", await self._embedding_dimension(conn), filter_clause,
+                len(params) - 1, len(params), exclude_clause=exclude_clause, with_clause=with_clause,
+            )
+        else:
+            params.append(k)
+            query = f"""
+            WITH q AS (
+                SELECT embedding FROM film_embeddings WHERE film_id = $1
+            )
+            SELECT
+                {FILM_COLUMNS},
+                (fe.embedding <=> (SELECT embedding FROM q)) AS distance
+            FROM film_embeddings fe
+            JOIN films f ON f.id = fe.film_id
+            JOIN q ON TRUE
+            WHERE f.id <> $1
+            {filter_clause}
+            ORDER BY fe.embedding <=> (SELECT embedding FROM q)
+            LIMIT ${len(params)}
+            """
+        return await self._fetch(conn, query, params, plan["settings"])
+
+    @staticmethod
+    async def _fetch(conn, query, params, settings):
+        # set_config(..., true) équivaut à SET LOCAL : la valeur disparaît avec la transaction
+        async with conn.transaction():
+            await conn.execute(
+                "SELECT set_config('hnsw.ef_search', $1, true), set_config('ivfflat.probes', $2, true)",
+                str(settings["hnsw.ef_search"]), str(settings["ivfflat.probes"])
+            )
+            return [dict(row) for row in await conn.fetch(query, *params)]
+
+    async def refresh(self, force: bool = False):
+        if force:
+            self._dimension = None
+            self.selectivity.loaded_at = None
+            self.planner.loaded_at = None
+
+    def stats(self) -> Dict:
+        return {
+            "backend": self.name,
+            "precision": self.precision,
+            "rerank_oversample": self.oversample if self.precision != "full" else None,
+            "ef_search": PGVECTOR_EF_SEARCH,
+            "probes": PGVECTOR_PROBES,
+            "selectivity": self.selectivity.stats(),
+            "planner": self.planner.stats(),
+        }
+
+
+class _MemorySnapshot:
+    """
+    Copie en mémoire des films, des embeddings et des structures dérivées.
+
+    Construite entièrement avant d'être publiée, puis jamais modifiée (sauf le
+    paramètre ef de l'index HNSW, réglé sous hnsw_lock : les requêtes tournent
+    dans des threads).
+    """
+    __slots__ = ("matrix", "films", "positions", "years", "genre_masks", "hnsw", "hnsw_lock")
+
+    def __init__(self, matrix, films, years, genre_masks, hnsw=None):
+        self.matrix = matrix
+        self.films = films
+        self.positions = {film["id"]: position for position, film in enumerate(films)}
+        self.years = years
+        self.genre_masks = genre_masks
+        self.hnsw = hnsw
+        self.hnsw_lock = threading.Lock()
+
+    @classmethod
+    def empty(cls):
+        return cls(np.empty((0, 0), dtype=np.float32), [], np.empty(0, dtype=np.int32), {})
+
+
+class InMemorySearchEngine:
+    """
+    Recherche exacte (ou HNSW) sur une copie en mémoire des embeddings et des films.
+
+    Args:
+        generation_tracker: GenerationTracker partagé ; la copie est rechargée quand
+            la génération des embeddings change
+        index: "exact" ou "hnsw"
+    """
+
+    name = "memory"
+
+    def __init__(self, generation_tracker, index: str = MEMORY_INDEX):
+        if index == "hnsw" and hnswlib is None:
+            raise RuntimeError("MEMORY_INDEX=hnsw nécessite le paquet hnswlib (pip install hnswlib)")
+        self.generation_tracker = generation_tracker
+        self.index_kind = index
+        self.generation = None
+        self.loaded_at = None
+        self.load_seconds = None
+        self.queries = 0
+        self._lock = asyncio.Lock()
+        # Une seule référence : une requête lit toujours une copie cohérente
+        self._snapshot = _MemorySnapshot.empty()
+
+    async def refresh(self, force: bool = False):
+        """Recharge les embeddings si la génération a changé (ou si `force`)."""
+        generation = await self.generation_tracker.current()
+        if not force and generation == self.generation:
+            return
+        async with self._lock:
+            if not force and generation == self.generation:
+                return
+            started = time.perf_counter()
+            async with async_connection() as conn:
+                rows = await conn.fetch(f"""
+                    SELECT {FILM_COLUMNS}, fe.embedding
+                    FROM film_embeddings fe
+                    JOIN films f ON f.id = fe.film_id
+                    ORDER BY f.id
+                """)
+            # Construction dans un thread, publication par une seule affectation
+            self._snapshot = await asyncio.to_thread(self._build, rows)
+            self.generation = generation
+            self.loaded_at = time.time()
+            self.load_seconds = round(time.perf_counter() - started, 3)
+
+    def _build(self, rows) -> _MemorySnapshot:
+        """Construit la matrice, les masques de filtrage et l'index optionnel."""
+        films = []
+        vectors = []
+        for row in rows:
+            film = dict(row)
+            vectors.append(film.pop("embedding"))
+            films.append(film)
+
+        if vectors:
+            matrix = np.ascontiguousarray(np.vstack(vectors), dtype=np.float32)
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            matrix /= norms
+        else:
+            matrix = np.empty((0, 0), dtype=np.float32)
+
+        years = np.array([film["year"] if film["year"] is not None else -1 for film in films], dtype=np.int32)
+        genre_masks = {}
+        for position, film in enumerate(films):
+            for genre in film["genres"] or []:
+                mask = genre_masks.get(genre)
+                if mask is None:
+                    mask = genre_masks[genre] = np.zeros(len(films), dtype=bool)
+                mask[position] = True
+
+        hnsw = None
+        if self.index_kind == "hnsw" and len(films) > 0:
+            hnsw = hnswlib.Index(space="ip", dim=matrix.shape[1])
+            hnsw.init_index(max_elements=len(films), M=HNSW_M, ef_construction=HNSW_EF_CONSTRUCTION)
+            hnsw.add_items(matrix, np.arange(len(films)))
+            hnsw.set_ef(HNSW_EF_SEARCH)
+
+        return _MemorySnapshot(matrix, films, years, genre_masks, hnsw)
+
+    @staticmethod
+    def _mask(snapshot: _MemorySnapshot, genres=None, exclude_genres=None,
+              min_year=None, max_year=None) -> Optional[np.ndarray]:
+        """Combine les masques de filtrage (None si aucun filtre)."""
+        n = len(snapshot.films)
+        mask = None
+
+        def combine(current, other):
+            return other.copy() if current is None else current & other
+
+        if genres:
+            for genre in [g.strip() for g in genres.split(",")]:
+                mask = combine(mask, snapshot.genre_masks.get(genre, np.zeros(n, dtype=bool)))
+        if exclude_genres:
+            for genre in [g.strip() for g in exclude_genres.split(",")]:
+                if genre in snapshot.genre_masks:
+                    mask = combine(mask, ~snapshot.genre_masks[genre])
+        if min_year:
+            mask = combine(mask, (snapshot.years >= 0) & (snapshot.years >= min_year))
+        if max_year:
+            mask = combine(mask, (snapshot.years >= 0) & (snapshot.years <= max_year))
+        return mask
+
+    @staticmethod
+    def _exact_top_k(snapshot: _MemorySnapshot, query: np.ndarray, k: int, mask: Optional[np.ndarray]):
+        """Top-k exact : produit matrice-vecteur puis argpartition."""
+        sims = snapshot.matrix @ query
+        if mask is not None:
+            sims = np.where(mask, sims, -np.inf)
+            available = int(mask.sum())
+        else:
+            available = len(sims)
+        k = min(k, available)
+        if k <= 0:
+            return []
+        candidates = np.argpartition(-sims, k - 1)[:k]
+        candidates = candidates[np.argsort(-sims[candidates])]
+        return [(int(i), float(1.0 - sims[i])) for i in candidates]
+
+    def _hnsw_top_k(self, snapshot: _MemorySnapshot, query: np.ndarray, k: int,
+                    mask: Optional[np.ndarray], quality: Optional[str] = None):
+        """Top-k approché via HNSW, avec repli exact si les filtres éliminent trop de candidats."""
+        n = len(snapshot.films)
+        # Sélectivité exacte : les masques sont déjà calculés
+        selectivity = 1.0 if mask is None else float(mask.mean())
+        # Environ k / sélectivité labels pour en garder k après filtrage
+        wanted = min(n, k if mask is None else math.ceil(k / max(selectivity, MIN_SELECTIVITY)))
+        if mask is not None and wanted >= n:
+            # Filtres trop sélectifs : parcourir tout l'index ne vaut pas le scan exact
+            return self._exact_top_k(snapshot, query, k, mask)
+        # La sélectivité est déjà dans `wanted` : ef >= wanted, élargi selon la qualité
+        ef = search_breadth(HNSW_EF_SEARCH, wanted, 1.0, quality, max(n, 1))
+        # ef est un état de l'index partagé : réglage et requête ensemble
+        with snapshot.hnsw_lock:
+            snapshot.hnsw.set_ef(ef)
+            labels, distances = snapshot.hnsw.knn_query(query, k=wanted)
+        results = [
+            (int(i), float(d)) for i, d in zip(labels[0], distances[0])
+            if mask is None or mask[i]
+        ]
+        if len(results) >= k or mask is None:
+            return results[:k]
+        return self._exact_top_k(snapshot, query, k, mask)
+
+    def _top_k(self, snapshot: _MemorySnapshot, query, k, mask, quality=None):
+        """Top-k sur un instantané ; exécuté hors de la boucle d'événements (asyncio.to_thread)."""
+        self.queries += 1
+        # Catalogue vide ou embeddings pas encore générés : même réponse que pgvector
+        if snapshot.matrix.size == 0:
+            return []
+        query = np.asarray(query, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm > 0:
+            query = query / norm
+        if snapshot.hnsw is not None:
+            return self._hnsw_top_k(snapshot, query, k, mask, quality)
+        return self._exact_top_k(snapshot, query, k, mask)
+
+    @staticmethod
+    def _rows(snapshot: _MemorySnapshot, hits) -> List[Dict]:
+        return [{**snapshot.films[position], "distance": distance} for position, distance in hits]
+
+    async def search(self, embedding, k: int, genres: Optional[str] = None,
+                     min_year: Optional[int] = None, max_year: Optional[int] = None,
+                     conn=None, quality: Optional[str] = None) -> List[Dict]:
+        """Les k films les plus proches d'un embedding de requête."""
+        await self.refresh()
+        snapshot = self._snapshot
+        mask = self._mask(snapshot, genres=genres, min_year=min_year, max_year=max_year)
+        # Produit matriciel ou requête HNSW : dans un thread, comme _build
+        hits = await asyncio.to_thread(self._top_k, snapshot, embedding, k, mask, quality)
+        return self._rows(snapshot, hits)
+
+    async def similar(self, film_id: int, k: int, exclude_genres: Optional[str] = None,
+                      min_year: Optional[int] = None, max_year: Optional[int] = None,
+                      conn=None, quality: Optional[str] = None) -> Optional[List[Dict]]:
+        """Les k films les plus proches d'un film (None si le film n'a pas d'embedding chargé)."""
+        await self.refresh()
+        snapshot = self._snapshot
+        position = snapshot.positions.get(film_id)
+        if position is None:
+            return None
+        mask = self._mask(snapshot, exclude_genres=exclude_genres, min_year=min_year, max_year=max_year)
+        if mask is None:
+            mask = np.ones(len(snapshot.films), dtype=bool)
+        mask[position] = False
+        hits = await asyncio.to_thread(self._top_k, snapshot, snapshot.matrix[position], k, mask, quality)
+        return self._rows(snapshot, hits)
+
+    def stats(self) -> Dict:
+        snapshot = self._snapshot
+        return {
+            "backend": self.name,
+            "index": self.index_kind,
+            "films": len(snapshot.films),
+            "dimension": int(snapshot.matrix.shape[1]) if snapshot.matrix.size else 0,
+            "genres": len(snapshot.genre_masks),
+            "generation": self.generation,
+            "load_seconds": self.load_seconds,
+            "queries": self.queries,
+        }
+
+
+def make_search_engine(generation_tracker, backend: str = SEARCH_BACKEND):
+    """Construit le moteur demandé par SEARCH_BACKEND."""
+    backend = (backend or "pgvector").lower()
+    if backend == "pgvector":
+        return PgvectorSearchEngine()
+    if backend == "memory":
+        return InMemorySearchEngine(generation_tracker)
+    raise ValueError(f"SEARCH_BACKEND inconnu: {backend} (pgvector ou memory)")
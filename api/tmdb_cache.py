@@ -0,0 +1,256 @@
+"""
+Cache persistant des métadonnées TMDB (table film_metadata).
+
+Chaque film a au plus une ligne dans film_metadata, y compris quand TMDB ne
+le connaît pas (entrée négative, tmdb_status = 'not_found') : on ne
+réinterroge pas TMDB à chaque affichage d'un film sans affiche.
+
+- entrée fraîche (âge < TTL) : servie telle quelle ;
+- entrée périmée : servie immédiatement, rafraîchie en tâche de fond
+  (stale-while-revalidate, une seule tâche par film) ;
+- pas d'entrée : appel TMDB synchrone puis enregistrement.
+
+get_many() lit un lot de films en une requête (films LEFT JOIN film_metadata)
+et interroge TMDB en parallèle pour les films absents, au plus
+TMDB_POOL_SIZE appels simultanés.
+
+Les entrées trouvées expirent après TMDB_CACHE_TTL, les négatives après
+TMDB_NEGATIVE_TTL. Une panne de TMDB (réseau, 429, 5xx) n'est jamais
+enregistrée comme une absence.
+"""
+import asyncio
+import os
+from typing import Dict, Iterable, List, Optional
+
+from fastapi.concurrency import run_in_threadpool
+
+from api.tmdb_service import TMDB_POOL_SIZE, TMDBUnavailableError, tmdb_client
+from config.async_database import async_connection
+
+# Durée de vie des entrées trouvées (7 jours) et des entrées négatives (1 jour)
+TMDB_CACHE_TTL = int(os.getenv("TMDB_CACHE_TTL", "604800"))
+TMDB_NEGATIVE_TTL = int(os.getenv("TMDB_NEGATIVE_TTL", "86400"))
+
+STATUS_FOUND = "found"
+STATUS_NOT_FOUND = "not_found"
+
+# Les lignes existantes ont toutes été écrites avec une affiche : 'found' par défaut
+ADD_STATUS_COLUMN_SQL = f"""
+ALTER TABLE film_metadata
+    ADD COLUMN IF NOT EXISTS tmdb_status TEXT NOT NULL DEFAULT '{STATUS_FOUND}'
+"""
+
+# tmdb_status est NULL pour un film sans entrée (colonne NOT NULL dans la table)
+SELECT_FILMS_METADATA_SQL = """
+SELECT f.id, f.title, f.year,
+       fm.poster_url, fm.backdrop_url, fm.trailer_url, fm.trailer_youtube_id,
+       fm.streaming_platforms, fm.tmdb_id, fm.tmdb_status,
+       EXTRACT(EPOCH FROM (CURRENT_TIMESTAMP - fm.updated_at)) AS age
+FROM films f
+LEFT JOIN film_metadata fm ON fm.film_id = f.id
+WHERE f.id = ANY($1::int[])
+"""
+
+UPSERT_METADATA_SQL = """
+INSERT INTO film_metadata
+(film_id, poster_url, backdrop_url, trailer_url, trailer_youtube_id,
+ streaming_platforms, tmdb_id, tmdb_status)
+VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
+ON CONFLICT (film_id) DO UPDATE SET
+    poster_url = EXCLUDED.poster_url,
+    backdrop_url = EXCLUDED.backdrop_url,
+    trailer_url = EXCLUDED.trailer_url,
+    trailer_youtube_id = EXCLUDED.trailer_youtube_id,
+    streaming_platforms = EXCLUDED.streaming_platforms,
+    tmdb_id = EXCLUDED.tmdb_id,
+    tmdb_status = EXCLUDED.tmdb_status,
+    updated_at = CURRENT_TIMESTAMP
+"""
+
+
+def row_to_metadata(row) -> Dict:
+    """Métadonnées d'une ligne de film_metadata ({} pour une entrée négative)."""
+    if row["tmdb_status"] == STATUS_NOT_FOUND:
+        return {}
+    return {
+        "poster_url": row["poster_url"],
+        "backdrop_url": row["backdrop_url"],
+        "trailer_url": row["trailer_url"],
+        "trailer_youtube_id": row["trailer_youtube_id"],
+        "streaming_platforms": row["streaming_platforms"] or [],
+        "tmdb_id": row["tmdb_id"]
+    }
+
+
+def metadata_params(film_id: int, metadata: Dict) -> tuple:
+    """Paramètres de UPSERT_METADATA_SQL ({} = entrée négative)."""
+    return (
+        film_id,
+        metadata.get("poster_url"),
+        metadata.get("backdrop_url"),
+        metadata.get("trailer_url"),
+        metadata.get("trailer_youtube_id"),
+        metadata.get("streaming_platforms", []),
+        metadata.get("tmdb_id"),
+        STATUS_FOUND if metadata else STATUS_NOT_FOUND
+    )
+
+
+async def ensure_metadata_schema(conn):
+    """Ajoute la colonne tmdb_status si besoin (sans verrou quand elle existe déjà)."""
+    exists = await conn.fetchval("""
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = 'film_metadata' AND column_name = 'tmdb_status'
+    """)
+    if not exists:
+        await conn.execute(ADD_STATUS_COLUMN_SQL)
+
+
+class TMDBMetadataCache:
+    """
+    Métadonnées TMDB des films, servies depuis film_metadata.
+
+    Args:
+        client: TMDBClient utilisé pour les entrées absentes ou périmées
+        ttl: durée de vie d'une entrée trouvée (secondes)
+        negative_ttl: durée de vie d'une entrée négative (secondes)
+        max_concurrency: appels TMDB simultanés (une connexion de la session chacun)
+    """
+
+    def __init__(self, client=tmdb_client, ttl: int = TMDB_CACHE_TTL,
+                 negative_ttl: int = TMDB_NEGATIVE_TTL, max_concurrency: int = TMDB_POOL_SIZE):
+        self.client = client
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.hits = 0
+        self.negative_hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.errors = 0
+        self._schema_ready = False
+        # Films en cours de rafraîchissement (une seule tâche par film)
+        self._refreshing = {}
+        self._fetch_slots = asyncio.Semaphore(max_concurrency)
+
+    async def _ensure_schema(self, conn):
+        if not self._schema_ready:
+            await ensure_metadata_schema(conn)
+            self._schema_ready = True
+
+    async def get(self, film_id: int) -> Optional[Dict]:
+        """Métadonnées d'un film ({} si TMDB ne le connaît pas), None si le film n'existe pas."""
+        return (await self.get_many([film_id])).get(film_id)
+
+    async def get_many(self, film_ids: Iterable[int]) -> Dict[int, Dict]:
+        """
+        Métadonnées de plusieurs films, par id ({} si TMDB ne les connaît pas ou est indisponible).
+
+        Une seule requête SQL pour tout le lot ; les films absents du cache
+        sont interrogés en parallèle puis enregistrés ensemble. Les ids
+        inconnus de la table films sont absents du résultat.
+        """
+        film_ids = list(dict.fromkeys(film_ids))
+        if not film_ids:
+            return {}
+        async with async_connection() as conn:
+            await self._ensure_schema(conn)
+            rows = await conn.fetch(SELECT_FILMS_METADATA_SQL, film_ids)
+
+        results = {}
+        missing = []
+        for row in rows:
+            film = {"id": row["id"], "title": row["title"], "year": row["year"]}
+            if row["tmdb_status"] is None:
+                self.misses += 1
+                missing.append(film)
+                results[film["id"]] = {}
+                continue
+            metadata = results[film["id"]] = row_to_metadata(row)
+            ttl = self.ttl if metadata else self.negative_ttl
+            if row["age"] is not None and row["age"] < ttl:
+                if metadata:
+                    self.hits += 1
+                else:
+                    self.negative_hits += 1
+            else:
+                self.stale_hits += 1
+                # Sans clé API, l'entrée périmée reste servie telle quelle
+                if self.client.api_key:
+                    self._schedule_refresh(film)
+
+        # Sans clé API, les films absents du cache restent sans métadonnées
+        if missing and self.client.api_key:
+            fetched = await asyncio.gather(*(self._fetch(film) for film in missing))
+            rows_to_store = []
+            for film, metadata in zip(missing, fetched):
+                if metadata is not None:
+                    results[film["id"]] = metadata
+                    rows_to_store.append(metadata_params(film["id"], metadata))
+            await self._store(rows_to_store)
+        return results
+
+    async def _fetch(self, film: Dict) -> Optional[Dict]:
+        """Interroge TMDB ; None si TMDB est indisponible (rien n'est alors enregistré)."""
+        self.refreshes += 1
+        async with self._fetch_slots:
+            try:
+                # Client HTTP bloquant : exécuté dans le threadpool
+                return await run_in_threadpool(
+                    self.client.get_film_metadata, film["title"], film["year"], True
+                )
+            except TMDBUnavailableError as e:
+                self.errors += 1
+                print(f"TMDB indisponible pour le film {film['id']}: {e}")
+                return None
+
+    async def _store(self, rows: List[tuple]):
+        if not rows:
+            return
+        async with async_connection() as conn:
+            await self._ensure_schema(conn)
+            await conn.executemany(UPSERT_METADATA_SQL, rows)
+
+    async def refresh(self, film: Dict) -> Optional[Dict]:
+        """Interroge TMDB et enregistre le résultat ; None si TMDB est indisponible."""
+        metadata = await self._fetch(film)
+        if metadata is not None:
+            await self._store([metadata_params(film["id"], metadata)])
+        return metadata
+
+    def _schedule_refresh(self, film: Dict):
+        task = self._refreshing.get(film["id"])
+        if task is not None and not task.done():
+            return
+        self._refreshing[film["id"]] = asyncio.create_task(self._refresh_quietly(film))
+
+    async def _refresh_quietly(self, film: Dict):
+        try:
+            await self.refresh(film)
+        except Exception as e:
+            self.errors += 1
+            print(f"Métadonnées TMDB non rafraîchies pour le film {film['id']}: {e}")
+        finally:
+            self._refreshing.pop(film["id"], None)
+
+    async def close(self):
+        """Annule les rafraîchissements en cours (arrêt de l'API)."""
+        tasks = list(self._refreshing.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._refreshing.clear()
+
+    def stats(self) -> Dict:
+        return {
+            "ttl_seconds": self.ttl,
+            "negative_ttl_seconds": self.negative_ttl,
+            "hits": self.hits,
+            "negative_hits": self.negative_hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "refreshes": self.refreshes,
+            "pending_refreshes": len(self._refreshing),
+            "errors": self.errors,
+            "tmdb_requests": self.client.requests,
+        }
@@ -0,0 +1,223 @@
+"""
+Préchargement des métadonnées TMDB des films (affiches, trailers, streaming).
+
+Parcourt les films sans ligne dans film_metadata (et, sur demande, ceux dont
+l'entrée a expiré) et les interroge en parallèle :
+
+- TMDB_PREFETCH_CONCURRENCY films en cours à la fois (client TMDB partagé,
+  exécuté dans des threads via asyncio) ;
+- un seau à jetons limite le débit à TMDB_PREFETCH_RATE requêtes HTTP par
+  seconde (deux par film : recherche puis détails) ;
+- les erreurs transitoires (réseau, 429, 5xx) sont réessayées avec un délai
+  exponentiel, ou le délai Retry-After de TMDB ;
+- les résultats sont enregistrés par lots (executemany), entrées négatives
+  comprises, au format du cache de api/tmdb_cache.py.
+
+Lancé par scripts/prefetch_tmdb_metadata.py ou au démarrage de l'API
+(TMDB_PREFETCH_ON_STARTUP=true). TMDB_BASE_URL permet de viser un serveur
+local de test.
+"""
+import asyncio
+import os
+import random
+import time
+from typing import Dict, List, Optional
+
+from api.tmdb_cache import (
+    STATUS_NOT_FOUND, TMDB_CACHE_TTL, TMDB_NEGATIVE_TTL, UPSERT_METADATA_SQL,
+    ensure_metadata_schema, metadata_params
+)
+from api.tmdb_service import TMDBUnavailableError, tmdb_client
+from config.async_database import async_connection
+
+TMDB_PREFETCH_ON_STARTUP = os.getenv("TMDB_PREFETCH_ON_STARTUP", "false").lower() == "true"
+# Requêtes HTTP par seconde vers TMDB (limite publique : environ 50/s)
+TMDB_PREFETCH_RATE = float(os.getenv("TMDB_PREFETCH_RATE", "40"))
+TMDB_PREFETCH_CONCURRENCY = int(os.getenv("TMDB_PREFETCH_CONCURRENCY", "8"))
+TMDB_PREFETCH_BATCH_SIZE = int(os.getenv("TMDB_PREFETCH_BATCH_SIZE", "100"))
+TMDB_PREFETCH_MAX_RETRIES = int(os.getenv("TMDB_PREFETCH_MAX_RETRIES", "4"))
+# Premier délai avant une nouvelle tentative (doublé à chaque échec)
+TMDB_PREFETCH_BACKOFF = float(os.getenv("TMDB_PREFETCH_BACKOFF", "1"))
+
+# Requêtes TMDB par film (recherche + détails)
+REQUESTS_PER_FILM = 2
+
+PENDING_FILMS_SQL = f"""
+SELECT f.id, f.title, f.year
+FROM films f
+LEFT JOIN film_metadata fm ON fm.film_id = f.id
+WHERE f.title IS NOT NULL
+AND (
+    fm.film_id IS NULL
+    OR ($1 AND fm.updated_at < CURRENT_TIMESTAMP - make_interval(secs => CASE
+        WHEN fm.tmdb_status = '{STATUS_NOT_FOUND}' THEN $3 ELSE $2 END))
+)
+ORDER BY f.id
+LIMIT $4
+"""
+
+
+class TokenBucket:
+    """
+    Seau à jetons asynchrone : `rate` jetons par seconde, au plus `capacity` en réserve.
+
+    acquire() attend que les jetons demandés soient disponibles ; les appelants
+    sont servis dans l'ordre d'arrivée.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        if rate <= 0:
+            raise ValueError("Le débit du seau à jetons doit être positif")
+        self.rate = rate
+        self.capacity = capacity or max(rate, REQUESTS_PER_FILM)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, tokens: float = 1):
+        if tokens > self.capacity:
+            raise ValueError(f"{tokens} jetons demandés pour une capacité de {self.capacity}")
+        async with self._lock:
+            self._refill()
+            while self.tokens < tokens:
+                await asyncio.sleep((tokens - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= tokens
+
+
+class TMDBPrefetcher:
+    """
+    Préchargement parallèle et limité en débit des métadonnées TMDB.
+
+    Args:
+        client: TMDBClient (doit avoir une clé API)
+        rate: requêtes HTTP par seconde
+        concurrency: films interrogés en même temps
+        batch_size: lignes par écriture groupée dans film_metadata
+        max_retries: nouvelles tentatives après une erreur transitoire
+        backoff: premier délai entre deux tentatives (secondes)
+    """
+
+    def __init__(self, client=tmdb_client, rate: float = TMDB_PREFETCH_RATE,
+                 concurrency: int = TMDB_PREFETCH_CONCURRENCY, batch_size: int = TMDB_PREFETCH_BATCH_SIZE,
+                 max_retries: int = TMDB_PREFETCH_MAX_RETRIES, backoff: float = TMDB_PREFETCH_BACKOFF):
+        self.client = client
+        self.bucket = TokenBucket(rate)
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.running = False
+        self._reset_counters()
+
+    def _reset_counters(self):
+        self.pending = 0
+        self.found = 0
+        self.not_found = 0
+        self.failed = 0
+        self.retries = 0
+        self.stored = 0
+        self.started_at = None
+        self.finished_at = None
+        self._buffer = []
+
+    async def pending_films(self, refresh_stale: bool = False, limit: Optional[int] = None) -> List[Dict]:
+        """Films sans métadonnées (et, avec `refresh_stale`, ceux dont l'entrée a expiré)."""
+        async with async_connection() as conn:
+            await ensure_metadata_schema(conn)
+            rows = await conn.fetch(PENDING_FILMS_SQL, refresh_stale, float(TMDB_CACHE_TTL),
+                                    float(TMDB_NEGATIVE_TTL), limit)
+        return [dict(row) for row in rows]
+
+    async def fetch(self, film: Dict) -> Optional[Dict]:
+        """Métadonnées d'un film ({} si TMDB ne le connaît pas), None après la dernière tentative."""
+        for attempt in range(self.max_retries + 1):
+            await self.bucket.acquire(REQUESTS_PER_FILM)
+            try:
+                return await asyncio.to_thread(
+                    self.client.get_film_metadata, film["title"], film["year"], True
+                )
+            except TMDBUnavailableError as e:
+                if attempt == self.max_retries:
+                    print(f"⚠ TMDB indisponible pour le film {film['id']} ({film['title']}): {e}")
+                    return None
+                self.retries += 1
+                delay = e.retry_after or self.backoff * 2 ** attempt
+                await asyncio.sleep(delay * random.uniform(1.0, 1.25))
+
+    async def _store(self, rows: List[tuple]):
+        if not rows:
+            return
+        async with async_connection() as conn:
+            await conn.executemany(UPSERT_METADATA_SQL, rows)
+        self.stored += len(rows)
+
+    async def _worker(self, queue: asyncio.Queue):
+        while True:
+            try:
+                film = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            metadata = await self.fetch(film)
+            if metadata is None:
+                self.failed += 1
+                continue
+            if metadata:
+                self.found += 1
+            else:
+                self.not_found += 1
+            self._buffer.append(metadata_params(film["id"], metadata))
+            if len(self._buffer) >= self.batch_size:
+                rows, self._buffer = self._buffer, []
+                await self._store(rows)
+
+    async def run(self, refresh_stale: bool = False, limit: Optional[int] = None) -> Dict:
+        """
+        Précharge les films en attente et retourne les statistiques du passage.
+
+        Args:
+            refresh_stale: inclure les entrées expirées (TMDB_CACHE_TTL / TMDB_NEGATIVE_TTL)
+            limit: nombre maximal de films traités
+        """
+        if not self.client.api_key:
+            raise ValueError("TMDB_API_KEY n'est pas configurée")
+        if self.running:
+            raise RuntimeError("Un préchargement TMDB est déjà en cours")
+        self.running = True
+        self._reset_counters()
+        self.started_at = time.monotonic()
+        try:
+            films = await self.pending_films(refresh_stale, limit)
+            self.pending = len(films)
+            queue = asyncio.Queue()
+            for film in films:
+                queue.put_nowait(film)
+            await asyncio.gather(*(self._worker(queue) for _ in range(max(1, self.concurrency))))
+            await self._store(self._buffer)
+            self._buffer = []
+        finally:
+            self.running = False
+            self.finished_at = time.monotonic()
+        return self.stats()
+
+    def stats(self) -> Dict:
+        elapsed = None
+        if self.started_at is not None:
+            elapsed = round((self.finished_at or time.monotonic()) - self.started_at, 1)
+        return {
+            "running": self.running,
+            "pending": self.pending,
+            "found": self.found,
+            "not_found": self.not_found,
+            "failed": self.failed,
+            "retries": self.retries,
+            "stored": self.stored,
+            "elapsed_seconds": elapsed,
+            "rate_per_second": self.bucket.rate,
+            "concurrency": self.concurrency,
+        }
@@ -1,92 +1,67 @@
 """
 Service d'intégration avec l'API TMDB pour récupérer les affiches, trailers et informations de streaming.
+
+TMDBClient garde une requests.Session (connexions keep-alive réutilisées entre
+les appels) et n'effectue que deux requêtes par film : une recherche, puis les
+détails avec `append_to_response=videos,watch/providers`, dont sont extraits
+l'affiche, le backdrop, la bande annonce et les plateformes.
 """
 import os
 import requests
+from requests.adapters import HTTPAdapter
 from typing import Optional, Dict, List
 from dotenv import load_dotenv
 
 load_dotenv()
 
 TMDB_API_KEY = os.getenv("TMDB_API_KEY", "")
-TMDB_BASE_URL = "https://api.themoviedb.org/3"
+# Modifiable pour viser un serveur de test local (ex: http://localhost:8001/3)
+TMDB_BASE_URL = os.getenv("TMDB_BASE_URL", "https://api.themoviedb.org/3")
 TMDB_IMAGE_BASE_URL = "https://image.tmdb.org/t/p/w500"
 TMDB_BACKDROP_BASE_URL = "https://image.tmdb.org/t/p/w1280"
+# Connexions gardées ouvertes vers TMDB (au moins le nombre de threads qui l'appellent)
+TMDB_POOL_SIZE = int(os.getenv("TMDB_POOL_SIZE", "10"))
+TMDB_TIMEOUT = float(os.getenv("TMDB_TIMEOUT", "5"))
 
+# Logo des plateformes (mapping simplifié)
+PLATFORM_LOGOS = {
+    "Netflix": "https://www.themoviedb.org/assets/2/v4/logos/v2/Netflix_Logo_RGB.png",
+    "Disney Plus": "https://www.themoviedb.org/assets/2/v4/logos/v2/Disney_Plus_Logo_RGB.png",
+    "Amazon Prime Video": "https://www.themoviedb.org/assets/2/v4/logos/v2/Amazon_Prime_Video_Logo_RGB.png",
+    "HBO": "https://www.themoviedb.org/assets/2/v4/logos/v2/HBO_Logo_RGB.png",
+    "Apple TV Plus": "https://www.themoviedb.org/assets/2/v4/logos/v2/Apple_TV_Plus_Logo_RGB.png",
+    "Paramount Plus": "https://www.themoviedb.org/assets/2/v4/logos/v2/Paramount_Plus_Logo_RGB.png",
+    "Hulu": "https://www.themoviedb.org/assets/2/v4/logos/v2/Hulu_Logo_RGB.png",
+    "Canal+": "https://www.themoviedb.org/assets/2/v4/logos/v2/Canal_Plus_Logo_RGB.png",
+    "OCS": "https://www.themoviedb.org/assets/2/v4/logos/v2/OCS_Logo_RGB.png"
+}
 
-def search_movie(title: str, year: Optional[int] = None) -> Optional[Dict]:
-    """Recherche un film sur TMDB."""
-    if not TMDB_API_KEY:
-        return None
-    
-    try:
-        params = {
-            "api_key": TMDB_API_KEY,
-            "query": title,
-            "language": "fr-FR"
-        }
-        if year:
-            params["year"] = year
-        
-        response = requests.get(f"{TMDB_BASE_URL}/search/movie", params=params, timeout=5)
-        if response.status_code == 200:
-            results = response.json().get("results", [])
-            if results:
-                return results[0]
-    except Exception as e:
-        print(f"Erreur lors de la recherche TMDB: {e}")
-    
-    return None
 
+class TMDBUnavailableError(Exception):
+    """TMDB n'a pas répondu (erreur réseau, 429 ou 5xx) : l'absence de résultat n'est pas sûre."""
 
-def get_movie_details(tmdb_id: int) -> Optional[Dict]:
-    """Récupère les détails complets d'un film depuis TMDB."""
-    if not TMDB_API_KEY:
-        return None
-    
-    try:
-        params = {
-            "api_key": TMDB_API_KEY,
-            "language": "fr-FR",
-            "append_to_response": "videos,watch/providers"
-        }
-        
-        response = requests.get(f"{TMDB_BASE_URL}/movie/{tmdb_id}", params=params, timeout=5)
-        if response.status_code == 200:
-            return response.json()
-    except Exception as e:
-        print(f"Erreur lors de la récupération des détails TMDB: {e}")
-    
-    return None
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        # Délai demandé par TMDB (en-tête Retry-After d'une réponse 429), en secondes
+        self.retry_after = retry_after
 
 
-def get_movie_poster_url(title: str, year: Optional[int] = None) -> Optional[str]:
-    """Récupère l'URL de l'affiche d'un film."""
-    movie = search_movie(title, year)
-    if movie and movie.get("poster_path"):
-        return f"{TMDB_IMAGE_BASE_URL}{movie['poster_path']}"
+def poster_url_from(data: Optional[Dict]) -> Optional[str]:
+    """URL de l'affiche d'un résultat de recherche ou de détails TMDB."""
+    if data and data.get("poster_path"):
+        return f"{TMDB_IMAGE_BASE_URL}{data['poster_path']}"
     return None
 
 
-def get_movie_backdrop_url(title: str, year: Optional[int] = None) -> Optional[str]:
-    """Récupère l'URL du backdrop d'un film."""
-    movie = search_movie(title, year)
-    if movie and movie.get("backdrop_path"):
-        return f"{TMDB_BACKDROP_BASE_URL}{movie['backdrop_path']}"
+def backdrop_url_from(data: Optional[Dict]) -> Optional[str]:
+    """URL du backdrop d'un résultat de recherche ou de détails TMDB."""
+    if data and data.get("backdrop_path"):
+        return f"{TMDB_BACKDROP_BASE_URL}{data['backdrop_path']}"
     return None
 
 
-def get_movie_trailer(title: str, year: Optional[int] = None) -> Optional[Dict]:
-    """Récupère la bande annonce d'un film."""
-    movie = search_movie(title, year)
-    if not movie or not movie.get("id"):
-        return None
-    
-    details = get_movie_details(movie["id"])
-    if not details:
-        return None
-    
-    # Chercher une bande annonce YouTube
+def parse_trailer(details: Dict) -> Optional[Dict]:
+    """Première bande annonce YouTube des détails (videos)."""
     videos = details.get("videos", {}).get("results", [])
     for video in videos:
         if video.get("site") == "YouTube" and video.get("type") == "Trailer":
@@ -95,98 +70,191 @@ def get_movie_trailer(title: str, year: Optional[int] = None) -> Optional[Dict]:
                 "url": f"https://www.youtube.com/watch?v={video.get('key')}",
                 "name": video.get("name")
             }
-    
     return None
 
 
-def get_streaming_platforms(title: str, year: Optional[int] = None) -> List[Dict]:
-    """Récupère les plateformes de streaming disponibles pour un film."""
-    movie = search_movie(title, year)
-    if not movie or not movie.get("id"):
-        return []
-    
-    details = get_movie_details(movie["id"])
-    if not details:
-        return []
-    
-    platforms = []
+def parse_streaming_platforms(details: Dict) -> List[Dict]:
+    """Plateformes d'abonnement en France, depuis les détails (watch/providers)."""
     watch_providers = details.get("watch/providers", {}).get("results", {})
-    
-    # Logo des plateformes (mapping simplifié)
-    platform_logos = {
-        "Netflix": "https://www.themoviedb.org/assets/2/v4/logos/v2/Netflix_Logo_RGB.png",
-        "Disney Plus": "https://www.themoviedb.org/assets/2/v4/logos/v2/Disney_Plus_Logo_RGB.png",
-        "Amazon Prime Video": "https://www.themoviedb.org/assets/2/v4/logos/v2/Amazon_Prime_Video_Logo_RGB.png",
-        "HBO": "https://www.themoviedb.org/assets/2/v4/logos/v2/HBO_Logo_RGB.png",
-        "Apple TV Plus": "https://www.themoviedb.org/assets/2/v4/logos/v2/Apple_TV_Plus_Logo_RGB.png",
-        "Paramount Plus": "https://www.themoviedb.org/assets/2/v4/logos/v2/Paramount_Plus_Logo_RGB.png",
-        "Hulu": "https://www.themoviedb.org/assets/2/v4/logos/v2/Hulu_Logo_RGB.png",
-        "Canal+": "https://www.themoviedb.org/assets/2/v4/logos/v2/Canal_Plus_Logo_RGB.png",
-        "OCS": "https://www.themoviedb.org/assets/2/v4/logos/v2/OCS_Logo_RGB.png"
-    }
-    
+
     # FR (France) providers
     fr_providers = watch_providers.get("FR", {})
     flatrate = fr_providers.get("flatrate", [])
-    
+
+    platforms = []
     for provider in flatrate:
         provider_name = provider.get("provider_name", "")
         logo_path = provider.get("logo_path", "")
-        logo_url = f"https://image.tmdb.org/t/p/w45{logo_path}" if logo_path else platform_logos.get(provider_name, "")
-        
+        logo_url = f"https://image.tmdb.org/t/p/w45{logo_path}" if logo_path else PLATFORM_LOGOS.get(provider_name, "")
+
         platforms.append({
             "name": provider_name,
             "logo_url": logo_url,
             "provider_id": provider.get("provider_id")
         })
-    
+
     return platforms
 
 
-def get_film_metadata(title: str, year: Optional[int] = None) -> Dict:
-    """Récupère toutes les métadonnées d'un film (affiche, trailer, streaming)."""
-    movie = search_movie(title, year)
-    if not movie or not movie.get("id"):
-        return {}
-    
-    details = get_movie_details(movie["id"])
+def build_film_metadata(movie: Dict, details: Optional[Dict]) -> Dict:
+    """
+    Métadonnées d'un film à partir du résultat de recherche et des détails.
+
+    Sans détails (erreur TMDB), l'affiche et le backdrop viennent du résultat
+    de recherche, sans nouvel appel.
+    """
     if not details:
         return {
-            "poster_url": get_movie_poster_url(title, year),
-            "backdrop_url": get_movie_backdrop_url(title, year),
+            "poster_url": poster_url_from(movie),
+            "backdrop_url": backdrop_url_from(movie),
             "trailer_url": None,
             "trailer_youtube_id": None,
-            "streaming_platforms": []
+            "streaming_platforms": [],
+            "tmdb_id": movie["id"]
         }
-    
-    # Poster
-    poster_path = details.get("poster_path")
-    poster_url = f"{TMDB_IMAGE_BASE_URL}{poster_path}" if poster_path else None
-    
-    # Backdrop
-    backdrop_path = details.get("backdrop_path")
-    backdrop_url = f"{TMDB_BACKDROP_BASE_URL}{backdrop_path}" if backdrop_path else None
-    
-    # Trailer
-    trailer_info = None
-    videos = details.get("videos", {}).get("results", [])
-    for video in videos:
-        if video.get("site") == "YouTube" and video.get("type") == "Trailer":
-            trailer_info = {
-                "youtube_id": video.get("key"),
-                "url": f"https://www.youtube.com/watch?v={video.get('key')}"
-            }
-            break
-    
-    # Streaming platforms
-    platforms = get_streaming_platforms(title, year)
-    
+
+    trailer_info = parse_trailer(details)
     return {
-        "poster_url": poster_url,
-        "backdrop_url": backdrop_url,
+        "poster_url": poster_url_from(details),
+        "backdrop_url": backdrop_url_from(details),
         "trailer_url": trailer_info["url"] if trailer_info else None,
         "trailer_youtube_id": trailer_info["youtube_id"] if trailer_info else None,
-        "streaming_platforms": platforms,
+        "streaming_platforms": parse_streaming_platforms(details),
         "tmdb_id": movie["id"]
     }
 
+
+class TMDBClient:
+    """
+    Client TMDB avec une session HTTP partagée.
+
+    La session garde jusqu'à `pool_size` connexions keep-alive vers TMDB :
+    les appels suivants évitent la poignée de main TCP/TLS. Elle peut être
+    utilisée depuis plusieurs threads (run_in_threadpool).
+
+    Args:
+        api_key: clé API TMDB (sans clé, toutes les méthodes retournent None / {})
+        base_url: URL de l'API
+        pool_size: connexions gardées ouvertes
+        timeout: délai maximal d'une requête (secondes)
+    """
+
+    def __init__(self, api_key: str = TMDB_API_KEY, base_url: str = TMDB_BASE_URL,
+                 pool_size: int = TMDB_POOL_SIZE, timeout: float = TMDB_TIMEOUT):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.requests = 0
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def _get(self, path: str, params: Dict, label: str, strict: bool = False) -> Optional[Dict]:
+        """
+        GET sur l'API TMDB ; None si pas de clé, pas de résultat ou erreur.
+
+        Avec `strict`, les erreurs transitoires (réseau, 429, 5xx) lèvent
+        TMDBUnavailableError au lieu de retourner None.
+        """
+        if not self.api_key:
+            return None
+        try:
+            self.requests += 1
+            response = self.session.get(
+                f"{self.base_url}{path}",
+                params={"api_key": self.api_key, "language": "fr-FR", **params},
+                timeout=self.timeout
+            )
+        except requests.RequestException as e:
+            print(f"Erreur lors de {label} TMDB: {e}")
+            if strict:
+                raise TMDBUnavailableError(str(e)) from e
+            return None
+        if response.status_code == 200:
+            return response.json()
+        if strict and (response.status_code == 429 or response.status_code >= 500):
+            retry_after = response.headers.get("Retry-After", "")
+            raise TMDBUnavailableError(
+                f"HTTP {response.status_code} pour {path}",
+                retry_after=float(retry_after) if retry_after.isdigit() else None
+            )
+        return None
+
+    def search_movie(self, title: str, year: Optional[int] = None, strict: bool = False) -> Optional[Dict]:
+        """Recherche un film sur TMDB (premier résultat)."""
+        params = {"query": title}
+        if year:
+            params["year"] = year
+        data = self._get("/search/movie", params, "la recherche", strict=strict)
+        results = data.get("results", []) if data else []
+        return results[0] if results else None
+
+    def get_movie_details(self, tmdb_id: int, strict: bool = False) -> Optional[Dict]:
+        """Récupère les détails complets d'un film, avec vidéos et plateformes."""
+        return self._get(f"/movie/{tmdb_id}", {"append_to_response": "videos,watch/providers"},
+                         "la récupération des détails", strict=strict)
+
+    def find_movie(self, title: str, year: Optional[int] = None, strict: bool = False):
+        """Recherche puis détails : (résultat de recherche, détails), ou (None, None)."""
+        movie = self.search_movie(title, year, strict=strict)
+        if not movie or not movie.get("id"):
+            return None, None
+        return movie, self.get_movie_details(movie["id"], strict=strict)
+
+    def get_film_metadata(self, title: str, year: Optional[int] = None, strict: bool = False) -> Dict:
+        """
+        Toutes les métadonnées d'un film en deux requêtes (recherche + détails).
+
+        Retourne {} si TMDB ne connaît pas le film. Avec `strict`, une erreur
+        transitoire lève TMDBUnavailableError (utilisé par le cache, qui ne
+        doit pas enregistrer une panne comme une absence).
+        """
+        movie, details = self.find_movie(title, year, strict=strict)
+        if not movie:
+            return {}
+        return build_film_metadata(movie, details)
+
+    def close(self):
+        self.session.close()
+
+
+# Client partagé par l'API
+tmdb_client = TMDBClient()
+
+
+def search_movie(title: str, year: Optional[int] = None) -> Optional[Dict]:
+    """Recherche un film sur TMDB."""
+    return tmdb_client.search_movie(title, year)
+
+
+def get_movie_details(tmdb_id: int) -> Optional[Dict]:
+    """Récupère les détails complets d'un film depuis TMDB."""
+    return tmdb_client.get_movie_details(tmdb_id)
+
+
+def get_movie_poster_url(title: str, year: Optional[int] = None) -> Optional[str]:
+    """Récupère l'URL de l'affiche d'un film."""
+    return poster_url_from(tmdb_client.search_movie(title, year))
+
+
+def get_movie_backdrop_url(title: str, year: Optional[int] = None) -> Optional[str]:
+    """Récupère l'URL du backdrop d'un film."""
+    return backdrop_url_from(tmdb_client.search_movie(title, year))
+
+
+def get_movie_trailer(title: str, year: Optional[int] = None) -> Optional[Dict]:
+    """Récupère la bande annonce d'un film."""
+    _, details = tmdb_client.find_movie(title, year)
+    return parse_trailer(details) if details else None
+
+
+def get_streaming_platforms(title: str, year: Optional[int] = None) -> List[Dict]:
+    """Récupère les plateformes de streaming disponibles pour un film."""
+    _, details = tmdb_client.find_movie(title, year)
+    return parse_streaming_platforms(details) if details else []
+
+
+def get_film_metadata(title: str, year: Optional[int] = None) -> Dict:
+    """Récupère toutes les métadonnées d'un film (affiche, trailer, streaming)."""
+    return tmdb_client.get_film_metadata(title, year)
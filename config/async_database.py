@@ -0,0 +1,111 @@
+"""
+Accès asynchrone à PostgreSQL (asyncpg) pour les endpoints async de l'API.
+
+Les scripts synchrones (ingestion, embeddings, index) continuent d'utiliser
+config/database.py. Ce module possède son propre pool et enregistre les codecs
+pgvector (`vector`) et JSON/JSONB sur chaque connexion.
+"""
+import asyncio
+import json
+from contextlib import asynccontextmanager
+
+import asyncpg
+import psycopg2
+
+from config.database import DB_CONFIG, DB_POOL_MIN, DB_POOL_MAX, DB_POOL_TIMEOUT, PoolTimeoutError
+from config.vector import encode_vector, decode_vector
+
+# Pool asyncpg partagé (créé au démarrage de l'API ou à la première utilisation)
+async_pool = None
+_async_pool_lock = None
+
+
+async def _init_connection(conn):
+    """Enregistre les codecs JSON/JSONB et pgvector sur une nouvelle connexion."""
+    for typename in ("json", "jsonb"):
+        await conn.set_type_codec(
+            typename, encoder=json.dumps, decoder=json.loads, schema="pg_catalog"
+        )
+    try:
+        await conn.set_type_codec(
+            "vector", encoder=encode_vector, decoder=decode_vector,
+            schema="public", format="binary"
+        )
+    except ValueError:
+        # Extension pgvector pas encore installée : les autres requêtes restent utilisables
+        pass
+
+
+async def get_async_pool():
+    """Crée (une seule fois) le pool asyncpg."""
+    global async_pool, _async_pool_lock
+    if async_pool is not None:
+        return async_pool
+    if _async_pool_lock is None:
+        _async_pool_lock = asyncio.Lock()
+    async with _async_pool_lock:
+        if async_pool is None:
+            try:
+                async_pool = await asyncpg.create_pool(
+                    database=DB_CONFIG["dbname"],
+                    user=DB_CONFIG["user"],
+                    password=DB_CONFIG["password"] or None,
+                    host=DB_CONFIG["host"],
+                    port=int(DB_CONFIG["port"]),
+                    min_size=DB_POOL_MIN,
+                    max_size=DB_POOL_MAX,
+                    init=_init_connection,
+                )
+            except (OSError, asyncpg.PostgresError) as e:
+                raise psycopg2.OperationalError(
+                    "Impossible de se connecter à PostgreSQL sur {}:{} ({})".format(
+                        DB_CONFIG.get("host", "localhost"), DB_CONFIG.get("port", "5432"), e
+                    )
+                ) from None
+    return async_pool
+
+
+@asynccontextmanager
+async def async_connection():
+    """
+    Emprunte une connexion asyncpg au pool et la rend automatiquement.
+
+    Lève PoolTimeoutError si aucune connexion ne se libère avant DB_POOL_TIMEOUT.
+
+    Usage:
+        async with async_connection() as conn:
+            rows = await conn.fetch("SELECT ...", param)
+    """
+    db_pool = await get_async_pool()
+    try:
+        conn = await db_pool.acquire(timeout=DB_POOL_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise PoolTimeoutError(
+            f"Aucune connexion PostgreSQL disponible après {DB_POOL_TIMEOUT}s "
+            f"(pool async de {DB_POOL_MAX} connexions épuisé)"
+        ) from None
+    try:
+        yield conn
+    finally:
+        await db_pool.release(conn)
+
+
+async def close_async_pool():
+    """Ferme le pool asyncpg."""
+    global async_pool
+    if async_pool is not None:
+        await async_pool.close()
+        async_pool = None
+
+
+def get_async_pool_stats():
+    """Statistiques du pool asyncpg (None s'il n'a pas encore été créé)."""
+    if async_pool is None:
+        return None
+    return {
+        "min_size": async_pool.get_min_size(),
+        "max_size": async_pool.get_max_size(),
+        "size": async_pool.get_size(),
+        "idle": async_pool.get_idle_size(),
+        "in_use": async_pool.get_size() - async_pool.get_idle_size(),
+    }
@@ -3,10 +3,15 @@ Configuration et utilitaires pour la connexion à la base de données PostgreSQL
 """
 import os
 import sys
+import time
+import threading
+from contextlib import contextmanager
 import psycopg2
+import psycopg2.extensions
 from psycopg2 import pool
 from psycopg2.extras import RealDictCursor
 from dotenv import load_dotenv
+from config.vector import register_vector
 
 # Configurer l'environnement pour gérer les erreurs d'encodage
 # Certaines versions de PostgreSQL retournent des messages en latin-1
@@ -45,22 +50,233 @@ DB_CONFIG = {
     "port": safe_encode(os.getenv("DB_PORT", "5432")),
 }
 
-# Pool de connexions (optionnel, pour améliorer les performances)
+# Paramètres du pool de connexions (surchargeables via .env)
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+# Temps d'attente maximal (secondes) pour obtenir une connexion quand le pool est épuisé
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "5"))
+# Une connexion restée inactive plus longtemps que ce délai est vérifiée (SELECT 1) avant d'être prêtée
+DB_POOL_HEALTHCHECK_INTERVAL = float(os.getenv("DB_POOL_HEALTHCHECK_INTERVAL", "30"))
+
+
+class PoolTimeoutError(psycopg2.OperationalError):
+    """Levée quand aucune connexion du pool ne se libère avant le timeout."""
+
+
+class BoundedConnectionPool(pool.ThreadedConnectionPool):
+    """
+    Pool de connexions thread-safe et borné.
+
+    Contrairement à ThreadedConnectionPool qui lève immédiatement une PoolError
+    quand toutes les connexions sont prêtées, ce pool attend qu'une connexion
+    se libère (jusqu'à `timeout` secondes). Les connexions sont vérifiées avant
+    d'être prêtées et remplacées si elles sont cassées.
+    """
+
+    def __init__(self, minconn, maxconn, timeout=DB_POOL_TIMEOUT,
+                 healthcheck_interval=DB_POOL_HEALTHCHECK_INTERVAL, **kwargs):
+        self.timeout = timeout
+        self.healthcheck_interval = healthcheck_interval
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._stats_lock = threading.Lock()
+        self._last_used = {}
+        self._stats = {
+            "acquired": 0,
+            "waits": 0,
+            "timeouts": 0,
+            "replaced": 0,
+            "total_wait_ms": 0.0,
+        }
+        super().__init__(minconn, maxconn, **kwargs)
+
+    def _connect(self, key=None):
+        """Ouvre une connexion avec la gestion d'erreurs de get_connection() et l'adaptateur pgvector."""
+        conn = get_connection()
+        register_vector(conn)
+        self._last_used[id(conn)] = time.monotonic()
+        if key is not None:
+            self._used[key] = conn
+            self._rused[id(conn)] = key
+        else:
+            self._pool.append(conn)
+        return conn
+
+    def _putconn(self, conn, key=None, close=False):
+        """
+        Rend une connexion au pool.
+
+        psycopg2 ferme toute connexion rendue au-delà de `minconn`, ce qui
+        recrée des connexions à chaque pic de charge : ici on garde jusqu'à
+        `maxconn` connexions ouvertes.
+        """
+        if self.closed:
+            raise pool.PoolError("connection pool is closed")
+        if key is None:
+            key = self._rused.get(id(conn))
+            if key is None:
+                raise pool.PoolError("trying to put unkeyed connection")
+
+        if not close and not conn.closed:
+            self._pool.append(conn)
+        elif not conn.closed:
+            conn.close()
+
+        del self._used[key]
+        del self._rused[id(conn)]
+
+    def _is_healthy(self, conn):
+        """Vérifie qu'une connexion est encore utilisable."""
+        if conn.closed:
+            return False
+        if conn.info.transaction_status == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+            return False
+        idle = time.monotonic() - self._last_used.get(id(conn), 0.0)
+        if idle < self.healthcheck_interval:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def acquire(self):
+        """Emprunte une connexion saine, en attendant au plus `timeout` secondes."""
+        start = time.monotonic()
+        if not self._slots.acquire(blocking=False):
+            with self._stats_lock:
+                self._stats["waits"] += 1
+            if not self._slots.acquire(timeout=self.timeout):
+                with self._stats_lock:
+                    self._stats["timeouts"] += 1
+                raise PoolTimeoutError(
+                    f"Aucune connexion PostgreSQL disponible après {self.timeout}s "
+                    f"(pool de {self.maxconn} connexions épuisé)"
+                )
+        try:
+            conn = self.getconn()
+            if not self._is_healthy(conn):
+                self._last_used.pop(id(conn), None)
+                self.putconn(conn, close=True)
+                conn = self.getconn()
+                with self._stats_lock:
+                    self._stats["replaced"] += 1
+        except Exception:
+            self._slots.release()
+            raise
+        with self._stats_lock:
+            self._stats["acquired"] += 1
+            self._stats["total_wait_ms"] += (time.monotonic() - start) * 1000
+        return conn
+
+    def release(self, conn, discard=False):
+        """Rend une connexion au pool (fermée si `discard` ou si elle est cassée)."""
+        try:
+            if not conn.closed and not discard:
+                if conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+        except psycopg2.Error:
+            discard = True
+        finally:
+            discard = discard or bool(conn.closed)
+            if discard:
+                self._last_used.pop(id(conn), None)
+            else:
+                self._last_used[id(conn)] = time.monotonic()
+            try:
+                self.putconn(conn, close=discard)
+            finally:
+                self._slots.release()
+
+    def stats(self):
+        """Retourne un instantané de l'état du pool."""
+        with self._lock:
+            in_use = len(self._used)
+            idle = len(self._pool)
+        with self._stats_lock:
+            stats = dict(self._stats)
+        total_wait_ms = stats.pop("total_wait_ms")
+        stats["avg_wait_ms"] = round(total_wait_ms / stats["acquired"], 3) if stats["acquired"] else 0.0
+        stats.update({
+            "min_size": self.minconn,
+            "max_size": self.maxconn,
+            "in_use": in_use,
+            "idle": idle,
+            "timeout_s": self.timeout,
+        })
+        return stats
+
+
+# Pool de connexions partagé par l'API (créé à la première utilisation)
 connection_pool = None
+_pool_lock = threading.Lock()
 
 
 def get_connection_pool():
-    """Crée un pool de connexions pour l'API."""
+    """Crée (une seule fois) le pool de connexions pour l'API."""
     global connection_pool
     if connection_pool is None:
-        connection_pool = psycopg2.pool.SimpleConnectionPool(
-            minconn=1,
-            maxconn=10,
-            **DB_CONFIG
-        )
+        with _pool_lock:
+            if connection_pool is None:
+                connection_pool = BoundedConnectionPool(
+                    minconn=DB_POOL_MIN,
+                    maxconn=DB_POOL_MAX,
+                    timeout=DB_POOL_TIMEOUT,
+                )
     return connection_pool
 
 
+@contextmanager
+def pooled_connection():
+    """
+    Emprunte une connexion au pool et la rend automatiquement.
+
+    Une transaction non validée est annulée au retour dans le pool.
+
+    Usage:
+        with pooled_connection() as conn:
+            ...
+    """
+    db_pool = get_connection_pool()
+    conn = db_pool.acquire()
+    try:
+        yield conn
+    except Exception:
+        if not conn.closed:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                pass
+        raise
+    finally:
+        db_pool.release(conn)
+
+
+@contextmanager
+def pooled_connection_dict():
+    """
+    Comme pooled_connection(), mais fournit aussi un curseur RealDictCursor.
+
+    Usage:
+        with pooled_connection_dict() as (conn, cur):
+            cur.execute(...)
+    """
+    with pooled_connection() as conn:
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        try:
+            yield conn, cur
+        finally:
+            cur.close()
+
+
+def get_pool_stats():
+    """Statistiques du pool (None s'il n'a pas encore été créé)."""
+    if connection_pool is None:
+        return None
+    return connection_pool.stats()
+
+
 def get_connection():
     """Retourne une nouvelle connexion à la base de données."""
     try:
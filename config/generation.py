@@ -0,0 +1,56 @@
+"""
+Compteur de génération des embeddings.
+
+scripts/generate_embeddings.py l'incrémente dans la transaction de chaque
+écriture validée dans film_embeddings (suppressions, lots d'embeddings) ; l'API s'en sert pour invalider automatiquement ses caches
+de résultats (les clés de cache incluent la génération courante).
+"""
+
+CREATE_GENERATION_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS embeddings_generation (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    generation BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+)
+"""
+
+GET_GENERATION_SQL = "SELECT generation FROM embeddings_generation WHERE id"
+
+BUMP_GENERATION_SQL = """
+INSERT INTO embeddings_generation (id, generation, updated_at)
+VALUES (TRUE, 1, CURRENT_TIMESTAMP)
+ON CONFLICT (id) DO UPDATE SET
+    generation = embeddings_generation.generation + 1,
+    updated_at = CURRENT_TIMESTAMP
+RETURNING generation
+"""
+
+
+def bump_embeddings_generation(cur) -> int:
+    """
+    Incrémente la génération des embeddings (dans la transaction qui modifie film_embeddings).
+
+    Args:
+        cur: curseur psycopg2 ; la transaction est validée par l'appelant
+
+    Returns:
+        La nouvelle génération
+    """
+    cur.execute(CREATE_GENERATION_TABLE_SQL)
+    cur.execute(BUMP_GENERATION_SQL)
+    row = cur.fetchone()
+    return row[0] if not isinstance(row, dict) else row["generation"]
+
+
+def get_embeddings_generation(cur) -> int:
+    """Retourne la génération courante (0 si aucune reconstruction n'a été enregistrée)."""
+    cur.execute("SELECT to_regclass('embeddings_generation') IS NOT NULL")
+    row = cur.fetchone()
+    exists = row[0] if not isinstance(row, dict) else list(row.values())[0]
+    if not exists:
+        return 0
+    cur.execute(GET_GENERATION_SQL)
+    row = cur.fetchone()
+    if row is None:
+        return 0
+    return row[0] if not isinstance(row, dict) else row["generation"]
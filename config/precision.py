@@ -0,0 +1,175 @@
+"""
+Précision de l'index vectoriel et recherche en deux temps (candidats puis rerank).
+
+- "full" : index HNSW sur les vecteurs float32 (comportement historique) ;
+- "half" : index HNSW sur `embedding::halfvec(D)` (2 octets par dimension) ;
+- "binary" : index HNSW sur `binary_quantize(embedding)::bit(D)` (1 bit par
+  dimension, distance de Hamming).
+
+Le nom de l'index ne dépend que de la précision : scripts/create_index.py
+peut le reconstruire en HNSW ou IVFFlat sans changer les requêtes.
+
+Les index réduits sont des index d'expression : film_embeddings garde les
+vecteurs complets, utilisés pour reclasser les candidats. L'index renvoie
+k x suréchantillonnage candidats, reclassés par distance cosinus exacte.
+Nécessite pgvector >= 0.7 pour "half" et "binary". pgvector n'ayant pas de
+type vectoriel int8 indexable, la quantification scalaire n'est pas proposée.
+"""
+import os
+
+EMBEDDING_PRECISION = os.getenv("EMBEDDING_PRECISION", "full")
+# Suréchantillonnage des candidats avant rerank (0 = valeur par défaut de la précision)
+RERANK_OVERSAMPLE = int(os.getenv("RERANK_OVERSAMPLE", "0"))
+# Sous-ensemble filtré parcouru exactement (sans index ANN) jusqu'à cette taille estimée.
+# Partagé par le planificateur de l'API et scripts/create_index.py --filtered : un
+# index partiel de EXACT_SEARCH_MAX_ROWS films ou moins ne serait jamais utilisé.
+EXACT_SEARCH_MAX_ROWS = int(os.getenv("EXACT_SEARCH_MAX_ROWS", "5000"))
+
+PRECISIONS = ("full", "half", "binary")
+INDEX_METHODS = ("hnsw", "ivfflat")
+
+_INDEX_NAMES = {
+    "full": "film_embeddings_hnsw_cosine",
+    "half": "film_embeddings_hnsw_half",
+    "binary": "film_embeddings_hnsw_binary",
+}
+
+_DEFAULT_OVERSAMPLE = {"full": 1, "half": 2, "binary": 10}
+
+# Copie des colonnes de filtrage de films (les prédicats d'index partiels
+# ne peuvent porter que sur la table indexée)
+ADD_FILTER_COLUMNS_SQL = """
+ALTER TABLE film_embeddings
+    ADD COLUMN IF NOT EXISTS genres TEXT[],
+    ADD COLUMN IF NOT EXISTS year INTEGER
+"""
+
+SYNC_FILTER_COLUMNS_SQL = """
+UPDATE film_embeddings fe
+SET genres = f.genres, year = f.year
+FROM films f
+WHERE f.id = fe.film_id
+AND (fe.genres IS DISTINCT FROM f.genres OR fe.year IS DISTINCT FROM f.year)
+"""
+
+# Index partiels disponibles, lus par le planificateur de l'API
+CREATE_FILTER_INDEXES_SQL = """
+CREATE TABLE IF NOT EXISTS vector_filter_indexes (
+    index_name TEXT PRIMARY KEY,
+    precision TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    value TEXT NOT NULL,
+    row_count INTEGER NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT NOW()
+)
+"""
+
+
+def check_precision(precision: str) -> str:
+    if precision not in PRECISIONS:
+        raise ValueError(f"Précision inconnue: {precision} ({', '.join(PRECISIONS)})")
+    return precision
+
+
+def index_name(precision: str) -> str:
+    """Nom de l'index HNSW d'une précision."""
+    return _INDEX_NAMES[check_precision(precision)]
+
+
+def index_expression(precision: str, dim: int) -> str:
+    """Expression indexée (doit être reprise à l'identique dans ORDER BY)."""
+    check_precision(precision)
+    if precision == "half":
+        return f"(fe.embedding::halfvec({dim}))"
+    if precision == "binary":
+        return f"(binary_quantize(fe.embedding)::bit({dim}))"
+    return "fe.embedding"
+
+
+def query_expression(precision: str, dim: int, param: str) -> str:
+    """Conversion du paramètre de requête (un `vector`) dans le type de l'index."""
+    check_precision(precision)
+    if precision == "half":
+        return f"(({param}::vector)::halfvec({dim}))"
+    if precision == "binary":
+        return f"(binary_quantize({param}::vector)::bit({dim}))"
+    return f"({param}::vector)"
+
+
+def distance_operator(precision: str) -> str:
+    return "<~>" if check_precision(precision) == "binary" else "<=>"
+
+
+def candidate_order_sql(precision: str, dim: int, param: str) -> str:
+    """Clause ORDER BY qui utilise l'index de la précision."""
+    return f"{index_expression(precision, dim)} {distance_operator(precision)} {query_expression(precision, dim, param)}"
+
+
+def oversample(precision: str) -> int:
+    """Facteur de suréchantillonnage des candidats avant rerank."""
+    return RERANK_OVERSAMPLE or _DEFAULT_OVERSAMPLE[check_precision(precision)]
+
+
+def create_index_sql(precision: str, dim: int, name: str = None, method: str = "hnsw",
+                     options: dict = None, concurrently: bool = False, where: str = None) -> str:
+    """
+    CREATE INDEX pour une précision.
+
+    Args:
+        method: "hnsw" ou "ivfflat"
+        options: paramètres de construction (ex: {"m": 16, "ef_construction": 64}
+            ou {"lists": 1000})
+        concurrently: construction sans bloquer les écritures (hors transaction)
+        where: prédicat d'index partiel (voir partial_index_predicate)
+    """
+    if method not in INDEX_METHODS:
+        raise ValueError(f"Type d'index inconnu: {method} ({', '.join(INDEX_METHODS)})")
+    opclass = {
+        "full": "vector_cosine_ops",
+        "half": "halfvec_cosine_ops",
+        "binary": "bit_hamming_ops",
+    }[check_precision(precision)]
+    expression = index_expression(precision, dim).replace("fe.", "")
+    with_clause = ""
+    if options:
+        with_clause = " WITH (" + ", ".join(f"{key} = {int(value)}" for key, value in options.items()) + ")"
+    return (f"CREATE INDEX {'CONCURRENTLY ' if concurrently else ''}IF NOT EXISTS {name or index_name(precision)} "
+            f"ON film_embeddings USING {method} ({expression} {opclass}){with_clause}"
+            + (f" WHERE {where}" if where else ""))
+
+
+def sql_literal(value: str) -> str:
+    """Littéral SQL d'une chaîne (les prédicats d'index partiels ne peuvent pas être paramétrés)."""
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def partial_index_predicate(kind: str, value, alias: str = "") -> str:
+    """
+    Prédicat d'un index partiel ("genre" ou "decade").
+
+    La même expression est utilisée à la création de l'index et dans les
+    requêtes : PostgreSQL n'utilise un index partiel que si la clause WHERE
+    implique son prédicat.
+    """
+    prefix = f"{alias}." if alias else ""
+    if kind == "genre":
+        return f"{prefix}genres @> ARRAY[{sql_literal(value)}]::text[]"
+    if kind == "decade":
+        start = int(value)
+        return f"{prefix}year >= {start} AND {prefix}year < {start + 10}"
+    raise ValueError(f"Type d'index partiel inconnu: {kind} (genre ou decade)")
+
+
+def partial_index_name(precision: str, kind: str, value) -> str:
+    """Nom d'un index partiel (identifiant SQL sûr, 63 caractères au plus)."""
+    slug = "".join(c if c.isalnum() else "_" for c in str(value).lower()).strip("_")
+    return f"{index_name(precision)}_{kind}_{slug}"[:63]
+
+
+def embedding_dimension(cur) -> int:
+    """Dimension des embeddings stockés (0 si la table est vide)."""
+    cur.execute("SELECT vector_dims(embedding) FROM film_embeddings LIMIT 1")
+    row = cur.fetchone()
+    if row is None:
+        return 0
+    return row[0] if not isinstance(row, dict) else row["vector_dims"]
@@ -0,0 +1,152 @@
+"""
+Transport des vecteurs pgvector entre NumPy et PostgreSQL.
+
+- encode_vector / decode_vector : format binaire de pgvector (asyncpg, COPY BINARY).
+- register_vector : adaptateur psycopg2 ; les tableaux NumPy passés en paramètre
+  deviennent des littéraux `vector` et les colonnes `vector` sont lues en
+  tableaux NumPy float32.
+- copy_vectors : insertion en masse par COPY ... (FORMAT BINARY), sans aucune
+  conversion en texte.
+
+psycopg2 n'envoie ses paramètres qu'en texte : les paramètres de requête
+utilisent la représentation décimale la plus courte qui redonne exactement le
+même float32 (sans perte, contrairement à un format fixe comme `.8f`).
+"""
+import io
+import struct
+
+import numpy as np
+import psycopg2
+import psycopg2.extensions
+
+# En-tête et fin de flux du format COPY binaire de PostgreSQL
+COPY_BINARY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, 0)
+COPY_BINARY_TRAILER = struct.pack(">h", -1)
+
+
+def encode_vector(value) -> bytes:
+    """Encode un vecteur au format binaire de pgvector (dim, unused, float32 big-endian)."""
+    arr = np.asarray(value, dtype=">f4")
+    if arr.ndim != 1:
+        raise ValueError("Un vecteur pgvector doit avoir une seule dimension")
+    return struct.pack(">HH", arr.shape[0], 0) + arr.tobytes()
+
+
+def decode_vector(data: bytes) -> np.ndarray:
+    """Décode le format binaire de pgvector en tableau NumPy float32."""
+    dim, _ = struct.unpack_from(">HH", data)
+    return np.frombuffer(data, dtype=">f4", count=dim, offset=4).astype(np.float32)
+
+
+def format_vector(value) -> str:
+    """Représentation texte `[x1,x2,...]` d'un vecteur, sans perte de précision float32."""
+    arr = np.asarray(value, dtype=np.float32)
+    if arr.ndim != 1:
+        raise ValueError("Un vecteur pgvector doit avoir une seule dimension")
+    return "[" + ",".join(arr.astype(str)) + "]"
+
+
+def parse_vector(value, cur=None):
+    """Typecaster psycopg2 : texte `[x1,x2,...]` -> tableau NumPy float32."""
+    if value is None:
+        return None
+    return np.fromstring(value[1:-1], dtype=np.float32, sep=",")
+
+
+class VectorAdapter:
+    """Adaptateur psycopg2 : un tableau NumPy devient un littéral `'[...]'::vector`."""
+
+    def __init__(self, value):
+        self.value = value
+
+    def getquoted(self) -> bytes:
+        return f"'{format_vector(self.value)}'::vector".encode("ascii")
+
+
+def register_vector(conn) -> bool:
+    """
+    Active la conversion NumPy <-> vector sur une connexion psycopg2.
+
+    Retourne False si l'extension pgvector n'est pas installée. La transaction
+    ouverte par la recherche du type est annulée si la connexion était inactive.
+    """
+    psycopg2.extensions.register_adapter(np.ndarray, VectorAdapter)
+
+    was_idle = conn.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_IDLE
+    cur = conn.cursor()
+    try:
+        cur.execute("""
+            SELECT t.oid, t.typarray
+            FROM pg_type t
+            WHERE t.oid = to_regtype('vector')
+        """)
+        row = cur.fetchone()
+    finally:
+        cur.close()
+        if was_idle and not conn.autocommit:
+            conn.rollback()
+    if row is None:
+        return False
+
+    if isinstance(row, dict):
+        oid, array_oid = row["oid"], row["typarray"]
+    else:
+        oid, array_oid = row
+    vector_type = psycopg2.extensions.new_type((oid,), "VECTOR", parse_vector)
+    psycopg2.extensions.register_type(vector_type, conn)
+    vector_array_type = psycopg2.extensions.new_array_type((array_oid,), "VECTOR[]", vector_type)
+    psycopg2.extensions.register_type(vector_array_type, conn)
+    return True
+
+
+def build_copy_buffer(ids, vectors) -> bytes:
+    """
+    Construit un flux COPY binaire de lignes (id INTEGER, embedding vector).
+
+    La construction est vectorisée : un seul tableau structuré NumPy dont les
+    octets sont exactement ceux attendus par PostgreSQL.
+    """
+    matrix = np.asarray(vectors, dtype=np.float32)
+    if matrix.ndim != 2:
+        raise ValueError("Les vecteurs doivent former une matrice (N, D)")
+    n, dim = matrix.shape
+    row_dtype = np.dtype([
+        ("field_count", ">i2"),
+        ("id_length", ">i4"),
+        ("id", ">i4"),
+        ("vector_length", ">i4"),
+        ("dim", ">u2"),
+        ("unused", ">u2"),
+        ("values", ">f4", (dim,)),
+    ])
+    rows = np.empty(n, dtype=row_dtype)
+    rows["field_count"] = 2
+    rows["id_length"] = 4
+    rows["id"] = np.asarray(ids, dtype=np.int64)
+    rows["vector_length"] = 4 + 4 * dim
+    rows["dim"] = dim
+    rows["unused"] = 0
+    rows["values"] = matrix
+    return COPY_BINARY_HEADER + rows.tobytes() + COPY_BINARY_TRAILER
+
+
+def copy_vectors(cur, table: str, ids, vectors, columns=("film_id", "embedding")) -> int:
+    """
+    Insère des couples (id, vecteur) dans `table` par COPY binaire.
+
+    Args:
+        cur: curseur psycopg2
+        table: table cible (souvent une table temporaire de transit)
+        ids: identifiants entiers (N,)
+        vectors: matrice (N, D) ou liste de vecteurs
+        columns: noms des deux colonnes cibles
+
+    Returns:
+        Nombre de lignes copiées
+    """
+    buffer = build_copy_buffer(ids, vectors)
+    cur.copy_expert(
+        f"COPY {table} ({columns[0]}, {columns[1]}) FROM STDIN WITH (FORMAT BINARY)",
+        io.BytesIO(buffer)
+    )
+    return len(ids)
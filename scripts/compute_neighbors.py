@@ -0,0 +1,188 @@
+"""
+Précalcul des plus proches voisins de chaque film (recommandations item-à-item).
+Rôle 2: Embeddings et indexation
+
+Charge tous les embeddings dans une matrice float32, calcule les similarités
+cosinus par blocs (produit matriciel) pour borner la mémoire, puis enregistre
+les `top_n` voisins de chaque film dans la table film_neighbors. L'endpoint
+/recommend/by-film sert ensuite ses résultats depuis cette table.
+"""
+import sys
+import time
+from pathlib import Path
+
+# Ajouter le répertoire parent au path pour les imports
+sys.path.append(str(Path(__file__).parent.parent))
+
+import numpy as np
+from psycopg2.extras import execute_values
+from config.database import get_connection
+from config.generation import get_embeddings_generation
+from config.vector import register_vector
+from dotenv import load_dotenv
+
+load_dotenv()
+
+CREATE_NEIGHBORS_TABLES_SQL = """
+CREATE TABLE IF NOT EXISTS film_neighbors (
+    film_id INTEGER NOT NULL REFERENCES films(id) ON DELETE CASCADE,
+    rank SMALLINT NOT NULL,
+    neighbor_id INTEGER NOT NULL REFERENCES films(id) ON DELETE CASCADE,
+    distance REAL NOT NULL,
+    PRIMARY KEY (film_id, rank)
+);
+
+CREATE TABLE IF NOT EXISTS film_neighbors_state (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    generation BIGINT NOT NULL,
+    top_n INTEGER NOT NULL,
+    computed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+
+def load_embedding_matrix(cur):
+    """
+    Charge tous les embeddings dans une matrice contiguë float32 normalisée.
+
+    Returns:
+        (film_ids, matrix) : tableau des ids (N,) et matrice (N, D)
+    """
+    cur.execute("SELECT film_id, embedding FROM film_embeddings ORDER BY film_id")
+    rows = cur.fetchall()
+    if not rows:
+        return np.empty(0, dtype=np.int64), np.empty((0, 0), dtype=np.float32)
+
+    film_ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+    matrix = np.vstack([row[1] for row in rows]).astype(np.float32, copy=False)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    matrix /= norms
+    return film_ids, np.ascontiguousarray(matrix)
+
+
+def iter_neighbors(film_ids, matrix, top_n=50, chunk_size=1024):
+    """
+    Calcule les `top_n` voisins de chaque film par blocs de `chunk_size` lignes.
+
+    La mémoire utilisée est bornée par chunk_size x N similarités à la fois.
+
+    Yields:
+        tuples (film_id, rank, neighbor_id, distance) avec distance = 1 - cosinus
+    """
+    n = len(film_ids)
+    top_n = min(top_n, n - 1)
+    if top_n <= 0:
+        return
+
+    for start in range(0, n, chunk_size):
+        stop = min(start + chunk_size, n)
+        sims = matrix[start:stop] @ matrix.T
+        # Exclure le film lui-même
+        sims[np.arange(stop - start), np.arange(start, stop)] = -np.inf
+
+        candidates = np.argpartition(-sims, top_n - 1, axis=1)[:, :top_n]
+        candidate_sims = np.take_along_axis(sims, candidates, axis=1)
+        order = np.argsort(-candidate_sims, axis=1)
+        neighbors = np.take_along_axis(candidates, order, axis=1)
+        neighbor_sims = np.take_along_axis(candidate_sims, order, axis=1)
+
+        for row in range(stop - start):
+            film_id = int(film_ids[start + row])
+            for rank in range(top_n):
+                yield (
+                    film_id,
+                    rank + 1,
+                    int(film_ids[neighbors[row, rank]]),
+                    float(1.0 - neighbor_sims[row, rank]),
+                )
+
+
+def compute_neighbors(top_n=50, chunk_size=1024, page_size=5000):
+    """
+    Recalcule entièrement la table film_neighbors.
+
+    Args:
+        top_n: nombre de voisins conservés par film
+        chunk_size: nombre de films traités par produit matriciel
+        page_size: nombre de lignes par INSERT
+    """
+    conn = get_connection()
+    register_vector(conn)
+    cur = conn.cursor()
+
+    try:
+        cur.execute(CREATE_NEIGHBORS_TABLES_SQL)
+        conn.commit()
+
+        generation = get_embeddings_generation(cur)
+
+        start = time.perf_counter()
+        film_ids, matrix = load_embedding_matrix(cur)
+        print(f"Embeddings chargés: {len(film_ids)} films, dimension {matrix.shape[1] if matrix.size else 0} "
+              f"({time.perf_counter() - start:.2f}s)")
+
+        if len(film_ids) < 2:
+            print("⚠ Pas assez d'embeddings. Générez d'abord les embeddings.")
+            return
+
+        # DELETE et non TRUNCATE (verrou ACCESS EXCLUSIVE jusqu'au COMMIT) : sous MVCC,
+        # /recommend/by-film continue de lire les anciennes lignes jusqu'au COMMIT
+        start = time.perf_counter()
+        cur.execute("DELETE FROM film_neighbors")
+        total = 0
+        batch = []
+        for row in iter_neighbors(film_ids, matrix, top_n=top_n, chunk_size=chunk_size):
+            batch.append(row)
+            if len(batch) >= page_size:
+                execute_values(
+                    cur,
+                    "INSERT INTO film_neighbors (film_id, rank, neighbor_id, distance) VALUES %s",
+                    batch,
+                    page_size=page_size
+                )
+                total += len(batch)
+                batch = []
+        if batch:
+            execute_values(
+                cur,
+                "INSERT INTO film_neighbors (film_id, rank, neighbor_id, distance) VALUES %s",
+                batch,
+                page_size=page_size
+            )
+            total += len(batch)
+
+        cur.execute("""
+            INSERT INTO film_neighbors_state (id, generation, top_n, computed_at)
+            VALUES (TRUE, %s, %s, CURRENT_TIMESTAMP)
+            ON CONFLICT (id) DO UPDATE SET
+                generation = EXCLUDED.generation,
+                top_n = EXCLUDED.top_n,
+                computed_at = EXCLUDED.computed_at
+        """, (generation, min(top_n, len(film_ids) - 1)))
+        conn.commit()
+
+        elapsed = time.perf_counter() - start
+        print(f"✓ {total} voisins enregistrés pour {len(film_ids)} films "
+              f"(génération {generation}, {elapsed:.2f}s)")
+
+    except Exception as e:
+        print(f"✗ Erreur lors du calcul des voisins: {e}")
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Précalculer les plus proches voisins de chaque film")
+    parser.add_argument("--top-n", type=int, default=50, help="Nombre de voisins par film")
+    parser.add_argument("--chunk-size", type=int, default=1024, help="Films par produit matriciel")
+    parser.add_argument("--page-size", type=int, default=5000, help="Lignes par INSERT")
+
+    args = parser.parse_args()
+
+    compute_neighbors(top_n=args.top_n, chunk_size=args.chunk_size, page_size=args.page_size)
@@ -1,18 +1,39 @@
 #!/usr/bin/env python3
 """
 Script pour créer l'index HNSW sur les embeddings
+
+--precision choisit l'index : "full" (vecteurs float32), "half" (halfvec) ou
+"binary" (bit, distance de Hamming). L'API doit utiliser la même valeur
+(EMBEDDING_PRECISION). --benchmark compare le recall@k et la latence des index
+présents à une recherche exacte.
+
+--rebuild reconstruit l'index (HNSW ou IVFFlat, paramètres au choix) sans
+interruption : construction CONCURRENTLY sous un nouveau nom, échange des
+noms dans une transaction, suppression de l'ancien index, puis mesure du
+recall@k.
+
+--filtered crée des index partiels par genre (les plus demandés dans
+search_history, sinon les plus fréquents) et par décennie. L'API s'en sert
+pour les recherches filtrées.
 """
 
 import sys
 import os
+import time
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from config.database import get_connection
+from config.precision import (
+    ADD_FILTER_COLUMNS_SQL, CREATE_FILTER_INDEXES_SQL, EMBEDDING_PRECISION, EXACT_SEARCH_MAX_ROWS,
+    INDEX_METHODS, PRECISIONS, SYNC_FILTER_COLUMNS_SQL, candidate_order_sql, create_index_sql,
+    embedding_dimension, index_name, oversample, partial_index_name, partial_index_predicate,
+)
+from config.vector import register_vector
 
-def create_hnsw_index():
+def create_hnsw_index(precision=EMBEDDING_PRECISION):
     """Crée l'index HNSW pour la recherche vectorielle."""
     print("=" * 60)
-    print("Création de l'index HNSW")
+    print(f"Création de l'index HNSW (précision: {precision})")
     print("=" * 60)
     print()
     
@@ -31,10 +52,7 @@ def create_hnsw_index():
         
         # Créer l'index HNSW
         print("Création de l'index HNSW (cela peut prendre quelques minutes)...")
-        cur.execute("""
-            CREATE INDEX IF NOT EXISTS film_embeddings_hnsw_cosine
-            ON film_embeddings USING hnsw (embedding vector_cosine_ops)
-        """)
+        cur.execute(create_index_sql(precision, embedding_dimension(cur)))
         conn.commit()
         
         # VACUUM doit être exécuté en dehors d'une transaction
@@ -67,6 +85,397 @@ def create_hnsw_index():
         cur.close()
         conn.close()
 
+
+def _top_ids(cur, query_sql, params):
+    start = time.perf_counter()
+    cur.execute(query_sql, params)
+    ids = [row[0] for row in cur.fetchall()]
+    return ids, (time.perf_counter() - start) * 1000
+
+
+def benchmark_precisions(k=10, sample_size=100, precisions=PRECISIONS, search_settings=None):
+    """
+    Compare les index de chaque précision à la recherche exacte.
+
+    Les requêtes sont les embeddings de `sample_size` films tirés au hasard.
+    La vérité terrain est obtenue sans index (parcours séquentiel). Pour
+    chaque précision dont l'index existe : recall@k, latence moyenne et
+    taille de l'index.
+
+    Args:
+        search_settings: paramètres de recherche appliqués à la session
+            (ex: {"hnsw.ef_search": 100} ou {"ivfflat.probes": 10})
+    """
+    conn = get_connection()
+    register_vector(conn)
+    cur = conn.cursor()
+
+    try:
+        for setting, value in (search_settings or {}).items():
+            cur.execute("SELECT set_config(%s, %s, false)", (setting, str(value)))
+
+        dim = embedding_dimension(cur)
+        if dim == 0:
+            print("⚠ Aucun embedding trouvé. Générez d'abord les embeddings.")
+            return {}
+
+        cur.execute("SELECT film_id, embedding FROM film_embeddings ORDER BY random() LIMIT %s", (sample_size,))
+        samples = cur.fetchall()
+
+        # Vérité terrain : recherche exacte, index désactivés
+        cur.execute("SET enable_indexscan = off")
+        exact_sql = """
+            SELECT film_id FROM film_embeddings
+            WHERE film_id <> %(film_id)s
+            ORDER BY embedding <=> %(q)s
+            LIMIT %(k)s
+        """
+        truth = {}
+        exact_ms = []
+        for film_id, embedding in samples:
+            truth[film_id], elapsed = _top_ids(cur, exact_sql, {"film_id": film_id, "q": embedding, "k": k})
+            exact_ms.append(elapsed)
+        cur.execute("RESET enable_indexscan")
+        conn.commit()
+
+        results = {"exact": {"recall": 1.0, "latency_ms": sum(exact_ms) / len(exact_ms), "index_mb": None}}
+        for precision in precisions:
+            cur.execute("SELECT pg_relation_size(to_regclass(%s))", (index_name(precision),))
+            size = cur.fetchone()[0]
+            if size is None:
+                print(f"⚠ {precision}: index {index_name(precision)} absent (--precision {precision})")
+                continue
+
+            candidates = k * oversample(precision) if precision != "full" else k
+            query_sql = f"""
+                WITH candidates AS (
+                    SELECT fe.film_id, fe.embedding
+                    FROM film_embeddings fe
+                    WHERE fe.film_id <> %(film_id)s
+                    ORDER BY {candidate_order_sql(precision, dim, "%(q)s")}
+                    LIMIT %(candidates)s
+                )
+                SELECT film_id FROM candidates
+                ORDER BY embedding <=> %(q)s
+                LIMIT %(k)s
+            """
+            hits = 0
+            latencies = []
+            for film_id, embedding in samples:
+                ids, elapsed = _top_ids(cur, query_sql, {
+                    "film_id": film_id, "q": embedding, "k": k, "candidates": candidates,
+                })
+                hits += len(set(ids) & set(truth[film_id]))
+                latencies.append(elapsed)
+            conn.commit()
+            results[precision] = {
+                "recall": hits / sum(len(ids) for ids in truth.values()),
+                "latency_ms": sum(latencies) / len(latencies),
+                "index_mb": size / 1e6,
+            }
+
+        print(f"\n{'Précision':<10} {'recall@' + str(k):>10} {'latence (ms)':>13} {'index (Mo)':>11}")
+        for precision, result in results.items():
+            index_mb = f"{result['index_mb']:.1f}" if result["index_mb"] is not None else "-"
+            print(f"{precision:<10} {result['recall']:>10.3f} {result['latency_ms']:>13.2f} {index_mb:>11}")
+        return results
+
+    finally:
+        cur.close()
+        conn.close()
+
+def _default_lists(count):
+    """Nombre de listes IVFFlat conseillé par pgvector : lignes/1000, puis racine au-delà d'un million."""
+    if count <= 1_000_000:
+        return max(1, count // 1000)
+    return int(count ** 0.5)
+
+
+def rebuild_vector_index(precision=EMBEDDING_PRECISION, method="hnsw", m=16, ef_construction=64,
+                         lists=None, maintenance_work_mem="1GB", workers=2,
+                         k=10, sample_size=100, ef_search=None, probes=None):
+    """
+    Reconstruit l'index vectoriel d'une précision sans bloquer les requêtes.
+
+    1. CREATE INDEX CONCURRENTLY sous le nom <index>_new (les lectures et
+       écritures continuent pendant la construction) ;
+    2. échange des noms dans une seule transaction ;
+    3. DROP INDEX CONCURRENTLY de l'ancien index ;
+    4. recall@k du nouvel index contre la recherche exacte.
+
+    Args:
+        precision: "full", "half" ou "binary"
+        method: "hnsw" ou "ivfflat"
+        m, ef_construction: paramètres de construction HNSW
+        lists: nombre de listes IVFFlat (défaut: selon le nombre de lignes)
+        maintenance_work_mem: mémoire de construction (le graphe HNSW doit y tenir)
+        workers: max_parallel_maintenance_workers pour la construction
+        k, sample_size: paramètres de la mesure du recall
+        ef_search / probes: paramètre de recherche utilisé pour la mesure
+    """
+    name = index_name(precision)
+    new_name = f"{name}_new"
+    old_name = f"{name}_old"
+
+    print("=" * 60)
+    print(f"Reconstruction de l'index {name} ({method}, précision: {precision})")
+    print("=" * 60)
+
+    conn = get_connection()
+    # CREATE/DROP INDEX CONCURRENTLY ne peuvent pas s'exécuter dans une transaction
+    conn.autocommit = True
+    cur = conn.cursor()
+
+    try:
+        cur.execute("SELECT COUNT(*) FROM film_embeddings")
+        count = cur.fetchone()[0]
+        dim = embedding_dimension(cur)
+        if count == 0:
+            print("⚠ Aucun embedding trouvé. Générez d'abord les embeddings.")
+            return None
+
+        if method == "hnsw":
+            options = {"m": m, "ef_construction": ef_construction}
+        else:
+            options = {"lists": lists or _default_lists(count)}
+
+        cur.execute("SELECT set_config('maintenance_work_mem', %s, false)", (maintenance_work_mem,))
+        cur.execute("SELECT set_config('max_parallel_maintenance_workers', %s, false)", (str(workers),))
+
+        # Reste éventuel d'une construction interrompue (index invalide)
+        cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {new_name}")
+        cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {old_name}")
+
+        print(f"Construction de {new_name} sur {count} embeddings {options} "
+              f"(maintenance_work_mem={maintenance_work_mem}, workers={workers})...")
+        start = time.perf_counter()
+        cur.execute(create_index_sql(precision, dim, name=new_name, method=method,
+                                     options=options, concurrently=True))
+        print(f"✓ Index construit en {time.perf_counter() - start:.1f}s")
+
+        # Échange atomique : les requêtes voient l'ancien ou le nouvel index, jamais aucun
+        conn.autocommit = False
+        cur.execute(f"ALTER INDEX IF EXISTS {name} RENAME TO {old_name}")
+        cur.execute(f"ALTER INDEX {new_name} RENAME TO {name}")
+        conn.commit()
+        conn.autocommit = True
+        cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {old_name}")
+        cur.execute("ANALYZE film_embeddings")
+        print(f"✓ {name} remplacé")
+
+    except Exception as e:
+        print(f"✗ Erreur lors de la reconstruction de l'index: {e}")
+        if not conn.autocommit:
+            conn.rollback()
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+    search_settings = {}
+    if method == "hnsw" and ef_search:
+        search_settings["hnsw.ef_search"] = ef_search
+    if method == "ivfflat":
+        search_settings["ivfflat.probes"] = probes or max(1, int(options["lists"] ** 0.5))
+    return benchmark_precisions(k=k, sample_size=sample_size, precisions=(precision,),
+                                search_settings=search_settings)
+
+
+def _popular_genres(cur, limit):
+    """Genres les plus demandés dans search_history, complétés par les plus fréquents."""
+    genres = []
+    try:
+        cur.execute("""
+            SELECT g.genre
+            FROM search_history sh
+            CROSS JOIN LATERAL jsonb_array_elements_text(sh.filters::jsonb -> 'genres') AS g(genre)
+            WHERE jsonb_typeof(sh.filters::jsonb -> 'genres') = 'array'
+            GROUP BY g.genre
+            ORDER BY COUNT(*) DESC
+            LIMIT %s
+        """, (limit,))
+        genres = [row[0].strip() for row in cur.fetchall()]
+    except Exception as e:
+        print(f"⚠ Historique des recherches indisponible ({e}), genres les plus fréquents")
+    # Connexion en autocommit : pas de transaction à annuler après une erreur
+    cur.execute("""
+        SELECT g.genre
+        FROM film_embeddings fe
+        CROSS JOIN LATERAL unnest(fe.genres) AS g(genre)
+        GROUP BY g.genre
+        ORDER BY COUNT(*) DESC
+    """)
+    for (genre,) in cur.fetchall():
+        if len(genres) >= limit:
+            break
+        if genre not in genres:
+            genres.append(genre)
+    return genres[:limit]
+
+
+def create_filtered_indexes(precision=EMBEDDING_PRECISION, genres=None, top_genres=8, decades=True,
+                            min_rows=None, m=16, ef_construction=64, maintenance_work_mem="1GB", workers=2):
+    """
+    Crée les index HNSW partiels par genre et par décennie.
+
+    Un index partiel ne contient que les films de son sous-ensemble : une
+    recherche filtrée y trouve k résultats sans parcourir les films écartés
+    par le filtre. Les sous-ensembles de EXACT_SEARCH_MAX_ROWS films ou moins
+    ne sont pas indexés : l'API les parcourt exactement et n'utiliserait jamais
+    leur index.
+
+    Args:
+        genres: genres à indexer (défaut: les `top_genres` plus demandés)
+        decades: créer aussi un index par décennie
+        min_rows: taille minimale d'un sous-ensemble indexé (au moins EXACT_SEARCH_MAX_ROWS + 1)
+    """
+    print("=" * 60)
+    print(f"Index partiels par genre et par décennie (précision: {precision})")
+    print("=" * 60)
+
+    if min_rows is not None and min_rows <= EXACT_SEARCH_MAX_ROWS:
+        print(f"⚠ --min-rows {min_rows} relevé à {EXACT_SEARCH_MAX_ROWS + 1} : l'API parcourt exactement "
+              f"les sous-ensembles de {EXACT_SEARCH_MAX_ROWS} films ou moins (EXACT_SEARCH_MAX_ROWS)")
+    min_rows = max(min_rows or 0, EXACT_SEARCH_MAX_ROWS + 1)
+
+    conn = get_connection()
+    conn.autocommit = True
+    cur = conn.cursor()
+
+    try:
+        cur.execute(ADD_FILTER_COLUMNS_SQL)
+        cur.execute(SYNC_FILTER_COLUMNS_SQL)
+        cur.execute(CREATE_FILTER_INDEXES_SQL)
+        dim = embedding_dimension(cur)
+        if dim == 0:
+            print("⚠ Aucun embedding trouvé. Générez d'abord les embeddings.")
+            return []
+
+        targets = []
+        for genre in genres or _popular_genres(cur, top_genres):
+            cur.execute("SELECT COUNT(*) FROM film_embeddings WHERE genres @> ARRAY[%s]::text[]", (genre,))
+            targets.append(("genre", genre, cur.fetchone()[0]))
+        if decades:
+            cur.execute("""
+                SELECT (year / 10) * 10 AS decade, COUNT(*)
+                FROM film_embeddings
+                WHERE year IS NOT NULL
+                GROUP BY 1
+                ORDER BY 1
+            """)
+            targets.extend(("decade", str(decade), count) for decade, count in cur.fetchall())
+
+        cur.execute("SELECT set_config('maintenance_work_mem', %s, false)", (maintenance_work_mem,))
+        cur.execute("SELECT set_config('max_parallel_maintenance_workers', %s, false)", (str(workers),))
+
+        created = []
+        skipped = []
+        for kind, value, count in targets:
+            name = partial_index_name(precision, kind, value)
+            if count < min_rows:
+                skipped.append(f"{kind} {value}")
+                print(f"  - {kind} {value}: {count} films, recherche exacte (pas d'index)")
+                continue
+            start = time.perf_counter()
+            cur.execute(create_index_sql(
+                precision, dim, name=name, options={"m": m, "ef_construction": ef_construction},
+                concurrently=True, where=partial_index_predicate(kind, value),
+            ))
+            cur.execute("""
+                INSERT INTO vector_filter_indexes (index_name, precision, kind, value, row_count)
+                VALUES (%s, %s, %s, %s, %s)
+                ON CONFLICT (index_name) DO UPDATE SET
+                    row_count = EXCLUDED.row_count,
+                    created_at = NOW()
+            """, (name, precision, kind, value, count))
+            created.append(name)
+            print(f"  ✓ {name}: {count} films ({time.perf_counter() - start:.1f}s)")
+
+        cur.execute("ANALYZE film_embeddings")
+        print(f"\n✓ {len(created)} index partiels prêts")
+        if skipped:
+            print(f"  {len(skipped)} sous-ensembles de moins de {min_rows} films non indexés "
+                  f"(recherche exacte): {', '.join(skipped)}")
+        return created
+
+    except Exception as e:
+        print(f"✗ Erreur lors de la création des index partiels: {e}")
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+
 if __name__ == "__main__":
-    create_hnsw_index()
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Créer l'index HNSW sur les embeddings")
+    parser.add_argument("--precision", choices=PRECISIONS, default=EMBEDDING_PRECISION,
+                        help="Précision de l'index (full, half, binary)")
+    parser.add_argument("--benchmark", action="store_true",
+                        help="Comparer recall@k et latence des index présents à la recherche exacte")
+    parser.add_argument("--k", type=int, default=10, help="k du recall@k (--benchmark, --rebuild)")
+    parser.add_argument("--sample-size", type=int, default=100,
+                        help="Requêtes utilisées pour le recall (--benchmark, --rebuild)")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="Reconstruire l'index sans interruption (CONCURRENTLY + échange)")
+    parser.add_argument("--method", choices=INDEX_METHODS, default="hnsw", help="Type d'index (--rebuild)")
+    parser.add_argument("--m", type=int, default=16, help="HNSW: connexions par nœud")
+    parser.add_argument("--ef-construction", type=int, default=64, help="HNSW: taille de la liste de construction")
+    parser.add_argument("--lists", type=int, default=None, help="IVFFlat: nombre de listes (défaut: lignes/1000)")
+    parser.add_argument("--maintenance-work-mem", type=str, default="1GB",
+                        help="maintenance_work_mem pour la construction")
+    parser.add_argument("--workers", type=int, default=2,
+                        help="max_parallel_maintenance_workers pour la construction")
+    parser.add_argument("--ef-search", type=int, default=None, help="HNSW: hnsw.ef_search pour la mesure")
+    parser.add_argument("--probes", type=int, default=None,
+                        help="IVFFlat: ivfflat.probes pour la mesure (défaut: racine de lists)")
+    parser.add_argument("--filtered", action="store_true",
+                        help="Créer les index partiels par genre et par décennie")
+    parser.add_argument("--genres", type=str, default=None,
+                        help="Genres à indexer, séparés par des virgules (--filtered)")
+    parser.add_argument("--top-genres", type=int, default=8,
+                        help="Nombre de genres les plus demandés à indexer (--filtered)")
+    parser.add_argument("--no-decades", action="store_true", help="Pas d'index par décennie (--filtered)")
+    parser.add_argument("--min-rows", type=int, default=None,
+                        help="Taille minimale d'un sous-ensemble indexé (--filtered, "
+                             "défaut et minimum: EXACT_SEARCH_MAX_ROWS + 1)")
+
+    args = parser.parse_args()
+
+    if args.benchmark:
+        search_settings = {}
+        if args.ef_search:
+            search_settings["hnsw.ef_search"] = args.ef_search
+        if args.probes:
+            search_settings["ivfflat.probes"] = args.probes
+        benchmark_precisions(k=args.k, sample_size=args.sample_size, search_settings=search_settings)
+    elif args.filtered:
+        create_filtered_indexes(
+            precision=args.precision,
+            genres=[g.strip() for g in args.genres.split(",")] if args.genres else None,
+            top_genres=args.top_genres,
+            decades=not args.no_decades,
+            min_rows=args.min_rows,
+            m=args.m,
+            ef_construction=args.ef_construction,
+            maintenance_work_mem=args.maintenance_work_mem,
+            workers=args.workers,
+        )
+    elif args.rebuild:
+        rebuild_vector_index(
+            precision=args.precision,
+            method=args.method,
+            m=args.m,
+            ef_construction=args.ef_construction,
+            lists=args.lists,
+            maintenance_work_mem=args.maintenance_work_mem,
+            workers=args.workers,
+            k=args.k,
+            sample_size=args.sample_size,
+            ef_search=args.ef_search,
+            probes=args.probes,
+        )
+    else:
+        create_hnsw_index(args.precision)
 
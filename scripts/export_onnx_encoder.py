@@ -0,0 +1,200 @@
+"""
+Export de l'encodeur de requêtes vers ONNX (fp32 et int8) et contrôle de parité.
+Rôle 2: Embeddings et indexation
+
+Produit dans models/onnx/<modèle>/ :
+- model.onnx : transformer exporté (fp32) ;
+- model_int8.onnx : même graphe, poids quantifiés dynamiquement en int8 ;
+- tokenizer.json et encoder_config.json (pooling, longueur maximale).
+
+L'API les charge avec QUERY_ENCODER_BACKEND=onnx ou onnx-int8. Le contrôle de
+parité compare les scores cosinus requête/film de chaque variante à ceux du
+modèle PyTorch fp32.
+"""
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+# Ajouter le répertoire parent au path pour les imports
+sys.path.append(str(Path(__file__).parent.parent))
+
+import numpy as np
+from dotenv import load_dotenv
+
+from api.query_encoder import ENCODER_CONFIG_FILE, ONNX_BACKENDS, OnnxQueryEncoder, default_onnx_dir
+
+load_dotenv()
+
+# Requêtes utilisées pour le contrôle de parité (complétées par les films de la base)
+PARITY_QUERIES = [
+    "film de science-fiction dans l'espace",
+    "comédie romantique à Paris",
+    "un braquage qui tourne mal",
+    "animated movie for kids with talking animals",
+    "drame historique pendant la seconde guerre mondiale",
+    "thriller psychologique avec un tueur en série",
+    "super-héros qui sauvent le monde",
+    "documentary about music",
+]
+
+
+def export_onnx_encoder(model_name=None, output_dir=None, opset=17, quantize=True):
+    """
+    Exporte le transformer du modèle SentenceTransformer vers ONNX.
+
+    Args:
+        model_name: nom du modèle (par défaut EMBEDDING_MODEL)
+        output_dir: dossier de sortie (par défaut models/onnx/<modèle>)
+        opset: version d'opset ONNX
+        quantize: produire aussi la variante int8 (quantification dynamique)
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    if model_name is None:
+        model_name = os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-mpnet-base-v2")
+    output_dir = Path(output_dir) if output_dir else default_onnx_dir(model_name)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    print(f"Chargement du modèle: {model_name}")
+    model = SentenceTransformer(model_name, device="cpu")
+    transformer = model[0].auto_model.eval()
+    tokenizer = model[0].tokenizer
+
+    pooling = model[1].get_pooling_mode_str() if len(model) > 1 else "mean"
+    if pooling not in ("mean", "cls"):
+        raise ValueError(f"Pooling non supporté par l'encodeur ONNX: {pooling}")
+
+    features = tokenizer(["exemple de requête"], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in features]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+    fp32_path = output_dir / ONNX_BACKENDS["onnx"]
+    start = time.perf_counter()
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer,
+            ({name: features[name] for name in input_names},),
+            str(fp32_path),
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=opset,
+        )
+    print(f"✓ Export fp32: {fp32_path} ({fp32_path.stat().st_size / 1e6:.0f} Mo, "
+          f"{time.perf_counter() - start:.1f}s)")
+
+    tokenizer.save_pretrained(str(output_dir))
+    config = {
+        "model_name": model_name,
+        "max_seq_length": model.max_seq_length,
+        "pooling": pooling,
+        "pad_token": tokenizer.pad_token,
+        "pad_token_id": tokenizer.pad_token_id,
+    }
+    with open(output_dir / ENCODER_CONFIG_FILE, "w", encoding="utf-8") as f:
+        json.dump(config, f, indent=2)
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        int8_path = output_dir / ONNX_BACKENDS["onnx-int8"]
+        quantize_dynamic(str(fp32_path), str(int8_path), weight_type=QuantType.QInt8)
+        print(f"✓ Quantification int8: {int8_path} ({int8_path.stat().st_size / 1e6:.0f} Mo)")
+
+    return output_dir
+
+
+def load_parity_texts(sample_size):
+    """Textes des premiers films (comme generate_embeddings), ou liste vide sans base."""
+    try:
+        from config.database import get_connection
+        from scripts.generate_embeddings import build_film_text
+
+        conn = get_connection()
+        cur = conn.cursor()
+        cur.execute('SELECT id, title, synopsis, genres, "cast" FROM films ORDER BY id LIMIT %s', (sample_size,))
+        texts = [build_film_text(film) for film in cur.fetchall()]
+        cur.close()
+        conn.close()
+        return texts
+    except Exception as e:
+        print(f"⚠ Films indisponibles pour le contrôle de parité ({e}), requêtes seules")
+        return []
+
+
+def mean_latency_ms(encoder, queries, repeat=3):
+    """Latence moyenne d'encodage d'une requête seule (cas de /search)."""
+    encoder.encode(queries[0], normalize_embeddings=True)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for query in queries:
+            encoder.encode(query, normalize_embeddings=True)
+    return (time.perf_counter() - start) * 1000 / (repeat * len(queries))
+
+
+def check_parity(model_name=None, model_dir=None, sample_size=500, k=10):
+    """
+    Compare les variantes ONNX au modèle PyTorch fp32.
+
+    Pour chaque variante : cosinus entre embeddings fp32 et variante, écart
+    maximal des scores cosinus requête/film, recouvrement des top-k et latence
+    d'une requête seule.
+    """
+    from sentence_transformers import SentenceTransformer
+
+    if model_name is None:
+        model_name = os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-mpnet-base-v2")
+    model_dir = Path(model_dir) if model_dir else default_onnx_dir(model_name)
+
+    films = load_parity_texts(sample_size)
+    queries = PARITY_QUERIES
+    corpus = films or queries
+
+    reference = SentenceTransformer(model_name, device="cpu")
+    ref_queries = reference.encode(queries, normalize_embeddings=True)
+    ref_corpus = reference.encode(corpus, normalize_embeddings=True)
+    ref_scores = ref_queries @ ref_corpus.T
+    k = min(k, len(corpus))
+    ref_top = np.argsort(-ref_scores, axis=1)[:, :k]
+    print(f"Référence torch fp32: {mean_latency_ms(reference, queries):.1f} ms/requête")
+
+    for backend in ONNX_BACKENDS:
+        try:
+            encoder = OnnxQueryEncoder(model_dir, backend=backend)
+        except FileNotFoundError as e:
+            print(f"⚠ {backend}: {e}")
+            continue
+        var_queries = encoder.encode(queries, normalize_embeddings=True)
+        var_corpus = encoder.encode(corpus, normalize_embeddings=True)
+        cosines = np.concatenate([
+            np.sum(ref_queries * var_queries, axis=1),
+            np.sum(ref_corpus * var_corpus, axis=1),
+        ])
+        scores = var_queries @ var_corpus.T
+        top = np.argsort(-scores, axis=1)[:, :k]
+        overlap = np.mean([len(set(a) & set(b)) / k for a, b in zip(ref_top, top)])
+        print(f"{backend}: cosinus vs fp32 min {cosines.min():.5f} / moyen {cosines.mean():.5f}, "
+              f"écart max des scores {np.abs(scores - ref_scores).max():.5f}, "
+              f"recouvrement top-{k} {overlap:.1%}, {mean_latency_ms(encoder, queries):.1f} ms/requête")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Exporter l'encodeur de requêtes vers ONNX (fp32 / int8)")
+    parser.add_argument("--model", type=str, default=None, help="Nom du modèle SentenceTransformer")
+    parser.add_argument("--output-dir", type=str, default=None, help="Dossier de sortie")
+    parser.add_argument("--opset", type=int, default=17, help="Version d'opset ONNX")
+    parser.add_argument("--no-quantize", action="store_true", help="Ne pas produire la variante int8")
+    parser.add_argument("--check-only", action="store_true", help="Contrôle de parité sans réexporter")
+    parser.add_argument("--sample-size", type=int, default=500, help="Films utilisés pour la parité")
+
+    args = parser.parse_args()
+
+    if not args.check_only:
+        export_onnx_encoder(args.model, args.output_dir, opset=args.opset, quantize=not args.no_quantize)
+    check_parity(args.model, args.output_dir, sample_size=args.sample_size)
@@ -4,6 +4,13 @@ Rôle 2: Embeddings et indexation
 """
 import sys
 import os
+import hashlib
+import itertools
+import json
+import multiprocessing as mp
+import queue
+import threading
+import time
 from pathlib import Path
 
 # Ajouter le répertoire parent au path pour les imports
@@ -12,11 +19,45 @@ sys.path.append(str(Path(__file__).parent.parent))
 import numpy as np
 from sentence_transformers import SentenceTransformer
 from config.database import get_connection
+from config.generation import bump_embeddings_generation, get_embeddings_generation
+from config.precision import (
+    ADD_FILTER_COLUMNS_SQL, PRECISIONS, SYNC_FILTER_COLUMNS_SQL, create_index_sql,
+    embedding_dimension, index_name,
+)
+from config.vector import copy_vectors, register_vector
 from dotenv import load_dotenv
 from psycopg2.extras import execute_values
 
 load_dotenv()
 
+# Table de transit : COPY binaire n'a pas d'ON CONFLICT, la fusion se fait ensuite en SQL
+CREATE_STAGE_TABLE_SQL = """
+CREATE TEMP TABLE IF NOT EXISTS film_embeddings_stage (
+    film_id INTEGER NOT NULL,
+    embedding vector NOT NULL
+) ON COMMIT DELETE ROWS
+"""
+
+MERGE_STAGE_SQL = """
+INSERT INTO film_embeddings (film_id, embedding, model_name)
+SELECT film_id, embedding, %s FROM film_embeddings_stage
+ON CONFLICT (film_id) DO UPDATE SET
+    embedding = EXCLUDED.embedding,
+    model_name = EXCLUDED.model_name
+"""
+
+# Empreinte du texte encodé et modèle utilisé : seuls les films modifiés sont ré-encodés
+ADD_TRACKING_COLUMNS_SQL = """
+ALTER TABLE film_embeddings
+    ADD COLUMN IF NOT EXISTS content_hash TEXT,
+    ADD COLUMN IF NOT EXISTS model_name TEXT
+"""
+
+DELETE_ORPHAN_EMBEDDINGS_SQL = """
+DELETE FROM film_embeddings fe
+WHERE NOT EXISTS (SELECT 1 FROM films f WHERE f.id = fe.film_id)
+"""
+
 def build_film_text(film_data, include_title=True, include_synopsis=True, 
                     include_genres=True, include_cast=True):
     """
@@ -53,76 +94,503 @@ def build_film_text(film_data, include_title=True, include_synopsis=True,
     return " ; ".join(parts)
 
 
-def generate_embeddings(model_name=None, batch_size=32, normalize=True):
+def content_hash(text, normalize=True):
+    """Empreinte SHA-256 du texte encodé (la normalisation change aussi le vecteur)."""
+    payload = f"{'norm' if normalize else 'raw'}\n{text}"
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+# Films et empreinte stockée, lus dans l'ordre des id (curseur côté serveur en mode parallèle)
+FILMS_WITH_HASHES_SQL = """
+SELECT f.id, f.title, f.synopsis, f.genres, f."cast",
+       fe.film_id IS NOT NULL AS has_embedding, fe.content_hash, fe.model_name
+FROM films f
+LEFT JOIN film_embeddings fe ON fe.film_id = f.id
+ORDER BY f.id
+"""
+
+
+def iter_films_to_encode(cur, model_name, summary, normalize=True, full=False):
     """
-    Génère les embeddings pour tous les films.
+    Parcourt les films (requête déjà exécutée sur `cur`) et produit ceux à encoder.
     
-    Args:
-        model_name: nom du modèle SentenceTransformer (par défaut depuis .env)
-        batch_size: taille des lots pour la génération
-        normalize: normaliser les embeddings (recommandé pour distance cosinus)
+    Met à jour `summary` (nouveaux / modifiés / changement de modèle / inchangés).
+    
+    Yields:
+        (film_id, texte, empreinte)
+    """
+    for row in cur:
+        film = row[:5]
+        has_embedding, stored_hash, stored_model = row[5:]
+        text = build_film_text(film)
+        film_hash = content_hash(text, normalize)
+        if not has_embedding:
+            summary["new"] += 1
+        elif full or stored_hash != film_hash:
+            summary["changed"] += 1
+        elif stored_model != model_name:
+            summary["model_changed"] += 1
+        else:
+            summary["unchanged"] += 1
+            continue
+        yield film[0], text, film_hash
+
+
+def diff_films(cur, model_name, normalize=True, full=False):
+    """
+    Compare les films aux embeddings existants.
+    
+    Returns:
+        (to_encode, summary) : liste de (film_id, texte, empreinte) à encoder et
+        compteurs nouveaux / modifiés / changement de modèle / inchangés
+    """
+    summary = {"new": 0, "changed": 0, "model_changed": 0, "unchanged": 0}
+    cur.execute(FILMS_WITH_HASHES_SQL)
+    to_encode = list(iter_films_to_encode(cur, model_name, summary, normalize=normalize, full=full))
+    return to_encode, summary
+
+
+def write_embeddings(cur, model_name, film_ids, hashes, embeddings):
+    """Écrit un lot en binaire (COPY vers la table de transit, fusion, puis empreintes)."""
+    copy_vectors(cur, "film_embeddings_stage", film_ids, embeddings)
+    cur.execute(MERGE_STAGE_SQL, (model_name,))
+    execute_values(
+        cur,
+        """
+        UPDATE film_embeddings fe SET content_hash = v.content_hash
+        FROM (VALUES %s) AS v(film_id, content_hash)
+        WHERE fe.film_id = v.film_id
+        """,
+        list(zip(film_ids, hashes)),
+        page_size=len(film_ids)
+    )
+
+
+def token_lengths(tokenizer, texts, max_length):
+    """Longueur en tokens (tronquée à `max_length`) de chaque texte, en un seul appel au tokenizer."""
+    encoded = tokenizer(list(texts), add_special_tokens=True, truncation=True, max_length=max_length)
+    return np.fromiter((len(ids) for ids in encoded["input_ids"]), dtype=np.int64, count=len(texts))
+
+
+def model_max_seq_length(model_name, tokenizer):
+    """
+    max_seq_length du modèle SentenceTransformer (384 pour all-mpnet-base-v2), sans charger ses poids.
+
+    Lu dans sentence_bert_config.json (dossier local ou hub) ; à défaut, la
+    limite du tokenizer (bornée à 512).
+    """
+    try:
+        config_path = Path(model_name) / "sentence_bert_config.json"
+        if not config_path.exists():
+            from huggingface_hub import hf_hub_download
+            config_path = hf_hub_download(model_name, "sentence_bert_config.json")
+        with open(config_path, encoding="utf-8") as f:
+            return int(json.load(f)["max_seq_length"])
+    except Exception:
+        return min(tokenizer.model_max_length, 512)
+
+
+def length_bucketed_batches(items, lengths, token_budget):
+    """
+    Regroupe des films de longueurs voisines en lots dont le coût avec padding
+    (taille du lot x plus longue séquence) reste sous `token_budget`.
+    
+    Les plus longs passent en premier : un manque de mémoire apparaît dès le premier lot.
+    
+    Yields:
+        listes d'éléments de `items`
+    """
+    batch = []
+    longest = 0
+    for index in np.argsort(-lengths, kind="stable"):
+        if not batch:
+            longest = int(lengths[index])
+        elif (len(batch) + 1) * longest > token_budget:
+            yield batch
+            batch = []
+            longest = int(lengths[index])
+        batch.append(items[index])
+    if batch:
+        yield batch
+
+
+def iter_batches(films, batch_size, token_budget=None, tokenizer=None, max_length=None, window=None):
+    """
+    Découpe un flux de (film_id, texte, empreinte) en lots à encoder.
+    
+    Sans `token_budget` : lots fixes de `batch_size` dans l'ordre des id.
+    Avec `token_budget` : les films sont tokenisés une fois, triés par longueur
+    et regroupés en lots de taille variable (voir length_bucketed_batches), par
+    fenêtres de `window` films (None = tout le flux d'un coup).
+    """
+    if not token_budget:
+        batch = []
+        for film in films:
+            batch.append(film)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+        return
+    
+    films = iter(films)
+    while True:
+        chunk = list(itertools.islice(films, window)) if window else list(films)
+        if not chunk:
+            return
+        lengths = token_lengths(tokenizer, [text for _, text, _ in chunk], max_length)
+        yield from length_bucketed_batches(chunk, lengths, token_budget)
+        if not window:
+            return
+
+
+def benchmark_batching(model_name=None, batch_size=32, token_budget=8192, sample_size=1000, normalize=True):
+    """
+    Compare les lots fixes (--batch-size) au regroupement par longueur (--token-budget)
+    sur les `sample_size` premiers films, sans rien écrire en base.
     """
     if model_name is None:
         model_name = os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-mpnet-base-v2")
     
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute('SELECT id, title, synopsis, genres, "cast" FROM films ORDER BY id LIMIT %s', (sample_size,))
+    items = [(film[0], build_film_text(film), None) for film in cur.fetchall()]
+    cur.close()
+    conn.close()
+    if not items:
+        print("⚠ Aucun film à encoder.")
+        return
+    
     print(f"Chargement du modèle: {model_name}")
     model = SentenceTransformer(model_name)
+    # Préchauffage (allocation des buffers, compilation des noyaux)
+    model.encode([text for _, text, _ in items[:batch_size]], normalize_embeddings=normalize,
+                 show_progress_bar=False)
     
-    # Vérifier la dimension
-    sample_embedding = model.encode(["test"], normalize_embeddings=normalize)[0]
-    embedding_dim = len(sample_embedding)
-    print(f"Dimension des embeddings: {embedding_dim}")
+    lengths = token_lengths(model.tokenizer, [text for _, text, _ in items], model.max_seq_length)
+    length_by_id = dict(zip((film_id for film_id, _, _ in items), lengths.tolist()))
+    results = {}
     
-    conn = get_connection()
-    cur = conn.cursor()
+    for label, batches in (
+        (f"lots fixes de {batch_size}", list(iter_batches(items, batch_size))),
+        (f"par longueur, budget {token_budget} tokens",
+         list(iter_batches(items, batch_size, token_budget=token_budget,
+                           tokenizer=model.tokenizer, max_length=model.max_seq_length))),
+    ):
+        started = time.perf_counter()
+        embeddings = {}
+        for batch in batches:
+            vectors = model.encode([text for _, text, _ in batch], batch_size=len(batch),
+                                   normalize_embeddings=normalize, show_progress_bar=False)
+            embeddings.update(zip((film_id for film_id, _, _ in batch), vectors))
+        elapsed = time.perf_counter() - started
+        padded = sum(len(batch) * max(length_by_id[film_id] for film_id, _, _ in batch) for batch in batches)
+        print(f"{label}: {len(batches)} lots, {elapsed:.2f}s, {len(items) / elapsed:.1f} films/s, "
+              f"tokens utiles {lengths.sum() / padded:.0%}")
+        results[label] = embeddings
+    
+    # Les vecteurs doivent être identiques quel que soit le regroupement
+    fixed, bucketed = results.values()
+    max_diff = max(float(np.abs(fixed[film_id] - bucketed[film_id]).max()) for film_id in fixed)
+    print(f"Écart maximal entre les deux modes: {max_diff:.2e}")
+
+
+def _encoder_process(model_name, normalize, torch_threads, tasks, results):
+    """
+    Processus d'encodage : charge sa copie du modèle puis encode les lots reçus.
+    
+    Messages envoyés sur `results` : ("batch", ids, empreintes, embeddings, secondes),
+    ("done",) à la fin, ("error", message) en cas d'échec.
+    """
+    try:
+        import torch
+        torch.set_num_threads(torch_threads)
+        model = SentenceTransformer(model_name)
+        while True:
+            batch = tasks.get()
+            if batch is None:
+                break
+            started = time.perf_counter()
+            # batch_size=len(batch) : sinon encode() redécoupe le lot par 32
+            embeddings = model.encode([text for _, text, _ in batch], batch_size=len(batch),
+                                      normalize_embeddings=normalize, show_progress_bar=False)
+            results.put((
+                "batch",
+                [film_id for film_id, _, _ in batch],
+                [film_hash for _, _, film_hash in batch],
+                np.asarray(embeddings, dtype=np.float32),
+                time.perf_counter() - started,
+            ))
+        results.put(("done",))
+    except Exception as e:
+        results.put(("error", f"{type(e).__name__}: {e}"))
+
+
+def generate_embeddings_parallel(model_name, batch_size=32, normalize=True, full=False,
+                                 workers=2, torch_threads=None, queue_size=None, token_budget=None):
+    """
+    Génération en trois étages reliés par des files bornées :
     
-    # Récupérer tous les films
-    cur.execute('SELECT id, title, synopsis, genres, "cast" FROM films ORDER BY id')
-    films = cur.fetchall()
+    - lecteur (thread) : parcourt les films avec un curseur côté serveur et
+      envoie les lots à encoder (regroupés par longueur si `token_budget`) ;
+    - encodeurs (`workers` processus) : chacun sa copie du modèle et
+      `torch_threads` threads torch ;
+    - écrivain (thread principal) : charge les vecteurs par COPY binaire et
+      valide chaque lot, pendant que les encodeurs continuent.
     
-    print(f"Nombre de films à traiter: {len(films)}")
+    Returns:
+        (total_generated, summary)
+    """
+    torch_threads = torch_threads or max(1, (os.cpu_count() or 1) // workers)
+    queue_size = queue_size or 2 * workers
+    print(f"Mode parallèle: {workers} encodeurs x {torch_threads} threads torch, "
+          f"files de {queue_size} lots")
+    
+    # Le lecteur n'a besoin que du tokenizer pour mesurer les longueurs
+    tokenizer = None
+    max_length = None
+    if token_budget:
+        from transformers import AutoTokenizer
+        tokenizer = AutoTokenizer.from_pretrained(model_name)
+        # Même longueur maximale que le mode mono-processus (model.max_seq_length)
+        max_length = model_max_seq_length(model_name, tokenizer)
+    
+    ctx = mp.get_context("spawn")
+    tasks = ctx.Queue(maxsize=queue_size)
+    results = ctx.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    summary = {"new": 0, "changed": 0, "model_changed": 0, "unchanged": 0}
+    reader_stats = {"films": 0, "seconds": 0.0, "error": None}
+    
+    def put(item):
+        while not stop.is_set():
+            try:
+                tasks.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+    
+    def reader():
+        read_conn = get_connection()
+        read_cur = read_conn.cursor(name="films_to_encode")
+        read_cur.itersize = 2000
+        try:
+            started = time.perf_counter()
+            read_cur.execute(FILMS_WITH_HASHES_SQL)
+            films = iter_films_to_encode(read_cur, model_name, summary, normalize=normalize, full=full)
+            for batch in iter_batches(films, batch_size, token_budget=token_budget, tokenizer=tokenizer,
+                                      max_length=max_length, window=batch_size * 64):
+                reader_stats["films"] += len(batch)
+                reader_stats["seconds"] += time.perf_counter() - started
+                if not put(batch):
+                    return
+                started = time.perf_counter()
+        except Exception as e:
+            reader_stats["error"] = e
+        finally:
+            read_cur.close()
+            read_conn.close()
+            for _ in range(workers):
+                put(None)
+    
+    processes = [
+        ctx.Process(target=_encoder_process, args=(model_name, normalize, torch_threads, tasks, results),
+                    name=f"encoder-{i}", daemon=True)
+        for i in range(workers)
+    ]
+    reader_thread = threading.Thread(target=reader, name="films-reader", daemon=True)
     
-    # Génération par lots
+    conn = get_connection()
+    register_vector(conn)
+    cur = conn.cursor()
+    # Table temporaire : propre à la connexion de l'écrivain
+    cur.execute(CREATE_STAGE_TABLE_SQL)
+    conn.commit()
+    start = time.perf_counter()
     total_generated = 0
+    encode_seconds = 0.0
+    write_seconds = 0.0
+    finished = 0
     
-    for i in range(0, len(films), batch_size):
-        batch = films[i:i + batch_size]
+    try:
+        for process in processes:
+            process.start()
+        reader_thread.start()
         
-        # Construire les textes
-        texts = [build_film_text(film) for film in batch]
+        while finished < workers:
+            try:
+                message = results.get(timeout=1.0)
+            except queue.Empty:
+                dead = [p.name for p in processes if p.exitcode not in (None, 0)]
+                if dead:
+                    raise RuntimeError(f"Encodeur(s) arrêté(s) anormalement: {', '.join(dead)}")
+                continue
+            
+            if message[0] == "done":
+                finished += 1
+                continue
+            if message[0] == "error":
+                raise RuntimeError(f"Erreur dans un encodeur: {message[1]}")
+            
+            _, film_ids, hashes, embeddings, seconds = message
+            encode_seconds += seconds
+            written = time.perf_counter()
+            write_embeddings(cur, model_name, film_ids, hashes, embeddings)
+            # Même transaction que le lot : un lot validé invalide toujours les caches
+            bump_embeddings_generation(cur)
+            conn.commit()
+            write_seconds += time.perf_counter() - written
+            total_generated += len(film_ids)
+            
+            elapsed = time.perf_counter() - start
+            print(f"{total_generated} embeddings écrits ({total_generated / elapsed:.1f} films/s)")
         
-        # Générer les embeddings
-        print(f"Génération des embeddings pour le lot {i//batch_size + 1}...")
-        embeddings = model.encode(texts, normalize_embeddings=normalize, show_progress_bar=False)
+        reader_thread.join()
+        if reader_stats["error"] is not None:
+            raise reader_stats["error"]
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        stop.set()
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+            process.join()
+        cur.close()
+        conn.close()
+    
+    def rate(films, seconds):
+        return f"{films / seconds:.1f} films/s" if seconds > 0 else "-"
+    
+    elapsed = time.perf_counter() - start
+    print(f"Lecteur: {reader_stats['films']} films, {rate(reader_stats['films'], reader_stats['seconds'])}")
+    print(f"Encodeurs: {total_generated} films, "
+          f"{rate(total_generated, encode_seconds / workers)} (cumul des {workers} processus)")
+    print(f"Écrivain: {total_generated} films, {rate(total_generated, write_seconds)}")
+    print(f"Pipeline: {total_generated} films en {elapsed:.2f}s ({rate(total_generated, elapsed)})")
+    return total_generated, summary
+
+
+def ensure_precision_index(cur, precision):
+    """Crée l'index HNSW de la précision demandée s'il n'existe pas encore."""
+    dim = embedding_dimension(cur)
+    if dim == 0:
+        return False
+    print(f"Index {index_name(precision)} (précision {precision}, dimension {dim})...")
+    cur.execute(create_index_sql(precision, dim))
+    return True
+
+
+def generate_embeddings(model_name=None, batch_size=32, normalize=True, full=False,
+                        workers=0, torch_threads=None, token_budget=None, precision=None):
+    """
+    Génère les embeddings des films nouveaux ou modifiés.
+    
+    Chaque embedding est enregistré avec l'empreinte du texte de build_film_text()
+    et le nom du modèle : une exécution ne ré-encode que les films dont le texte ou
+    le modèle a changé, et supprime les embeddings des films supprimés.
+    
+    Args:
+        model_name: nom du modèle SentenceTransformer (par défaut depuis .env)
+        batch_size: taille des lots pour la génération
+        normalize: normaliser les embeddings (recommandé pour distance cosinus)
+        full: ré-encoder tous les films
+        workers: nombre de processus d'encodage (0 = tout dans le processus courant)
+        torch_threads: threads torch par processus d'encodage (défaut: cœurs / workers)
+        token_budget: si défini, lots triés par longueur de taille variable, limités à
+            `token_budget` tokens avec padding (au lieu de lots fixes de batch_size)
+        precision: si défini ("full", "half" ou "binary"), crée l'index HNSW
+            correspondant après la génération (voir config/precision.py)
+    """
+    if model_name is None:
+        model_name = os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-mpnet-base-v2")
+    
+    start = time.perf_counter()
+    conn = get_connection()
+    register_vector(conn)
+    cur = conn.cursor()
+    cur.execute(ADD_TRACKING_COLUMNS_SQL)
+    cur.execute(ADD_FILTER_COLUMNS_SQL)
+    cur.execute(CREATE_STAGE_TABLE_SQL)
+    conn.commit()
+    
+    # Embeddings des films supprimés, et nouvelle génération dans la même
+    # transaction : les caches de l'API sont invalidés même si la suite échoue
+    cur.execute(DELETE_ORPHAN_EMBEDDINGS_SQL)
+    deleted = cur.rowcount
+    if deleted:
+        bump_embeddings_generation(cur)
+    conn.commit()
+    
+    if workers > 0:
+        total_generated, summary = generate_embeddings_parallel(
+            model_name, batch_size=batch_size, normalize=normalize, full=full,
+            workers=workers, torch_threads=torch_threads, token_budget=token_budget
+        )
+        print(f"Films: {summary['new']} nouveaux, {summary['changed']} modifiés, "
+              f"{summary['model_changed']} à ré-encoder (modèle), {summary['unchanged']} inchangés, "
+              f"{deleted} embeddings supprimés")
+    else:
+        to_encode, summary = diff_films(cur, model_name, normalize=normalize, full=full)
+        print(f"Films: {summary['new']} nouveaux, {summary['changed']} modifiés, "
+              f"{summary['model_changed']} à ré-encoder (modèle), {summary['unchanged']} inchangés, "
+              f"{deleted} embeddings supprimés")
         
-        # Préparer les données pour insertion par lots
-        insert_data = []
-        for film_data, embedding in zip(batch, embeddings):
-            film_id = film_data[0]
-            vec_str = "[" + ",".join(f"{x:.8f}" for x in embedding.tolist()) + "]"
-            insert_data.append((film_id, vec_str))
+        if to_encode:
+            print(f"Chargement du modèle: {model_name}")
+            model = SentenceTransformer(model_name)
+            
+            # Vérifier la dimension
+            sample_embedding = model.encode(["test"], normalize_embeddings=normalize)[0]
+            embedding_dim = len(sample_embedding)
+            print(f"Dimension des embeddings: {embedding_dim}")
+            print(f"Nombre de films à traiter: {len(to_encode)}")
         
-        # Insérer par lots (plus rapide)
-        execute_values(
-            cur,
-            """
-            INSERT INTO film_embeddings (film_id, embedding)
-            VALUES %s
-            ON CONFLICT (film_id) DO UPDATE SET embedding = EXCLUDED.embedding
-            """,
-            insert_data,
-            template=None,
-            page_size=batch_size
-        )
+        # Génération par lots (fixes, ou regroupés par longueur avec --token-budget)
+        total_generated = 0
+        batches = []
+        if to_encode:
+            batches = iter_batches(to_encode, batch_size, token_budget=token_budget,
+                                   tokenizer=model.tokenizer, max_length=model.max_seq_length)
         
-        total_generated += len(insert_data)
-        conn.commit()
-        print(f"Lot {i//batch_size + 1} terminé: {total_generated}/{len(films)} embeddings générés")
+        for number, batch in enumerate(batches, 1):
+            # Générer les embeddings
+            print(f"Génération des embeddings pour le lot {number} ({len(batch)} films)...")
+            embeddings = model.encode([text for _, text, _ in batch], batch_size=len(batch),
+                                      normalize_embeddings=normalize, show_progress_bar=False)
+            
+            film_ids = [film_id for film_id, _, _ in batch]
+            write_embeddings(cur, model_name, film_ids, [film_hash for _, _, film_hash in batch], embeddings)
+            bump_embeddings_generation(cur)
+            
+            total_generated += len(film_ids)
+            conn.commit()
+            print(f"Lot {number} terminé: {total_generated}/{len(to_encode)} embeddings générés")
+    
+    # Genres et années recopiés pour les index partiels (films nouveaux ou modifiés)
+    cur.execute(SYNC_FILTER_COLUMNS_SQL)
+    synced = cur.rowcount
+    conn.commit()
+    if synced:
+        print(f"Colonnes de filtrage mises à jour: {synced} embeddings")
     
     # Statistiques finales
     cur.execute("SELECT COUNT(*) FROM film_embeddings")
     total_in_db = cur.fetchone()[0]
     print(f"\nTotal d'embeddings dans la base: {total_in_db}")
+    print(f"Résumé: {total_generated} encodés, {deleted} supprimés, "
+          f"{summary['unchanged']} inchangés ({time.perf_counter() - start:.2f}s)")
+    
+    # La génération a été incrémentée avec chaque suppression ou lot validé
+    if total_generated or deleted:
+        print(f"Génération des embeddings: {get_embeddings_generation(cur)}")
+    
+    if precision and ensure_precision_index(cur, precision):
+        conn.commit()
     
     cur.close()
     conn.close()
@@ -136,12 +604,39 @@ if __name__ == "__main__":
     parser.add_argument("--model", type=str, default=None, help="Nom du modèle SentenceTransformer")
     parser.add_argument("--batch-size", type=int, default=32, help="Taille des lots")
     parser.add_argument("--no-normalize", action="store_true", help="Ne pas normaliser les embeddings")
+    parser.add_argument("--full", action="store_true", help="Ré-encoder tous les films, même inchangés")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="Processus d'encodage en parallèle (0 = processus unique)")
+    parser.add_argument("--torch-threads", type=int, default=None,
+                        help="Threads torch par processus d'encodage (défaut: cœurs / workers)")
+    parser.add_argument("--token-budget", type=int, default=None,
+                        help="Regrouper les films par longueur, lots limités à ce nombre de tokens (ex: 8192)")
+    parser.add_argument("--benchmark", action="store_true",
+                        help="Comparer lots fixes et regroupement par longueur, sans écrire en base")
+    parser.add_argument("--benchmark-size", type=int, default=1000, help="Films utilisés par --benchmark")
+    parser.add_argument("--precision", choices=PRECISIONS, default=None,
+                        help="Créer l'index HNSW de cette précision après la génération (full, half, binary)")
     
     args = parser.parse_args()
     
+    if args.benchmark:
+        benchmark_batching(
+            model_name=args.model,
+            batch_size=args.batch_size,
+            token_budget=args.token_budget or 8192,
+            sample_size=args.benchmark_size,
+            normalize=not args.no_normalize
+        )
+        sys.exit(0)
+    
     generate_embeddings(
         model_name=args.model,
         batch_size=args.batch_size,
-        normalize=not args.no_normalize
+        normalize=not args.no_normalize,
+        full=args.full,
+        workers=args.workers,
+        torch_threads=args.torch_threads,
+        token_budget=args.token_budget,
+        precision=args.precision
     )
 
@@ -3,16 +3,71 @@ Script d'ingestion des films depuis un fichier CSV.
 Rôle 1: Données et ingestion
 """
 import pandas as pd
+import numpy as np
+import io
+import json
+import queue
 import sys
 import os
+import threading
+import time
 from pathlib import Path
 
+try:
+    import resource
+except ImportError:
+    # Module indisponible sous Windows : le pic mémoire n'est pas affiché
+    resource = None
+
 # Ajouter le répertoire parent au path pour les imports
 sys.path.append(str(Path(__file__).parent.parent))
 
 from config.database import get_connection
 from psycopg2.extras import execute_values
 
+# Éléments d'une liste au format Python : 'élément' ou "élément"
+LIST_ITEM_PATTERN = r"'((?:[^'\\]|\\.)*)'" + r'|"((?:[^"\\]|\\.)*)"'
+
+# Table de transit du mode COPY (vidée à chaque validation de bloc)
+CREATE_FILMS_STAGE_SQL = """
+CREATE TEMP TABLE IF NOT EXISTS films_stage (
+    title TEXT NOT NULL,
+    year INTEGER,
+    genres TEXT[],
+    "cast" TEXT[],
+    synopsis TEXT,
+    meta JSONB
+) ON COMMIT DELETE ROWS
+"""
+
+# Fusion ensembliste : un film (titre, année) déjà présent n'est pas réinséré
+MERGE_FILMS_STAGE_SQL = """
+INSERT INTO films (title, year, genres, "cast", synopsis, meta)
+SELECT DISTINCT ON (s.title, s.year)
+    s.title, s.year, s.genres, s."cast", s.synopsis, s.meta
+FROM films_stage s
+WHERE NOT EXISTS (
+    SELECT 1 FROM films f
+    WHERE f.title = s.title AND f.year IS NOT DISTINCT FROM s.year
+)
+ORDER BY s.title, s.year
+ON CONFLICT DO NOTHING
+"""
+
+# Points de reprise de l'ingestion : position en octets du dernier bloc validé
+CREATE_CHECKPOINTS_SQL = """
+CREATE TABLE IF NOT EXISTS ingest_checkpoints (
+    source TEXT PRIMARY KEY,
+    file_size BIGINT NOT NULL,
+    byte_offset BIGINT NOT NULL,
+    rows_read BIGINT NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+)
+"""
+
+FILM_COLUMNS = ["title", "year", "genres", "cast", "synopsis", "meta"]
+
+
 def clean_genres(genres_str):
     """Nettoie et formate les genres."""
     if pd.isna(genres_str) or genres_str == "":
@@ -63,39 +118,14 @@ def clean_cast(cast_str):
     return [cast_str.strip().strip("'\"")] if cast_str else []
 
 
-def ingest_from_csv(csv_path, batch_size=1000):
+def prepare_rows(df):
     """
-    Ingère les films depuis un fichier CSV.
+    Prépare les lignes d'un bloc du CSV pour execute_values (mode par défaut).
     
-    Format CSV attendu (colonnes):
-    - title: titre du film (obligatoire)
-    - year: année de sortie (int ou float)
-    - genres: genres au format liste Python ["Genre1", "Genre2"] ou séparés par |, , ou ;
-    - cast: acteurs au format liste Python ["Actor1", "Actor2"] ou séparés par |, , ou ;
-    - synopsis: description du film
-    - meta: JSON optionnel avec métadonnées
-    
-    Args:
-        csv_path: chemin vers le fichier CSV
-        batch_size: taille des lots pour l'insertion
+    Returns:
+        liste de tuples (title, year, genres, cast, synopsis, meta)
     """
-    print(f"Lecture du fichier CSV: {csv_path}")
-    df = pd.read_csv(csv_path)
-    
-    print(f"Nombre de lignes dans le CSV: {len(df)}")
-    
-    # Vérification des colonnes requises
-    required_cols = ["title"]
-    missing_cols = [col for col in required_cols if col not in df.columns]
-    if missing_cols:
-        raise ValueError(f"Colonnes manquantes dans le CSV: {missing_cols}")
-    
-    conn = get_connection()
-    cur = conn.cursor()
-    
-    # Préparer les données
     rows = []
-    duplicates = 0
     
     for idx, row in df.iterrows():
         title = str(row["title"]).strip() if pd.notna(row["title"]) else None
@@ -122,7 +152,6 @@ def ingest_from_csv(csv_path, batch_size=1000):
         meta = None
         if "meta" in row and pd.notna(row["meta"]):
             try:
-                import json
                 if isinstance(row["meta"], str):
                     meta = json.loads(row["meta"])
                 else:
@@ -132,41 +161,382 @@ def ingest_from_csv(csv_path, batch_size=1000):
         
         rows.append((title, year, genres, cast, synopsis, meta))
     
-    print(f"Nombre de films à insérer: {len(rows)}")
+    return rows
+
+
+def parse_list_column(values):
+    """
+    Version vectorisée de clean_genres / clean_cast pour une colonne entière.
     
-    # Insertion par lots
-    inserted = 0
-    for i in range(0, len(rows), batch_size):
-        batch = rows[i:i + batch_size]
+    Accepte les mêmes formats (liste Python ou séparateurs |, , ;) et retourne
+    des littéraux tableau PostgreSQL (`{"a","b"}`) prêts pour COPY.
+    """
+    text = values.astype("string").str.strip()
+    present = text.notna() & (text != "")
+    
+    # Format liste Python: "['Action', 'Adventure']"
+    is_list = present & text.str.startswith("[").fillna(False) & text.str.endswith("]").fillna(False)
+    extracted = text[is_list].str.extractall(LIST_ITEM_PATTERN)
+    list_items = extracted[0].fillna(extracted[1]).droplevel(1).str.replace(r"\\(.)", r"\1", regex=True)
+    
+    empty_list = is_list & text.str.fullmatch(r"\[\s*\]").fillna(False)
+    
+    # Autres formats (et listes illisibles) : premier séparateur présent parmi |, , ;
+    others = text[present & ~empty_list & ~text.index.isin(list_items.index)]
+    separators = pd.Series(
+        np.select(
+            [others.str.contains(sep, regex=False) for sep in ("|", ",", ";")],
+            ["|", ",", ";"],
+            default=""
+        ),
+        index=others.index
+    )
+    parts = [others[separators == ""]]
+    for sep in ("|", ",", ";"):
+        parts.append(others[separators == sep].str.split(sep, regex=False).explode())
+    
+    items = pd.concat([list_items] + parts).str.strip().str.strip("'\"")
+    items = items[items.notna() & (items != "")]
+    
+    # Échappement des éléments pour un littéral tableau PostgreSQL
+    escaped = items.str.replace("\\", "\\\\", regex=False).str.replace('"', '\\"', regex=False)
+    quoted = ('"' + escaped + '"').sort_index(kind="stable")
+    if quoted.empty:
+        return pd.Series("{}", index=values.index, dtype=object)
+    
+    # Regroupement par ligne d'origine : bornes des groupes contigus après tri
+    positions = quoted.index.to_numpy()
+    items_array = quoted.to_numpy(dtype=object)
+    starts = np.flatnonzero(np.r_[True, positions[1:] != positions[:-1]])
+    bounds = np.r_[starts, len(items_array)]
+    arrays = pd.Series(
+        ["{" + ",".join(items_array[a:b]) + "}" for a, b in zip(bounds[:-1], bounds[1:])],
+        index=positions[starts],
+        dtype=object
+    )
+    return arrays.reindex(values.index, fill_value="{}")
+
+
+def _parse_meta(value):
+    """JSON valide ou None (une valeur invalide ferait échouer tout le COPY)."""
+    try:
+        return json.dumps(json.loads(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_films_chunk(df):
+    """
+    Prépare un bloc du CSV pour COPY, colonne par colonne (sans iterrows).
+    
+    Returns:
+        DataFrame aux colonnes FILM_COLUMNS ; les lignes sans titre sont retirées
+    """
+    title = df["title"].astype("string").str.strip()
+    df = df[title.notna() & (title != "")]
+    title = title[df.index]
+    
+    if "year" in df.columns:
+        year = np.trunc(pd.to_numeric(df["year"], errors="coerce")).astype("Int64")
+    else:
+        year = pd.Series(pd.NA, index=df.index, dtype="Int64")
+    
+    empty = pd.Series(pd.NA, index=df.index, dtype="string")
+    synopsis = df["synopsis"].astype("string").str.strip() if "synopsis" in df.columns else empty
+    if "meta" in df.columns:
+        meta = df["meta"].where(df["meta"].notna()).map(_parse_meta, na_action="ignore").astype("string")
+    else:
+        meta = empty
+    
+    return pd.DataFrame({
+        "title": title,
+        "year": year,
+        "genres": parse_list_column(df["genres"]) if "genres" in df.columns else "{}",
+        "cast": parse_list_column(df["cast"]) if "cast" in df.columns else "{}",
+        "synopsis": synopsis,
+        "meta": meta,
+    }, index=df.index)
+
+
+def copy_films_chunk(cur, films):
+    """Envoie un bloc préparé dans films_stage par COPY ... FROM STDIN (format CSV)."""
+    buffer = io.StringIO()
+    films.to_csv(buffer, columns=FILM_COLUMNS, header=False, index=False, na_rep="")
+    buffer.seek(0)
+    cur.copy_expert(
+        'COPY films_stage (title, year, genres, "cast", synopsis, meta) FROM STDIN WITH (FORMAT csv)',
+        buffer
+    )
+
+
+def iter_csv_chunks(csv_path, chunk_size=50000, start_offset=0):
+    """
+    Lit le CSV par blocs de `chunk_size` enregistrements, à partir d'une position en octets.
+    
+    Les enregistrements sont découpés en binaire en tenant compte des champs entre
+    guillemets (un synopsis peut contenir des retours à la ligne) ; seule la ligne
+    d'en-tête et le bloc courant sont en mémoire.
+    
+    Yields:
+        (DataFrame, end_offset) : le bloc (colonnes en texte) et la position en
+        octets juste après son dernier enregistrement
+    """
+    with open(csv_path, "rb") as f:
+        header = f.readline()
+        if start_offset > f.tell():
+            f.seek(start_offset)
+        
+        lines = []
+        records = 0
+        in_quotes = False
+        for line in f:
+            lines.append(line)
+            # Un nombre impair de guillemets ouvre ou ferme un champ multiligne
+            if line.count(b'"') % 2:
+                in_quotes = not in_quotes
+            if in_quotes:
+                continue
+            records += 1
+            if records >= chunk_size:
+                yield _read_csv_block(header, lines), f.tell()
+                lines = []
+                records = 0
+        if lines:
+            yield _read_csv_block(header, lines), f.tell()
+
+
+def _read_csv_block(header, lines):
+    """Parse un bloc d'enregistrements bruts (précédé de l'en-tête) ; toutes les colonnes en texte."""
+    return pd.read_csv(
+        io.BytesIO(header + b"".join(lines)),
+        dtype=str, keep_default_na=False, na_values=[""], encoding="utf-8-sig"
+    )
+
+
+def load_checkpoint(cur, source, file_size):
+    """
+    Position de reprise enregistrée pour ce fichier.
+    
+    Returns:
+        (byte_offset, rows_read), (0, 0) si aucun point de reprise valide
+    """
+    cur.execute(
+        "SELECT byte_offset, rows_read, file_size FROM ingest_checkpoints WHERE source = %s",
+        (source,)
+    )
+    row = cur.fetchone()
+    # Taille différente : le fichier a été remplacé, on repart du début
+    if row is None or row[2] != file_size:
+        return 0, 0
+    return row[0], row[1]
+
+
+def save_checkpoint(cur, source, file_size, byte_offset, rows_read):
+    """Enregistre la position de reprise (dans la transaction du bloc écrit)."""
+    cur.execute("""
+        INSERT INTO ingest_checkpoints (source, file_size, byte_offset, rows_read, updated_at)
+        VALUES (%s, %s, %s, %s, CURRENT_TIMESTAMP)
+        ON CONFLICT (source) DO UPDATE SET
+            file_size = EXCLUDED.file_size,
+            byte_offset = EXCLUDED.byte_offset,
+            rows_read = EXCLUDED.rows_read,
+            updated_at = EXCLUDED.updated_at
+    """, (source, file_size, byte_offset, rows_read))
+
+
+def _peak_rss_mb():
+    """Pic de mémoire résidente du processus en Mo (None si indisponible, ex. Windows)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss est en octets sous macOS, en Ko ailleurs
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_ingestion_pipeline(csv_path, chunk_size, parse_chunk, write_chunk, resume=True, queue_size=2):
+    """
+    Pipeline d'ingestion en flux : un thread lit et prépare les blocs pendant que
+    le thread principal écrit le bloc précédent.
+    
+    La file entre les deux est bornée à `queue_size` blocs : le lecteur attend
+    quand l'écriture prend du retard (mémoire constante quelle que soit la taille
+    du fichier). Chaque bloc est validé avec sa position de reprise dans la même
+    transaction ; après une erreur, la relance reprend au dernier bloc validé.
+    
+    Args:
+        csv_path: chemin vers le fichier CSV
+        chunk_size: nombre d'enregistrements par bloc
+        parse_chunk: fonction DataFrame -> bloc préparé (exécutée dans le thread lecteur)
+        write_chunk: fonction (cur, bloc préparé) -> nombre de films insérés
+        resume: reprendre au point de reprise enregistré pour ce fichier
+        queue_size: nombre maximal de blocs préparés en attente d'écriture
+    
+    Returns:
+        Nombre de films insérés
+    """
+    source = os.path.abspath(csv_path)
+    file_size = os.path.getsize(csv_path)
+    
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute(CREATE_CHECKPOINTS_SQL)
+    conn.commit()
+    
+    start_offset, rows_read = load_checkpoint(cur, source, file_size) if resume else (0, 0)
+    if start_offset:
+        print(f"Reprise à l'octet {start_offset} ({rows_read} lignes déjà traitées)")
+    
+    chunks = queue.Queue(maxsize=max(1, queue_size))
+    stop = threading.Event()
+    
+    def put(item):
+        while not stop.is_set():
+            try:
+                chunks.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+    
+    def reader():
         try:
-            execute_values(
-                cur,
-                """
-                INSERT INTO films (title, year, genres, "cast", synopsis, meta)
-                VALUES %s
-                ON CONFLICT DO NOTHING
-                """,
-                batch,
-                template=None,
-                page_size=batch_size
-            )
-            inserted += cur.rowcount
-            print(f"Lot {i//batch_size + 1}: {cur.rowcount} films insérés")
+            for df, offset in iter_csv_chunks(csv_path, chunk_size, start_offset):
+                if "title" not in df.columns:
+                    raise ValueError("Colonnes manquantes dans le CSV: ['title']")
+                if not put((parse_chunk(df), len(df), offset)):
+                    return
+            put(None)
         except Exception as e:
-            print(f"Erreur lors de l'insertion du lot {i//batch_size + 1}: {e}")
-            conn.rollback()
-            continue
+            put(e)
     
-    conn.commit()
-    print(f"Total de films insérés: {inserted}")
+    thread = threading.Thread(target=reader, name="csv-reader", daemon=True)
+    start = time.perf_counter()
+    rows_this_run = 0
+    inserted = 0
+    write_seconds = 0.0
+    wait_seconds = 0.0
     
-    # Statistiques
-    cur.execute("SELECT COUNT(*) FROM films")
-    total = cur.fetchone()[0]
-    print(f"Total de films dans la base: {total}")
+    try:
+        thread.start()
+        while True:
+            waited = time.perf_counter()
+            item = chunks.get()
+            wait_seconds += time.perf_counter() - waited
+            if item is None:
+                break
+            if isinstance(item, Exception):
+                raise item
+            
+            prepared, n_rows, offset = item
+            written = time.perf_counter()
+            inserted += write_chunk(cur, prepared)
+            rows_read += n_rows
+            rows_this_run += n_rows
+            save_checkpoint(cur, source, file_size, offset, rows_read)
+            conn.commit()
+            write_seconds += time.perf_counter() - written
+            
+            elapsed = time.perf_counter() - start
+            print(f"{rows_read} lignes lues ({offset / file_size:.0%}), {inserted} films insérés "
+                  f"({rows_this_run / elapsed:.0f} lignes/s)")
+        
+        # Fichier entièrement traité : la prochaine exécution repart du début
+        cur.execute("DELETE FROM ingest_checkpoints WHERE source = %s", (source,))
+        conn.commit()
+        
+        elapsed = time.perf_counter() - start
+        print(f"Total de films insérés: {inserted}")
+        print(f"Débit: {rows_this_run} lignes en {elapsed:.2f}s "
+              f"({rows_this_run / elapsed if elapsed else 0:.0f} lignes/s) ; "
+              f"écriture {write_seconds:.2f}s, attente du lecteur {wait_seconds:.2f}s")
+        peak_rss = _peak_rss_mb()
+        if peak_rss is not None:
+            print(f"Pic mémoire (RSS): {peak_rss:.0f} Mo")
+        
+        cur.execute("SELECT COUNT(*) FROM films")
+        print(f"Total de films dans la base: {cur.fetchone()[0]}")
+        return inserted
+    except Exception as e:
+        print(f"✗ Erreur lors de l'ingestion: {e}")
+        print("Relancez la même commande pour reprendre au dernier bloc validé.")
+        conn.rollback()
+        raise
+    finally:
+        stop.set()
+        thread.join()
+        cur.close()
+        conn.close()
+
+
+def insert_rows(cur, rows):
+    """Écrit un bloc préparé par prepare_rows() avec execute_values."""
+    if not rows:
+        return 0
+    execute_values(
+        cur,
+        """
+        INSERT INTO films (title, year, genres, "cast", synopsis, meta)
+        VALUES %s
+        ON CONFLICT DO NOTHING
+        """,
+        rows,
+        template=None,
+        page_size=len(rows)
+    )
+    return cur.rowcount
+
+
+def copy_and_merge_films(cur, films):
+    """Écrit un bloc préparé par parse_films_chunk() : COPY vers films_stage puis fusion."""
+    cur.execute(CREATE_FILMS_STAGE_SQL)
+    copy_films_chunk(cur, films)
+    cur.execute(MERGE_FILMS_STAGE_SQL)
+    return cur.rowcount
+
+
+def ingest_from_csv(csv_path, batch_size=1000, resume=True, queue_size=2):
+    """
+    Ingère les films depuis un fichier CSV.
+    
+    Format CSV attendu (colonnes):
+    - title: titre du film (obligatoire)
+    - year: année de sortie (int ou float)
+    - genres: genres au format liste Python ["Genre1", "Genre2"] ou séparés par |, , ou ;
+    - cast: acteurs au format liste Python ["Actor1", "Actor2"] ou séparés par |, , ou ;
+    - synopsis: description du film
+    - meta: JSON optionnel avec métadonnées
     
-    cur.close()
-    conn.close()
+    Le fichier est lu en flux par lots de `batch_size` lignes (voir run_ingestion_pipeline).
+    
+    Args:
+        csv_path: chemin vers le fichier CSV
+        batch_size: taille des lots pour la lecture et l'insertion
+        resume: reprendre au dernier lot validé après une interruption
+        queue_size: nombre de lots préparés d'avance
+    """
+    print(f"Lecture du fichier CSV par lots de {batch_size} lignes: {csv_path}")
+    run_ingestion_pipeline(csv_path, batch_size, prepare_rows, insert_rows,
+                           resume=resume, queue_size=queue_size)
+    print("Ingestion terminée avec succès!")
+
+
+def ingest_from_csv_copy(csv_path, chunk_size=50000, resume=True, queue_size=2):
+    """
+    Ingestion à haut débit : parsing vectorisé, COPY vers une table de transit,
+    puis fusion INSERT ... SELECT dans films, bloc par bloc.
+    
+    Les films déjà présents (même titre et même année) sont ignorés : rejouer un
+    bloc après une reprise ne crée pas de doublon.
+    
+    Args:
+        csv_path: chemin vers le fichier CSV
+        chunk_size: nombre de lignes lues et copiées à la fois
+        resume: reprendre au dernier bloc validé après une interruption
+        queue_size: nombre de blocs préparés d'avance
+    """
+    print(f"Lecture du fichier CSV par blocs de {chunk_size} lignes: {csv_path}")
+    run_ingestion_pipeline(csv_path, chunk_size, parse_films_chunk, copy_and_merge_films,
+                           resume=resume, queue_size=queue_size)
     print("Ingestion terminée avec succès!")
 
 
@@ -176,6 +546,14 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Ingérer des films depuis un CSV")
     parser.add_argument("csv_path", help="Chemin vers le fichier CSV")
     parser.add_argument("--batch-size", type=int, default=1000, help="Taille des lots")
+    parser.add_argument("--copy", action="store_true",
+                        help="Mode haut débit: COPY vers une table de transit puis fusion")
+    parser.add_argument("--chunk-size", type=int, default=50000,
+                        help="Lignes lues par bloc en mode --copy")
+    parser.add_argument("--queue-size", type=int, default=2,
+                        help="Blocs préparés d'avance pendant l'écriture")
+    parser.add_argument("--restart", action="store_true",
+                        help="Ignorer le point de reprise et relire le fichier depuis le début")
     
     args = parser.parse_args()
     
@@ -183,5 +561,10 @@ if __name__ == "__main__":
         print(f"Erreur: Le fichier {args.csv_path} n'existe pas.")
         sys.exit(1)
     
-    ingest_from_csv(args.csv_path, args.batch_size)
+    if args.copy:
+        ingest_from_csv_copy(args.csv_path, args.chunk_size,
+                             resume=not args.restart, queue_size=args.queue_size)
+    else:
+        ingest_from_csv(args.csv_path, args.batch_size,
+                        resume=not args.restart, queue_size=args.queue_size)
 
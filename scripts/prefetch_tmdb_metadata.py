@@ -0,0 +1,76 @@
+"""
+Préchargement des métadonnées TMDB (affiches, trailers, streaming) dans film_metadata.
+Rôle 3: API et intégration
+
+Interroge TMDB pour chaque film sans métadonnées, en parallèle et sous la
+limite de débit de TMDB (voir api/tmdb_prefetch.py). L'interface web sert
+ensuite les affiches depuis la base, sans attendre TMDB.
+
+Test contre un serveur local : TMDB_BASE_URL=http://localhost:8001/3
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+# Ajouter le répertoire parent au path pour les imports
+sys.path.append(str(Path(__file__).parent.parent))
+
+from dotenv import load_dotenv
+
+from api.tmdb_prefetch import (
+    TMDB_PREFETCH_BATCH_SIZE, TMDB_PREFETCH_CONCURRENCY, TMDB_PREFETCH_MAX_RETRIES,
+    TMDB_PREFETCH_RATE, TMDBPrefetcher
+)
+from api.tmdb_service import tmdb_client
+from config.async_database import close_async_pool
+
+load_dotenv()
+
+
+async def prefetch_tmdb_metadata(refresh_stale=False, limit=None, **options):
+    """
+    Précharge les métadonnées TMDB des films en attente.
+
+    Args:
+        refresh_stale: inclure les entrées expirées
+        limit: nombre maximal de films
+        options: paramètres de TMDBPrefetcher (rate, concurrency, batch_size, max_retries)
+    """
+    prefetcher = TMDBPrefetcher(**options)
+    try:
+        stats = await prefetcher.run(refresh_stale=refresh_stale, limit=limit)
+    finally:
+        await close_async_pool()
+        tmdb_client.close()
+    print(f"✓ {stats['pending']} films traités en {stats['elapsed_seconds']}s : "
+          f"{stats['found']} trouvés, {stats['not_found']} absents de TMDB, "
+          f"{stats['failed']} en échec ({stats['retries']} nouvelles tentatives), "
+          f"{stats['stored']} lignes enregistrées")
+    return stats
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Précharger les métadonnées TMDB des films")
+    parser.add_argument("--refresh-stale", action="store_true",
+                        help="Rafraîchir aussi les entrées expirées (TMDB_CACHE_TTL / TMDB_NEGATIVE_TTL)")
+    parser.add_argument("--limit", type=int, default=None, help="Nombre maximal de films")
+    parser.add_argument("--rate", type=float, default=TMDB_PREFETCH_RATE, help="Requêtes TMDB par seconde")
+    parser.add_argument("--concurrency", type=int, default=TMDB_PREFETCH_CONCURRENCY,
+                        help="Films interrogés en parallèle")
+    parser.add_argument("--batch-size", type=int, default=TMDB_PREFETCH_BATCH_SIZE,
+                        help="Lignes par écriture groupée")
+    parser.add_argument("--max-retries", type=int, default=TMDB_PREFETCH_MAX_RETRIES,
+                        help="Nouvelles tentatives après une erreur transitoire")
+
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(prefetch_tmdb_metadata(
+            refresh_stale=args.refresh_stale, limit=args.limit, rate=args.rate,
+            concurrency=args.concurrency, batch_size=args.batch_size, max_retries=args.max_retries
+        ))
+    except ValueError as e:
+        print(f"✗ {e}")
+        sys.exit(1)
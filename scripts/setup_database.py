@@ -14,6 +14,31 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+# Recherche par titre : égalité et préfixe sur lower(title) (text_pattern_ops sert
+# aussi LIKE 'abc%'), similarité trigramme pour les fautes de frappe
+TITLE_INDEXES_SQL = """
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX IF NOT EXISTS films_title_lower_idx ON films (lower(title) text_pattern_ops);
+CREATE INDEX IF NOT EXISTS films_title_trgm_idx ON films USING gin (lower(title) gin_trgm_ops);
+"""
+
+# Recherche plein texte (/search?mode=lexical|hybrid) : titre et cast en "simple"
+# (noms propres, pas de racinisation), synopsis en "french". array_to_string
+# n'étant pas IMMUTABLE, le document passe par une fonction déclarée comme telle
+# pour pouvoir être une colonne générée.
+FULL_TEXT_SEARCH_SQL = """
+CREATE OR REPLACE FUNCTION films_search_document(p_title TEXT, p_cast TEXT[], p_synopsis TEXT)
+RETURNS tsvector
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+    SELECT setweight(to_tsvector('simple', coalesce(p_title, '')), 'A')
+        || setweight(to_tsvector('simple', coalesce(array_to_string(p_cast, ' '), '')), 'B')
+        || setweight(to_tsvector('french', coalesce(p_synopsis, '')), 'C')
+$$;
+ALTER TABLE films ADD COLUMN IF NOT EXISTS search_document tsvector
+    GENERATED ALWAYS AS (films_search_document(title, "cast", synopsis)) STORED;
+CREATE INDEX IF NOT EXISTS films_search_document_idx ON films USING gin (search_document);
+"""
+
 
 def check_pgvector():
     """Vérifie si l'extension pgvector est disponible."""
@@ -90,6 +115,48 @@ def setup_schema():
         return False
 
 
+def setup_title_indexes():
+    """Crée les index de recherche par titre (lower(title) et pg_trgm)."""
+    conn = None
+    try:
+        conn = get_connection()
+        cur = conn.cursor()
+        cur.execute(TITLE_INDEXES_SQL)
+        cur.execute("ANALYZE films")
+        conn.commit()
+        print("✓ Index films_title_lower_idx et films_title_trgm_idx créés")
+        cur.close()
+        conn.close()
+        return True
+    except Exception as e:
+        print(f"✗ Erreur lors de la création des index de titre: {e}")
+        if conn:
+            conn.rollback()
+            conn.close()
+        return False
+
+
+def setup_full_text_search():
+    """Crée la colonne tsvector films.search_document et son index GIN."""
+    conn = None
+    try:
+        conn = get_connection()
+        cur = conn.cursor()
+        cur.execute(FULL_TEXT_SEARCH_SQL)
+        cur.execute("ANALYZE films")
+        conn.commit()
+        print("✓ Colonne films.search_document et index films_search_document_idx créés")
+        cur.close()
+        conn.close()
+        return True
+    except Exception as e:
+        print(f"✗ Erreur lors de la création de la recherche plein texte: {e}")
+        if conn:
+            conn.rollback()
+            conn.close()
+        return False
+
+
 def check_connection():
     """Vérifie la connexion à la base de données."""
     try:
@@ -182,6 +249,18 @@ def main():
         return False
     print()
     
+    # Index de titre (affiches, autocomplétion)
+    print("4. Création des index de recherche par titre...")
+    if not setup_title_indexes():
+        return False
+    print()
+    
+    # Recherche plein texte (mode lexical / hybride de /search)
+    print("5. Création de l'index plein texte...")
+    if not setup_full_text_search():
+        return False
+    print()
+    
     print("="*60)
     print("✓ Configuration terminée avec succès!")
     print("="*60)
@@ -298,30 +298,6 @@ async function displayResults(data) {
 }
 
 
-// Get poster image URL
-async function getFilmPoster(title, year = null) {
-    try {
-        // Try to get poster from our API endpoint
-        try {
-            const response = await fetch(`${API_BASE_URL}/api/poster/${encodeURIComponent(title)}${year ? `?year=${year}` : ''}`);
-            if (response.ok) {
-                const data = await response.json();
-                if (data.poster_url) {
-                    return data.poster_url;
-                }
-            }
-        } catch (e) {
-            // Continue to fallback
-        }
-        
-        // Fallback to placeholder
-        return getPlaceholderImage(title);
-    } catch (error) {
-        console.error('Error fetching poster:', error);
-        return getPlaceholderImage(title);
-    }
-}
-
 // Get placeholder image with title
 function getPlaceholderImage(title) {
     // Utiliser un service de placeholder qui affiche le titre
@@ -571,45 +547,38 @@ async function loadRecommendations(filmId) {
 }
 
 // Load poster images for films (supports different containers)
+// One batch request for all cards instead of one metadata request per card
 async function loadPosterImages(recommendations, containerSelector = '.films-grid') {
     const container = document.querySelector(containerSelector);
-    if (!container) return;
+    if (!container || recommendations.length === 0) return;
+
+    let metadataById = {};
+    try {
+        const response = await fetch(`${API_BASE_URL}/api/films/metadata:batch`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ film_ids: recommendations.map(rec => rec.film.id) })
+        });
+        if (response.ok) {
+            const data = await response.json();
+            metadataById = data.metadata || {};
+        }
+    } catch (error) {
+        console.error('Error loading posters:', error);
+    }
 
-    const promises = recommendations.map(async (rec) => {
+    recommendations.forEach(rec => {
         const film = rec.film;
         const cardElement = container.querySelector(`.film-card[data-film-id="${film.id}"]`);
-        if (!cardElement) return;
-
-        try {
-            // Try to get metadata first (includes poster)
-            try {
-                const metadataResponse = await fetch(`${API_BASE_URL}/api/film/${film.id}/metadata`);
-                if (metadataResponse.ok) {
-                    const metadata = await metadataResponse.json();
-                    if (metadata.poster_url) {
-                        const img = cardElement.querySelector('.film-poster');
-                        if (img) {
-                            img.src = metadata.poster_url;
-                            return;
-                        }
-                    }
-                }
-            } catch (e) {
-                // Continue to fallback
-            }
-            
-            // Fallback to poster endpoint
-            const posterUrl = await getFilmPoster(film.title, film.year);
-            const img = cardElement.querySelector('.film-poster');
-            if (img && img.src !== posterUrl) {
-                img.src = posterUrl;
-            }
-        } catch (error) {
-            console.error(`Error loading poster for ${film.title}:`, error);
+        const img = cardElement ? cardElement.querySelector('.film-poster') : null;
+        if (!img) return;
+
+        const metadata = metadataById[film.id] || {};
+        const posterUrl = metadata.poster_url || getPlaceholderImage(film.title);
+        if (img.src !== posterUrl) {
+            img.src = posterUrl;
         }
     });
-
-    await Promise.all(promises);
 }
 
 // Utility functions